@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_from_directory, g, Response
 from flask_cors import CORS
 import pymysql
 import pyodbc
@@ -9,9 +9,17 @@ import logging
 import math
 from functools import lru_cache
 import time
-from scripts.prometheus_client import PrometheusClient
+from scripts.prometheus_client import get_prometheus_client
 from scripts.sql_fingerprint import SQLFingerprint
 from scripts.sql_explain_analyzer import SQLExplainAnalyzer
+from scripts.plan_cache import get_plan_cache
+from scripts.explain_batch import start_batch_job, get_batch_job, list_batch_jobs, connect_target
+from scripts.index_consolidation import consolidate_instance_suggestions
+from scripts.index_usage_collector import collect_all_index_usage, get_drop_candidates
+from scripts.downsample import downsample_points, MIN_POINTS as DOWNSAMPLE_MIN_POINTS
+from scripts.self_metrics import (render_metrics, register_db_pool, attach_scheduler, instance_label,
+                                  CONTENT_TYPE, DB_POOL_ACQUIRE, DB_POOL_ERRORS, HTTP_REQUEST_DURATION,
+                                  INSTANCE_COLLECT_DURATION, INSTANCE_COLLECT_ERRORS, INGESTED_ROWS)
 from scripts.sqlserver_deadlock_collector import collect_all_sqlserver_deadlocks
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
@@ -143,13 +151,21 @@ def get_db_connection():
     try:
         # 如果连接池可用，从池中获取连接
         if HAS_POOL and _db_pool is not None:
-            return _db_pool.connection()
+            try:
+                with DB_POOL_ACQUIRE.time():
+                    return _db_pool.connection()
+            except Exception:
+                # 只统计从连接池取连接的失败，直连失败不计入连接池指标
+                DB_POOL_ERRORS.inc()
+                raise
         # 否则直接创建连接
         return pymysql.connect(**get_db_config())
     except Exception as e:
         logger.error(f"数据库连接失败: {e}")
         return None
 
+register_db_pool(lambda: _db_pool)
+
 # ==================== 配置管理API ====================
 
 @app.route('/api/config', methods=['GET'])
@@ -1031,6 +1047,26 @@ def test_instance_connection(id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== 自身运行指标 ====================
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        # 用端点名而不是URL作标签，避免 /api/.../<id> 这类路径让标签数量无限增长
+        HTTP_REQUEST_DURATION.observe(request.endpoint or 'unmatched', request.method,
+                                      response.status_code, value=time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def self_metrics():
+    """db-monitor 自身运行指标（Prometheus文本格式）"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
 # ==================== 监控数据API ====================
 
 @app.route('/')
@@ -1152,18 +1188,32 @@ def get_long_sql_detail(sql_id):
 
 @app.route('/api/deadlocks', methods=['GET'])
 def get_deadlocks():
-    """获取死锁列表"""
+    """
+    获取死锁列表
+
+    参数:
+        group_by: signature - 按死锁签名分组，从 deadlock_signature_stats 聚合表回答
+        signature: 只看指定签名的死锁明细
+    """
     try:
         hours = request.args.get('hours', 24, type=int)
         instance_id = request.args.get('instance_id', type=int)
+        group_by = request.args.get('group_by', '')
+        signature = request.args.get('signature', '').strip()
         page = max(1, request.args.get('page', 1, type=int))
         page_size = min(100, max(1, request.args.get('page_size', 20, type=int)))
         offset = (page - 1) * page_size
 
+        if group_by and group_by != 'signature':
+            return jsonify({'success': False, 'error': 'group_by 仅支持 signature'}), 400
+
         conn = get_db_connection()
         if not conn:
             return jsonify({'success': False, 'error': '数据库连接失败'}), 500
 
+        if group_by == 'signature':
+            return _get_deadlocks_by_signature(conn, hours, instance_id, page, page_size)
+
         with conn.cursor() as cursor:
             where = ["d.detect_time >= DATE_SUB(NOW(), INTERVAL %s HOUR)"]
             params = [hours]
@@ -1172,6 +1222,10 @@ def get_deadlocks():
                 where.append("d.db_instance_id = %s")
                 params.append(instance_id)
 
+            if signature:
+                where.append("d.deadlock_signature = %s")
+                params.append(signature)
+
             where_clause = " AND ".join(where)
 
             cursor.execute(f"SELECT COUNT(*) as cnt FROM deadlock_log d WHERE {where_clause}", params)
@@ -1205,10 +1259,133 @@ def get_deadlocks():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _get_deadlocks_by_signature(conn, hours, instance_id, page, page_size):
+    """按死锁签名分组（聚合表按小时累加，时间窗口精确到小时）"""
+    try:
+        with conn.cursor() as cursor:
+            where = ["s.stat_hour >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL %s HOUR), '%%Y-%%m-%%d %%H:00:00')"]
+            params = [hours]
+
+            if instance_id:
+                where.append("s.db_instance_id = %s")
+                params.append(instance_id)
+
+            where_clause = " AND ".join(where)
+
+            cursor.execute(f"""
+                SELECT COUNT(*) as cnt FROM (
+                    SELECT 1 FROM deadlock_signature_stats s
+                    WHERE {where_clause}
+                    GROUP BY s.db_instance_id, s.deadlock_signature
+                ) g
+            """, params)
+            total = cursor.fetchone()['cnt']
+            total_pages = math.ceil(total / page_size) if page_size > 0 else 1
+
+            cursor.execute(f"""
+                SELECT g.*, i.db_project, i.db_ip, i.db_port, i.instance_name, i.db_type
+                FROM (
+                    SELECT s.db_instance_id, s.deadlock_signature,
+                           SUM(s.deadlock_count) AS deadlock_count,
+                           MIN(s.first_seen) AS first_seen, MAX(s.last_seen) AS last_seen,
+                           MAX(s.sql_fingerprints) AS sql_fingerprints,
+                           MAX(s.lock_resources) AS lock_resources,
+                           MAX(s.sample_sql) AS sample_sql
+                    FROM deadlock_signature_stats s
+                    WHERE {where_clause}
+                    GROUP BY s.db_instance_id, s.deadlock_signature
+                    ORDER BY deadlock_count DESC, last_seen DESC
+                    LIMIT %s OFFSET %s
+                ) g
+                LEFT JOIN db_instance_info i ON g.db_instance_id = i.id
+                ORDER BY g.deadlock_count DESC, g.last_seen DESC
+            """, params + [page_size, (page - 1) * page_size])
+            results = cursor.fetchall()
+
+            for row in results:
+                row['lock_resources'] = json.loads(row['lock_resources']) if row.get('lock_resources') else []
+                row['sql_fingerprints'] = row['sql_fingerprints'].split(',') if row.get('sql_fingerprints') else []
+                for k, v in row.items():
+                    if isinstance(v, datetime):
+                        row[k] = v.strftime('%Y-%m-%d %H:%M:%S')
+
+        return jsonify({
+            'success': True, 'data': results, 'group_by': 'signature',
+            'pagination': {
+                'current_page': page, 'page_size': page_size,
+                'total_count': total, 'total_pages': total_pages,
+                'has_prev': page > 1, 'has_next': page < total_pages
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"按签名分组获取死锁失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/plan-regressions', methods=['GET'])
+def get_plan_regressions():
+    """
+    获取执行计划回归列表（采集入库时增量检测）
+
+    参数:
+        hours: 检测时间窗口，默认168小时
+        instance_id: 实例ID
+        status: open/resolved/ignored
+        limit: 最多返回条数，默认100
+    """
+    try:
+        hours = request.args.get('hours', 168, type=int)
+        instance_id = request.args.get('instance_id', type=int)
+        status = request.args.get('status', '').strip()
+        limit = min(500, max(1, request.args.get('limit', 100, type=int)))
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            where = ["r.detected_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)"]
+            params = [hours]
+
+            if instance_id:
+                where.append("r.db_instance_id = %s")
+                params.append(instance_id)
+
+            if status:
+                where.append("r.status = %s")
+                params.append(status)
+
+            cursor.execute(f"""
+                SELECT r.*, i.db_project, i.db_ip, i.db_port, i.instance_name, i.db_type
+                FROM sql_plan_regression r
+                LEFT JOIN db_instance_info i ON r.db_instance_id = i.id
+                WHERE {' AND '.join(where)}
+                ORDER BY r.detected_at DESC
+                LIMIT %s
+            """, params + [limit])
+            results = cursor.fetchall()
+
+            for row in results:
+                for k, v in row.items():
+                    if isinstance(v, datetime):
+                        row[k] = v.strftime('%Y-%m-%d %H:%M:%S')
+
+        conn.close()
+        return jsonify({'success': True, 'data': results, 'total': len(results)})
+
+    except Exception as e:
+        logger.error(f"获取执行计划回归失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     try:
         hours = request.args.get('hours', 24, type=int)
+        max_points = request.args.get('max_points', type=int)
+        if max_points is not None:
+            max_points = max(max_points, DOWNSAMPLE_MIN_POINTS)
 
         conn = get_db_connection()
         if not conn:
@@ -1262,6 +1439,9 @@ def get_statistics():
 
         conn.close()
 
+        # 按小时聚合的趋势是等间隔的，用下标作横坐标降采样
+        trend = downsample_points(list(trend or []), max_points, x_key=None, y_key='sql_count')
+
         # 合并死锁统计到summary
         summary_with_deadlock = summary or {}
         summary_with_deadlock['deadlock_count'] = deadlock_stat.get('deadlock_count', 0) if deadlock_stat else 0
@@ -2151,7 +2331,7 @@ def prometheus_metrics(instance_ip):
         # 创建Prometheus客户端
         prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
         timeout = prom_config.get('timeout', 5)
-        prom = PrometheusClient(prom_url, timeout)
+        prom = get_prometheus_client(prom_url, timeout)
 
         # 检查健康状态
         if not prom.check_health():
@@ -2169,6 +2349,74 @@ def prometheus_metrics(instance_ip):
         logger.error(f"获取Prometheus指标失败: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/prometheus/fleet-metrics')
+def prometheus_fleet_metrics():
+    """
+    获取全部监控实例的Prometheus指标（每个指标对整个实例集合只查询一次）
+
+    参数:
+        db_type: 只看 MySQL 或 SQLServer，默认全部
+    """
+    conn = None
+    try:
+        config = load_config()
+        prom_config = config.get('prometheus', {})
+
+        if not prom_config.get('enabled', False):
+            return jsonify({'success': False, 'error': 'Prometheus未启用'}), 400
+
+        db_type = request.args.get('db_type', '').strip()
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            sql = "SELECT id, db_project, db_ip, db_port, db_type FROM db_instance_info WHERE status = 1"
+            params = []
+            if db_type:
+                sql += " AND db_type = %s"
+                params.append(db_type)
+            cursor.execute(sql + " ORDER BY id", params)
+            instances = cursor.fetchall()
+
+        prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
+        timeout = prom_config.get('timeout', 5)
+        prom = get_prometheus_client(prom_url, timeout)
+
+        if not prom.check_health():
+            return jsonify({'success': False, 'error': 'Prometheus服务不可用'}), 503
+
+        mysql_ips = [i['db_ip'] for i in instances if i['db_type'] == 'MySQL']
+        sqlserver_ips = [i['db_ip'] for i in instances if i['db_type'] == 'SQLServer']
+        fleet = {
+            'MySQL': prom.get_fleet_metrics(mysql_ips),
+            'SQLServer': prom.get_sqlserver_fleet_metrics(sqlserver_ips)
+        }
+
+        data = []
+        for instance in instances:
+            metrics = fleet.get(instance['db_type'], {}).get(instance['db_ip'])
+            if metrics is None:
+                continue
+            data.append({
+                'instance_id': instance['id'],
+                'db_project': instance['db_project'],
+                'db_ip': instance['db_ip'],
+                'db_port': instance['db_port'],
+                'db_type': instance['db_type'],
+                'metrics': metrics
+            })
+
+        return jsonify({'success': True, 'data': data, 'total': len(data)})
+
+    except Exception as e:
+        logger.error(f"获取实例集合Prometheus指标失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/api/prometheus/trends/<instance_ip>')
 def prometheus_trends(instance_ip):
     """获取指定实例的趋势数据"""
@@ -2181,14 +2429,17 @@ def prometheus_trends(instance_ip):
 
         # 获取查询参数
         hours = request.args.get('hours', type=int, default=24)
+        max_points = request.args.get('max_points', type=int)
+        if max_points is not None:
+            max_points = max(max_points, DOWNSAMPLE_MIN_POINTS)
 
         # 创建Prometheus客户端
         prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
         timeout = prom_config.get('timeout', 5)
-        prom = PrometheusClient(prom_url, timeout)
+        prom = get_prometheus_client(prom_url, timeout)
 
         # 获取趋势数据
-        trends = prom.get_instance_trends(instance_ip, hours)
+        trends = prom.get_instance_trends(instance_ip, hours, max_points=max_points)
 
         return jsonify({
             'success': True,
@@ -2220,7 +2471,7 @@ def prometheus_query():
         # 创建Prometheus客户端
         prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
         timeout = prom_config.get('timeout', 5)
-        prom = PrometheusClient(prom_url, timeout)
+        prom = get_prometheus_client(prom_url, timeout)
 
         # 执行查询
         if query_type == 'range':
@@ -2231,7 +2482,8 @@ def prometheus_query():
             if not start or not end:
                 return jsonify({'success': False, 'error': '范围查询需要start和end参数'}), 400
 
-            result = prom.query_range(promql, start, end, step)
+            # 长范围自动分段并发查询，避免超出Prometheus点数上限或超时
+            result = prom.query_range_split(promql, start, end, step)
         else:
             result = prom.query(promql)
 
@@ -2264,7 +2516,7 @@ def prometheus_health():
 
         prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
         timeout = prom_config.get('timeout', 5)
-        prom = PrometheusClient(prom_url, timeout)
+        prom = get_prometheus_client(prom_url, timeout)
 
         healthy = prom.check_health()
 
@@ -2279,6 +2531,101 @@ def prometheus_health():
         logger.error(f"检查Prometheus健康状态失败: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/prometheus/targets')
+def prometheus_targets():
+    """
+    查询Prometheus抓取目标索引
+
+    参数:
+        ip / job / instance: 按标签精确查找，可组合
+        health: up / down / unknown
+    """
+    try:
+        config = load_config()
+        prom_config = config.get('prometheus', {})
+
+        if not prom_config.get('enabled', False):
+            return jsonify({'success': False, 'error': 'Prometheus未启用'}), 400
+
+        prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
+        timeout = prom_config.get('timeout', 5)
+        prom = get_prometheus_client(prom_url, timeout)
+        prom.ensure_targets()
+
+        targets = prom.targets.lookup(
+            ip=request.args.get('ip') or None,
+            job=request.args.get('job') or None,
+            instance=request.args.get('instance') or None,
+            health=request.args.get('health') or None
+        )
+
+        return jsonify({
+            'success': True,
+            'summary': prom.targets.summary(),
+            'data': targets,
+            'total': len(targets)
+        })
+
+    except Exception as e:
+        logger.error(f"查询Prometheus目标失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/prometheus/instance-targets')
+def prometheus_instance_targets():
+    """监控实例与exporter抓取目标的对应关系及抓取健康状态"""
+    conn = None
+    try:
+        config = load_config()
+        prom_config = config.get('prometheus', {})
+
+        if not prom_config.get('enabled', False):
+            return jsonify({'success': False, 'error': 'Prometheus未启用'}), 400
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, db_project, db_ip, db_port, db_type, instance_name
+                FROM db_instance_info WHERE status = 1 ORDER BY id
+            """)
+            instances = cursor.fetchall()
+
+        prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
+        timeout = prom_config.get('timeout', 5)
+        prom = get_prometheus_client(prom_url, timeout)
+        prom.ensure_targets()
+
+        data = []
+        for instance in instances:
+            targets = prom.targets.targets_for(instance['db_ip'], instance['db_type'])
+            if not targets:
+                scrape_health = 'unmapped'
+            elif all(t['health'] == 'up' for t in targets):
+                scrape_health = 'up'
+            else:
+                scrape_health = 'down'
+            data.append({
+                'instance_id': instance['id'],
+                'db_project': instance['db_project'],
+                'instance_name': instance['instance_name'],
+                'db_ip': instance['db_ip'],
+                'db_port': instance['db_port'],
+                'db_type': instance['db_type'],
+                'scrape_health': scrape_health,
+                'targets': targets
+            })
+
+        return jsonify({'success': True, 'summary': prom.targets.summary(), 'data': data, 'total': len(data)})
+
+    except Exception as e:
+        logger.error(f"获取实例抓取目标失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/api/prometheus/sqlserver/metrics/<instance_ip>')
 def prometheus_sqlserver_metrics(instance_ip):
     """获取SQL Server实例的Prometheus指标"""
@@ -2293,7 +2640,7 @@ def prometheus_sqlserver_metrics(instance_ip):
         # 创建Prometheus客户端
         prom_url = prom_config.get('url', 'http://192.168.98.4:9090')
         timeout = prom_config.get('timeout', 5)
-        prom = PrometheusClient(prom_url, timeout)
+        prom = get_prometheus_client(prom_url, timeout)
 
         # 检查健康状态
         if not prom.check_health():
@@ -2342,6 +2689,7 @@ def get_sql_fingerprint_stats():
                     fps.avg_rows_examined,
                     fps.full_scan_count,
                     fps.has_index_suggestion,
+                    fps.cluster_id,
                     fps.last_seen
                 FROM sql_fingerprint_stats fps
                 WHERE fps.last_seen >= DATE_SUB(NOW(), INTERVAL %s HOUR)
@@ -2541,6 +2889,306 @@ def update_sql_fingerprint():
             conn.close()
 
 
+@app.route('/api/sql-fingerprint/clusters')
+def get_sql_fingerprint_clusters():
+    """按近似模板簇聚合SQL指纹统计（未聚类的指纹单独成簇）"""
+    conn = None
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        limit = request.args.get('limit', 20, type=int)
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    c.cluster_id,
+                    rep.sql_template,
+                    rep.sql_type,
+                    rep.tables_involved,
+                    c.fingerprint_count,
+                    c.occurrence_count,
+                    c.total_elapsed_seconds,
+                    c.total_elapsed_seconds / NULLIF(c.occurrence_count, 0) AS avg_elapsed_seconds,
+                    c.max_elapsed_seconds,
+                    c.total_rows_examined / NULLIF(c.occurrence_count, 0) AS avg_rows_examined,
+                    c.full_scan_count,
+                    c.last_seen
+                FROM (
+                    SELECT
+                        COALESCE(cluster_id, fingerprint) AS cluster_id,
+                        COUNT(*) AS fingerprint_count,
+                        SUM(occurrence_count) AS occurrence_count,
+                        SUM(total_elapsed_seconds) AS total_elapsed_seconds,
+                        MAX(max_elapsed_seconds) AS max_elapsed_seconds,
+                        SUM(total_rows_examined) AS total_rows_examined,
+                        SUM(full_scan_count) AS full_scan_count,
+                        MAX(last_seen) AS last_seen
+                    FROM sql_fingerprint_stats
+                    WHERE last_seen >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+                    GROUP BY COALESCE(cluster_id, fingerprint)
+                ) c
+                LEFT JOIN sql_fingerprint_stats rep ON rep.fingerprint = c.cluster_id
+                ORDER BY c.occurrence_count DESC, c.total_elapsed_seconds DESC
+                LIMIT %s
+            """, (hours, limit))
+            results = cursor.fetchall()
+
+            for row in results:
+                for k, v in row.items():
+                    if isinstance(v, datetime):
+                        row[k] = v.strftime('%Y-%m-%d %H:%M:%S')
+
+            return jsonify({
+                'success': True,
+                'data': results,
+                'total': len(results)
+            })
+
+    except Exception as e:
+        logger.error(f"获取SQL模板簇统计失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+
+@app.route('/api/sql-fingerprint/clusters/rebuild', methods=['POST'])
+def rebuild_sql_fingerprint_clusters():
+    """重新对全部SQL模板做近似聚类"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        from scripts.sql_template_cluster import cluster_fingerprint_stats
+        stats = cluster_fingerprint_stats(conn)
+
+        return jsonify({'success': True, 'data': stats})
+
+    except Exception as e:
+        logger.error(f"SQL模板聚类失败: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+
+# ==================== SQL Digest延迟直方图API ====================
+
+@app.route('/api/sql-digest/histogram')
+def get_sql_digest_histogram():
+    """
+    获取digest在任意时间窗口内的真实延迟百分位曲线
+
+    数据来自MySQL 8 events_statements_histogram_by_digest的周期增量，
+    窗口内的桶计数直接相加即可得到该窗口的完整分布
+    """
+    conn = None
+    try:
+        instance_id = request.args.get('instance_id', type=int)
+        digest = request.args.get('digest')
+        start = request.args.get('start')
+        end = request.args.get('end')
+        hours = request.args.get('hours', 24, type=int)
+
+        if not instance_id or not digest:
+            return jsonify({'success': False, 'error': '缺少instance_id或digest参数'}), 400
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            where = ["db_instance_id = %s", "digest = %s"]
+            params = [instance_id, digest]
+            if start:
+                where.append("sample_time >= %s")
+                params.append(start)
+            else:
+                where.append("sample_time >= DATE_SUB(NOW(), INTERVAL %s HOUR)")
+                params.append(hours)
+            if end:
+                where.append("sample_time <= %s")
+                params.append(end)
+
+            cursor.execute(f"""
+                SELECT bucket_counts FROM sql_digest_histogram
+                WHERE {' AND '.join(where)}
+            """, params)
+            rows = cursor.fetchall()
+
+            cursor.execute("""
+                SELECT bucket_number, bucket_timer_low, bucket_timer_high
+                FROM sql_digest_histogram_bucket
+            """)
+            bucket_bounds = {
+                row['bucket_number']: (row['bucket_timer_low'], row['bucket_timer_high'])
+                for row in cursor.fetchall()
+            }
+
+        # 合并窗口内所有周期的桶增量
+        merged = {}
+        for row in rows:
+            counts = row['bucket_counts']
+            if isinstance(counts, str):
+                counts = json.loads(counts)
+            for bucket, count in (counts or {}).items():
+                merged[int(bucket)] = merged.get(int(bucket), 0) + int(count)
+
+        from scripts.mysql_perfschema_collector import compute_histogram_percentiles
+        result = compute_histogram_percentiles(merged, bucket_bounds)
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'instance_id': instance_id,
+                'digest': digest,
+                'samples': len(rows),
+                **result
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"获取digest延迟直方图失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+
+
+
+# ==================== 实时Top SQL API ====================
+
+@app.route('/api/top-sql/live')
+def get_live_top_sql():
+    """实时Top SQL（读取采集器维护的内存Heavy Hitters，不查询日志表）"""
+    try:
+        window = request.args.get('window', '5m')
+        k = request.args.get('k', 20, type=int)
+        weight = request.args.get('weight', 'count')
+
+        from scripts.heavy_hitters import get_tracker, DECAY_WINDOWS, WEIGHT_TYPES
+
+        if window not in DECAY_WINDOWS:
+            return jsonify({'success': False, 'error': f'window必须是: {", ".join(DECAY_WINDOWS)}'}), 400
+        if weight not in WEIGHT_TYPES:
+            return jsonify({'success': False, 'error': f'weight必须是: {", ".join(WEIGHT_TYPES)}'}), 400
+        k = max(1, min(k, 200))
+
+        tracker = get_tracker()
+        return jsonify({
+            'success': True,
+            'window': window,
+            'weight': weight,
+            'data': tracker.top(window, k, weight),
+            'tracked': tracker.size()
+        })
+
+    except Exception as e:
+        logger.error(f"获取实时Top SQL失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==================== 表级热度API ====================
+
+@app.route('/api/tables/hotness')
+def get_table_hotness():
+    """
+    表级热度: 按慢SQL耗时/次数/扫描行数排序的热点表
+
+    指定table_name时返回该表的逐小时趋势
+    """
+    conn = None
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        limit = request.args.get('limit', 20, type=int)
+        instance_id = request.args.get('instance_id', type=int)
+        schema_name = request.args.get('schema_name')
+        table_name = request.args.get('table_name')
+        order_by = request.args.get('order_by', 'time')
+
+        order_columns = {
+            'time': 'total_elapsed_seconds',
+            'count': 'slow_count',
+            'rows': 'total_rows_examined'
+        }
+        if order_by not in order_columns:
+            return jsonify({'success': False, 'error': 'order_by必须是: time, count, rows'}), 400
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        conditions = ["h.stat_hour >= DATE_SUB(DATE_FORMAT(NOW(), '%%Y-%%m-%%d %%H:00:00'), INTERVAL %s HOUR)"]
+        params = [hours]
+        if instance_id:
+            conditions.append("h.db_instance_id = %s")
+            params.append(instance_id)
+        if schema_name is not None:
+            conditions.append("h.schema_name = %s")
+            params.append(schema_name)
+        if table_name:
+            conditions.append("h.table_name = %s")
+            params.append(table_name)
+        where_clause = ' AND '.join(conditions)
+
+        with conn.cursor() as cursor:
+            if table_name:
+                cursor.execute(f"""
+                    SELECT
+                        h.stat_hour,
+                        SUM(h.slow_count) AS slow_count,
+                        SUM(h.total_elapsed_seconds) AS total_elapsed_seconds,
+                        SUM(h.total_rows_examined) AS total_rows_examined
+                    FROM table_hotness_hourly h
+                    WHERE {where_clause}
+                    GROUP BY h.stat_hour
+                    ORDER BY h.stat_hour
+                """, params)
+            else:
+                cursor.execute(f"""
+                    SELECT
+                        h.db_instance_id,
+                        i.db_project,
+                        h.schema_name,
+                        h.table_name,
+                        SUM(h.slow_count) AS slow_count,
+                        SUM(h.total_elapsed_seconds) AS total_elapsed_seconds,
+                        SUM(h.total_rows_examined) AS total_rows_examined,
+                        MAX(h.stat_hour) AS last_hour
+                    FROM table_hotness_hourly h
+                    LEFT JOIN db_instance_info i ON h.db_instance_id = i.id
+                    WHERE {where_clause}
+                    GROUP BY h.db_instance_id, i.db_project, h.schema_name, h.table_name
+                    ORDER BY {order_columns[order_by]} DESC
+                    LIMIT %s
+                """, params + [limit])
+            results = cursor.fetchall()
+
+            for row in results:
+                for k, v in row.items():
+                    if isinstance(v, datetime):
+                        row[k] = v.strftime('%Y-%m-%d %H:%M:%S')
+
+            return jsonify({
+                'success': True,
+                'data': results,
+                'total': len(results)
+            })
+
+    except Exception as e:
+        logger.error(f"获取表级热度失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
 
 
 # ==================== SQL执行计划分析API ====================
@@ -2586,10 +3234,21 @@ def analyze_sql_explain():
         )
 
         try:
-            # 执行分析
-            analyzer = SQLExplainAnalyzer(target_conn)
+            # 执行分析（执行计划未变化时直接使用缓存，不在目标库上重复EXPLAIN）
+            analyzer = SQLExplainAnalyzer(target_conn, instance_id=db_instance_id, schema=db_name,
+                                          plan_cache=get_plan_cache(get_db_connection))
             result = analyzer.analyze_sql(sql_text, instance['db_type'])
 
+            if result['success'] and result.get('plan_cached'):
+                # 缓存命中: 计划和索引建议此前已保存过
+                return jsonify({
+                    'success': True,
+                    'plan_id': None,
+                    'cached': True,
+                    'analysis': result,
+                    'report': analyzer.generate_optimization_report(result)
+                })
+
             if result['success']:
                 # 保存分析结果
                 fingerprint = SQLFingerprint.generate(sql_text)
@@ -2597,18 +3256,20 @@ def analyze_sql_explain():
                 with conn.cursor() as cursor:
                     cursor.execute("""
                         INSERT INTO sql_execution_plan (
-                            sql_fingerprint, db_instance_id,
+                            sql_fingerprint, db_instance_id, schema_name,
                             plan_json, has_full_scan, has_temp_table, has_filesort,
-                            estimated_rows, analysis_result
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                            estimated_rows, analysis_result, table_versions, plan_hash
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                     """, (
-                        fingerprint, db_instance_id,
+                        fingerprint, db_instance_id, db_name,
                         json.dumps(result.get('plan_json', {})),
                         1 if result['has_full_scan'] else 0,
                         1 if result['has_temp_table'] else 0,
                         1 if result['has_filesort'] else 0,
                         sum(i.get('rows', 0) for i in result.get('issues', [])),
-                        json.dumps(result.get('issues', []))
+                        json.dumps(result.get('issues', [])),
+                        json.dumps(result['table_versions']) if result.get('table_versions') is not None else None,
+                        result.get('plan_hash')
                     ))
 
                     plan_id = cursor.lastrowid
@@ -2617,12 +3278,12 @@ def analyze_sql_explain():
                     for suggestion in result.get('index_suggestions', []):
                         cursor.execute("""
                             INSERT INTO index_suggestion (
-                                sql_fingerprint, db_instance_id,
+                                sql_fingerprint, db_instance_id, schema_name,
                                 table_name, suggested_columns,
                                 create_statement, benefit_score
-                            ) VALUES (%s, %s, %s, %s, %s, %s)
+                            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
                         """, (
-                            fingerprint, db_instance_id,
+                            fingerprint, db_instance_id, db_name,
                             suggestion.get('table', ''),
                             ','.join(suggestion.get('columns', [])),
                             suggestion.get('create_statement', ''),
@@ -2637,6 +3298,7 @@ def analyze_sql_explain():
                 return jsonify({
                     'success': True,
                     'plan_id': plan_id,
+                    'cached': False,
                     'analysis': result,
                     'report': report
                 })
@@ -2659,124 +3321,45 @@ def analyze_sql_explain():
 
 @app.route('/api/sql-explain/batch-analyze', methods=['POST'])
 def batch_analyze_sql_explain():
-    """批量分析慢SQL的执行计划"""
+    """
+    提交批量分析慢SQL执行计划的后台任务
+
+    按实例分组、每实例复用一个连接、实例间并行；结果批量写入
+    sql_execution_plan 和 index_suggestion。通过返回的 job_id 查询进度。
+    """
     try:
         hours = request.args.get('hours', 24, type=int)
-        limit = request.args.get('limit', 50, type=int)
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
-
-        with conn.cursor() as cursor:
-            # 获取未分析的慢SQL
-            cursor.execute("""
-                SELECT DISTINCT
-                    l.id, l.sql_text, l.sql_fingerprint, l.db_instance_id
-                FROM long_running_sql_log l
-                LEFT JOIN sql_execution_plan p ON l.sql_fingerprint = p.sql_fingerprint
-                WHERE l.detect_time >= DATE_SUB(NOW(), INTERVAL %s HOUR)
-                  AND l.elapsed_seconds > 1
-                  AND p.id IS NULL
-                ORDER BY l.elapsed_seconds DESC
-                LIMIT %s
-            """, (hours, limit))
-
-            sqls = cursor.fetchall()
+        limit = min(1000, max(1, request.args.get('limit', 50, type=int)))
+        workers = min(16, max(1, request.args.get('workers', 4, type=int)))
 
-        analyzed_count = 0
-        failed_count = 0
-        results = []
-
-        for sql_record in sqls:
-            try:
-                # 调用单个分析API
-                analyze_result = analyze_sql_explain_internal(
-                    sql_record['sql_text'],
-                    sql_record['db_instance_id']
-                )
-
-                if analyze_result['success']:
-                    analyzed_count += 1
-                    results.append({
-                        'sql_id': sql_record['id'],
-                        'fingerprint': sql_record['sql_fingerprint'],
-                        'status': 'success',
-                        'issues_count': len(analyze_result.get('analysis', {}).get('issues', []))
-                    })
-                else:
-                    failed_count += 1
-                    results.append({
-                        'sql_id': sql_record['id'],
-                        'status': 'failed',
-                        'error': analyze_result.get('error')
-                    })
-
-            except Exception as e:
-                failed_count += 1
-                results.append({
-                    'sql_id': sql_record['id'],
-                    'status': 'failed',
-                    'error': str(e)
-                })
+        job, created = start_batch_job(get_db_connection, hours=hours, limit=limit, max_workers=workers)
 
         return jsonify({
             'success': True,
-            'total': len(sqls),
-            'analyzed': analyzed_count,
-            'failed': failed_count,
-            'results': results
-        })
+            'job_id': job.job_id,
+            'created': created,
+            'status': job.status,
+            'message': '任务已提交' if created else '已有批量分析任务在运行'
+        }), 202
 
     except Exception as e:
-        logger.error(f"批量分析SQL执行计划失败: {e}")
+        logger.error(f"提交批量分析任务失败: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def analyze_sql_explain_internal(sql_text, db_instance_id):
-    """内部调用的分析函数（不返回Flask Response）"""
-    conn = None
-    target_conn = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return {'success': False, 'error': '数据库连接失败'}
-
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM db_instance_info WHERE id = %s", (db_instance_id,))
-            instance = cursor.fetchone()
-
-        if not instance:
-            return {'success': False, 'error': '实例不存在'}
-
-        # 如果没有指定数据库，MySQL连接到information_schema，SQLServer连接到master
-        db_name = instance.get('db_name') or ('information_schema' if instance['db_type'] == 'MySQL' else 'master')
-        target_conn = pymysql.connect(
-            host=instance['db_ip'],
-            port=instance['db_port'],
-            user=instance['db_user'],
-            password=instance['db_password'],
-            database=db_name,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-
-        analyzer = SQLExplainAnalyzer(target_conn)
-        result = analyzer.analyze_sql(sql_text, instance['db_type'])
+@app.route('/api/sql-explain/batch-analyze/<job_id>', methods=['GET'])
+def get_batch_analyze_job(job_id):
+    """查询批量分析任务进度"""
+    job = get_batch_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return jsonify({'success': True, 'data': job.to_dict()})
 
-        if result['success']:
-            # 保存结果到数据库...
-            pass
 
-        return result
-
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
-    finally:
-        if target_conn:
-            target_conn.close()
-        if conn:
-            conn.close()
+@app.route('/api/sql-explain/batch-analyze', methods=['GET'])
+def list_batch_analyze_jobs():
+    """列出最近的批量分析任务"""
+    return jsonify({'success': True, 'data': [job.to_dict(include_results=False) for job in list_batch_jobs()]})
 
 
 @app.route('/api/index-suggestions')
@@ -2827,6 +3410,86 @@ def get_index_suggestions():
             conn.close()
 
 
+@app.route('/api/index-suggestions/consolidated')
+def get_consolidated_index_suggestions():
+    """
+    把实例的待处理索引建议合并成最少的复合索引
+
+    参数:
+        instance_id: 实例ID(必填)
+        hours: 只看最近多少小时产生的建议，默认168
+        max_per_table: 每张表最多推荐的新索引数，默认3
+    """
+    conn = None
+    target_conn = None
+    try:
+        instance_id = request.args.get('instance_id', type=int)
+        hours = request.args.get('hours', 168, type=int)
+        max_per_table = max(1, request.args.get('max_per_table', 3, type=int))
+        if not instance_id:
+            return jsonify({'success': False, 'error': '缺少instance_id参数'}), 400
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM db_instance_info WHERE id = %s", (instance_id,))
+            instance = cursor.fetchone()
+        if not instance:
+            return jsonify({'success': False, 'error': '实例不存在'}), 404
+        if instance['db_type'] != 'MySQL':
+            return jsonify({'success': False, 'error': '索引建议合并目前仅支持MySQL'}), 400
+
+        target_conn, _ = connect_target(instance)
+        with conn.cursor() as cursor, target_conn.cursor() as target_cursor:
+            result = consolidate_instance_suggestions(cursor, target_cursor, instance_id, hours, max_per_table)
+
+        return jsonify({'success': True, 'data': result})
+
+    except Exception as e:
+        logger.error(f"合并索引建议失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if target_conn:
+            target_conn.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/api/index-suggestions/drop-candidates')
+def get_index_drop_candidates():
+    """
+    可删除索引报告（未使用/冗余索引，附大小和写代价）
+
+    参数:
+        instance_id: 实例ID
+        min_days: 累计观察满多少天仍未被读过才算未使用，默认7
+        limit: 最多返回条数，默认100
+    """
+    conn = None
+    try:
+        instance_id = request.args.get('instance_id', type=int)
+        min_days = max(1, request.args.get('min_days', 7, type=int))
+        limit = min(500, max(1, request.args.get('limit', 100, type=int)))
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': '数据库连接失败'}), 500
+
+        with conn.cursor() as cursor:
+            candidates = get_drop_candidates(cursor, instance_id, min_days, limit)
+
+        return jsonify({'success': True, 'data': candidates, 'total': len(candidates)})
+
+    except Exception as e:
+        logger.error(f"获取可删除索引失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+
 @app.route('/api/index-suggestions/<int:suggestion_id>/apply', methods=['POST'])
 def apply_index_suggestion(suggestion_id):
     """应用索引建议（执行CREATE INDEX语句）"""
@@ -2910,6 +3573,7 @@ def server_error(e):
 
 
 # ==================== 后台采集器定时任务 ====================
+# 任务函数记录日志后把异常继续抛给调度器，EVENT_JOB_ERROR 才能计入 dbmonitor_job_events_total
 
 def run_mysql_collector():
     """MySQL Performance Schema 采集器"""
@@ -2929,17 +3593,25 @@ def run_mysql_collector():
         total_saved = 0
 
         for instance in instances:
+            label = instance_label(instance)
             try:
-                collector = MySQLPerfSchemaCollector(instance, threshold_seconds=threshold)
-                saved = collector.collect()
+                with INSTANCE_COLLECT_DURATION.time('mysql_collector', label):
+                    collector = MySQLPerfSchemaCollector(instance, threshold_seconds=threshold)
+                    saved = collector.collect()
                 total_saved += saved
+                if collector.errors:
+                    INSTANCE_COLLECT_ERRORS.inc('mysql_collector', label)
             except Exception as e:
+                INSTANCE_COLLECT_ERRORS.inc('mysql_collector', label)
                 logger.error(f"MySQL采集失败 {instance.get('db_project')}: {e}")
 
+        INGESTED_ROWS.inc('mysql_collector', amount=total_saved)
+
         if total_saved > 0:
             logger.info(f"MySQL采集完成: {total_saved} 条慢SQL (阈值: {threshold}秒)")
     except Exception as e:
         logger.error(f"MySQL采集器异常: {e}")
+        raise
 
 
 def run_sqlserver_collector():
@@ -2961,17 +3633,25 @@ def run_sqlserver_collector():
         total_saved = 0
 
         for instance in instances:
+            label = instance_label(instance)
             try:
-                collector = SQLServerQueryStoreCollector(instance, threshold_seconds=threshold)
-                saved = collector.collect(auto_enable_querystore=auto_enable)
+                with INSTANCE_COLLECT_DURATION.time('sqlserver_collector', label):
+                    collector = SQLServerQueryStoreCollector(instance, threshold_seconds=threshold)
+                    saved = collector.collect(auto_enable_querystore=auto_enable)
                 total_saved += saved
+                if collector.errors:
+                    INSTANCE_COLLECT_ERRORS.inc('sqlserver_collector', label)
             except Exception as e:
+                INSTANCE_COLLECT_ERRORS.inc('sqlserver_collector', label)
                 logger.error(f"SQL Server采集失败 {instance.get('db_project')}: {e}")
 
+        INGESTED_ROWS.inc('sqlserver_collector', amount=total_saved)
+
         if total_saved > 0:
             logger.info(f"SQL Server采集完成: {total_saved} 条慢SQL (阈值: {threshold}秒)")
     except Exception as e:
         logger.error(f"SQL Server采集器异常: {e}")
+        raise
 
 
 def run_deadlock_collector():
@@ -2990,10 +3670,76 @@ def run_deadlock_collector():
 
     except Exception as e:
         logger.error(f"死锁检测器异常: {e}")
+        raise
+
+
+def run_template_cluster_job():
+    """SQL模板近似聚类任务"""
+    conn = None
+    try:
+        config = load_config()
+        cluster_config = config.get('collectors', {}).get('template_cluster', {})
+
+        if not cluster_config.get('enabled', True):
+            logger.debug("SQL模板聚类已禁用，跳过本次执行")
+            return
+
+        from scripts.sql_template_cluster import SQLTemplateClusterer, cluster_fingerprint_stats
+
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("获取监控库连接失败")
+        clusterer = SQLTemplateClusterer(threshold=cluster_config.get('threshold', 0.5))
+        cluster_fingerprint_stats(conn, clusterer)
+    except Exception as e:
+        logger.error(f"SQL模板聚类任务异常: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def run_index_usage_collector():
+    """索引使用情况采集任务(未使用/冗余索引)"""
+    try:
+        config = load_config()
+        usage_config = config.get('collectors', {}).get('index_usage', {})
+
+        if not usage_config.get('enabled', True):
+            logger.debug("索引使用情况采集已禁用，跳过本次执行")
+            return
+
+        saved = collect_all_index_usage(get_db_connection)
+        INGESTED_ROWS.inc('index_usage_collector', amount=saved)
+        logger.info(f"索引使用情况采集完成: {saved} 个索引")
+    except Exception as e:
+        logger.error(f"索引使用情况采集异常: {e}")
+        raise
+
+
+def run_prometheus_target_refresh():
+    """Prometheus抓取目标索引刷新任务"""
+    try:
+        config = load_config()
+        prom_config = config.get('prometheus', {})
+        target_config = config.get('collectors', {}).get('prometheus_targets', {})
+
+        if not prom_config.get('enabled', False) or not target_config.get('enabled', True):
+            logger.debug("Prometheus目标索引刷新已禁用，跳过本次执行")
+            return
+
+        prom = get_prometheus_client(prom_config.get('url', 'http://192.168.98.4:9090'),
+                                     prom_config.get('timeout', 5))
+        if prom.refresh_targets() is None:
+            raise RuntimeError("Prometheus目标索引刷新失败，继续使用上一次的索引")
+    except Exception as e:
+        logger.error(f"Prometheus目标索引刷新异常: {e}")
+        raise
 
 
 # 创建后台调度器
 scheduler = BackgroundScheduler()
+attach_scheduler(scheduler)
 
 def init_scheduler():
     """初始化调度器，从配置读取间隔"""
@@ -3021,6 +3767,27 @@ def init_scheduler():
                          id="deadlock_collector", replace_existing=True)
         logger.info(f"死锁检测器已启动，间隔: {interval}秒")
 
+    cluster_config = collectors_config.get('template_cluster', {})
+    if cluster_config.get('enabled', True):
+        interval = cluster_config.get('interval', 3600)  # 默认1小时
+        scheduler.add_job(func=run_template_cluster_job, trigger="interval", seconds=interval,
+                         id="template_cluster_job", replace_existing=True)
+        logger.info(f"SQL模板聚类任务已启动，间隔: {interval}秒")
+
+    usage_config = collectors_config.get('index_usage', {})
+    if usage_config.get('enabled', True):
+        interval = usage_config.get('interval', 3600)  # 默认1小时
+        scheduler.add_job(func=run_index_usage_collector, trigger="interval", seconds=interval,
+                         id="index_usage_collector", replace_existing=True)
+        logger.info(f"索引使用情况采集已启动，间隔: {interval}秒")
+
+    target_config = collectors_config.get('prometheus_targets', {})
+    if config.get('prometheus', {}).get('enabled', False) and target_config.get('enabled', True):
+        interval = target_config.get('interval', 300)  # 默认5分钟
+        scheduler.add_job(func=run_prometheus_target_refresh, trigger="interval", seconds=interval,
+                         id="prometheus_target_refresh", replace_existing=True)
+        logger.info(f"Prometheus目标索引刷新已启动，间隔: {interval}秒")
+
 def update_collector_schedule(collector_type, enabled, interval):
     """动态更新采集器调度"""
     job_id = f"{collector_type}_collector"
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试语料
+
+所有语料都由固定随机种子生成，不依赖数据库连接，保证不同机器、不同次运行的输入完全一致:
+- SQL语句: scripts/generate_test_data.py 的 SQL_TEMPLATES + 仿ORM生成的变体
+- SQL Server死锁图XML (xml_deadlock_report)
+- SQL Server Showplan XML (含缺失索引和警告)
+- SHOW ENGINE INNODB STATUS 全文(含 LATEST DETECTED DEADLOCK 段)
+- MySQL EXPLAIN FORMAT=JSON 结果
+"""
+
+import json
+import random
+from xml.sax.saxutils import escape as xml_escape
+from datetime import datetime, timedelta
+from typing import List
+
+from generate_test_data import SQL_TEMPLATES
+
+DEFAULT_SEED = 20240501
+
+_TABLES = ['orders', 'order_items', 'users', 'products', 'payments', 'inventory',
+           'sessions', 'audit_log', 'coupons', 'shipments', 'refunds', 'merchants']
+_SCHEMAS = ['shop', 'crm', 'erp', 'report']
+_COLUMNS = ['id', 'user_id', 'order_id', 'product_id', 'status', 'created_at', 'updated_at',
+            'amount', 'total_amount', 'quantity', 'name', 'email', 'phone', 'merchant_id',
+            'is_deleted', 'version', 'remark', 'region_code', 'channel', 'paid_at']
+_STATUSES = ['pending', 'processing', 'paid', 'shipped', 'closed', 'refunding']
+_HOSTS = ['192.168.47.41', '192.168.47.52', '10.10.3.17', '10.10.3.18']
+_USERS = ['app_user', 'yzc_soft', 'report_ro', 'batch_job']
+
+
+def _literal(rng: random.Random, column: str) -> str:
+    if column in ('status', 'channel'):
+        return f"'{rng.choice(_STATUSES)}'"
+    if column in ('name', 'email', 'remark', 'phone'):
+        return "'" + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(rng.randint(4, 16))) + "'"
+    if column.endswith('_at'):
+        day = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+        return f"'{day:%Y-%m-%d %H:%M:%S}'"
+    if column == 'amount' or column == 'total_amount':
+        return f"{rng.uniform(0, 10000):.2f}"
+    return str(rng.randint(1, 10 ** rng.randint(1, 9)))
+
+
+def _condition(rng: random.Random, alias: str = '') -> str:
+    column = rng.choice(_COLUMNS)
+    prefix = f"{alias}." if alias else ''
+    kind = rng.random()
+    if kind < 0.15:
+        values = ', '.join(_literal(rng, column) for _ in range(rng.randint(2, 40)))
+        return f"{prefix}{column} IN ({values})"
+    if kind < 0.25:
+        return f"{prefix}{column} BETWEEN {_literal(rng, column)} AND {_literal(rng, column)}"
+    if kind < 0.3:
+        return f"{prefix}{column} IS NULL"
+    return f"{prefix}{column} {rng.choice(['=', '>', '<', '>=', '<=', '<>'])} {_literal(rng, column)}"
+
+
+def _where(rng: random.Random, alias: str = '') -> str:
+    parts = [_condition(rng, alias) for _ in range(rng.randint(1, 6))]
+    sql = parts[0]
+    for part in parts[1:]:
+        sql += f" {rng.choice(['AND', 'AND', 'AND', 'OR'])} {part}"
+    return sql
+
+
+def _table(rng: random.Random) -> str:
+    name = rng.choice(_TABLES)
+    style = rng.random()
+    if style < 0.2:
+        return f"{rng.choice(_SCHEMAS)}.{name}"
+    if style < 0.35:
+        return f"`{name}`"
+    return name
+
+
+def _select(rng: random.Random) -> str:
+    columns = ', '.join(f"t0.{c}" for c in rng.sample(_COLUMNS, rng.randint(1, 10)))
+    sql = f"SELECT {columns} FROM {_table(rng)} t0"
+    for i in range(1, rng.randint(1, 4)):
+        join = rng.choice(['JOIN', 'LEFT JOIN', 'INNER JOIN'])
+        sql += f" {join} {_table(rng)} t{i} ON t{i}.{rng.choice(_COLUMNS)} = t{i - 1}.{rng.choice(_COLUMNS)}"
+    sql += f" WHERE {_where(rng, 't0')}"
+    if rng.random() < 0.2:
+        sql += f" AND t0.user_id IN (SELECT id FROM {_table(rng)} WHERE {_where(rng)})"
+    if rng.random() < 0.3:
+        sql += f" ORDER BY t0.{rng.choice(_COLUMNS)} {rng.choice(['ASC', 'DESC'])}"
+    if rng.random() < 0.5:
+        sql += f" LIMIT {rng.randint(1, 500)}"
+        if rng.random() < 0.3:
+            sql += f" OFFSET {rng.randint(0, 100000)}"
+    return sql
+
+
+def _cte(rng: random.Random) -> str:
+    return (f"WITH recent AS (SELECT {rng.choice(_COLUMNS)}, {rng.choice(_COLUMNS)} FROM {_table(rng)} "
+            f"WHERE {_where(rng)}) SELECT r.*, u.name FROM recent r JOIN users u ON u.id = r.user_id "
+            f"WHERE {_where(rng, 'u')}")
+
+
+def _insert(rng: random.Random) -> str:
+    columns = rng.sample(_COLUMNS, rng.randint(2, 8))
+    rows = ', '.join(
+        '(' + ', '.join(_literal(rng, c) for c in columns) + ')'
+        for _ in range(rng.randint(1, 20))
+    )
+    return f"INSERT INTO {_table(rng)} ({', '.join(columns)}) VALUES {rows}"
+
+
+def _update(rng: random.Random) -> str:
+    sets = ', '.join(f"{c} = {_literal(rng, c)}" for c in rng.sample(_COLUMNS, rng.randint(1, 5)))
+    return f"UPDATE {_table(rng)} SET {sets} WHERE {_where(rng)}"
+
+
+def _delete(rng: random.Random) -> str:
+    return f"DELETE FROM {_table(rng)} WHERE {_where(rng)} LIMIT {rng.randint(100, 5000)}"
+
+
+def _sqlserver(rng: random.Random) -> str:
+    columns = ', '.join(f"[{c}]" for c in rng.sample(_COLUMNS, rng.randint(1, 6)))
+    table = rng.choice(_TABLES).capitalize()
+    return (f"SELECT TOP ({rng.randint(1, 200)}) {columns} FROM [dbo].[{table}] WITH (NOLOCK) "
+            f"WHERE [{rng.choice(_COLUMNS)}] = @p0 AND [{rng.choice(_COLUMNS)}] > @p1 "
+            f"ORDER BY [{rng.choice(_COLUMNS)}] DESC")
+
+
+_GENERATORS = [
+    (_select, 45), (_cte, 5), (_insert, 15), (_update, 15), (_delete, 5), (_sqlserver, 15)
+]
+
+
+def sql_corpus(count: int = 5000, seed: int = DEFAULT_SEED) -> List[str]:
+    """生成SQL语料（前部固定包含 generate_test_data 的全部模板）"""
+    rng = random.Random(seed)
+    generators = [g for g, weight in _GENERATORS for _ in range(weight)]
+
+    statements = list(SQL_TEMPLATES)
+    while len(statements) < count:
+        sql = rng.choice(generators)(rng)
+        if rng.random() < 0.1:
+            sql = f"/* app={rng.choice(_USERS)} trace={rng.randint(10 ** 8, 10 ** 9)} */ {sql}"
+        statements.append(sql)
+    return statements[:count]
+
+
+def deadlock_xml_corpus(count: int = 200, seed: int = DEFAULT_SEED) -> List[str]:
+    """生成SQL Server xml_deadlock_report 死锁图"""
+    rng = random.Random(seed)
+    corpus = []
+
+    for _ in range(count):
+        process_count = rng.randint(2, 4)
+        process_ids = [f"process{rng.randrange(16 ** 12):012x}" for _ in range(process_count)]
+        processes = []
+        for pid in process_ids:
+            sql = xml_escape(_update(rng) if rng.random() < 0.6 else _select(rng))
+            processes.append(f"""
+   <process id="{pid}" taskpriority="0" logused="{rng.randint(0, 20000)}" waitresource="KEY: 7:{rng.randrange(10 ** 17)} ({rng.randrange(16 ** 12):012x})" waittime="{rng.randint(1, 5000)}" ownerId="{rng.randrange(10 ** 8)}" transactionname="user_transaction" lasttranstarted="2024-05-01T10:10:00.123" XDES="0x{rng.randrange(16 ** 12):x}" lockMode="{rng.choice(['U', 'X', 'S'])}" schedulerid="{rng.randint(1, 16)}" kpid="{rng.randint(1000, 30000)}" status="suspended" spid="{rng.randint(50, 900)}" sbid="0" ecid="0" priority="0" trancount="2" lastbatchstarted="2024-05-01T10:10:00.120" lastbatchcompleted="2024-05-01T10:10:00.110" clientapp="Microsoft SqlClient Data Provider" hostname="APP-{rng.randint(1, 40):02d}" hostpid="{rng.randint(1000, 20000)}" loginname="{rng.choice(_USERS)}" isolationlevel="read committed (2)" xactid="{rng.randrange(10 ** 8)}" currentdb="7" lockTimeout="4294967295" clientoption1="671090784" clientoption2="390200">
+    <executionStack>
+     <frame procname="adhoc" line="1" stmtstart="{rng.randint(0, 200)}" sqlhandle="0x{rng.randrange(16 ** 40):040x}">
+{sql}    </frame>
+    </executionStack>
+    <inputbuf>
+{sql}   </inputbuf>
+   </process>""")
+
+        resources = []
+        for i, pid in enumerate(process_ids):
+            owner = process_ids[(i + 1) % process_count]
+            resources.append(f"""
+   <keylock hobtid="{rng.randrange(10 ** 17)}" dbid="7" objectname="Shop.dbo.{rng.choice(_TABLES)}" indexname="PK_{rng.choice(_TABLES)}" id="lock{rng.randrange(16 ** 12):x}" mode="X" associatedObjectId="{rng.randrange(10 ** 17)}">
+    <owner-list>
+     <owner id="{owner}" mode="X"/>
+    </owner-list>
+    <waiter-list>
+     <waiter id="{pid}" mode="U" requestType="wait"/>
+    </waiter-list>
+   </keylock>""")
+
+        corpus.append(f"""<deadlock>
+ <victim-list>
+  <victimProcess id="{process_ids[0]}"/>
+ </victim-list>
+ <process-list>{''.join(processes)}
+ </process-list>
+ <resource-list>{''.join(resources)}
+ </resource-list>
+</deadlock>""")
+
+    return corpus
+
+
+def innodb_status_corpus(count: int = 200, seed: int = DEFAULT_SEED) -> List[str]:
+    """生成 SHOW ENGINE INNODB STATUS 全文"""
+    rng = random.Random(seed)
+    corpus = []
+
+    for _ in range(count):
+        now = datetime(2024, 5, 1) + timedelta(seconds=rng.randint(0, 86400 * 30))
+        deadlock_at = now - timedelta(seconds=rng.randint(1, 3600))
+        schema = rng.choice(_SCHEMAS)
+
+        transactions = []
+        for n in (1, 2):
+            trx_id = rng.randint(10 ** 6, 10 ** 9)
+            table_a, table_b = rng.sample(_TABLES, 2)
+            transactions.append(f"""*** ({n}) TRANSACTION:
+TRANSACTION {trx_id}, ACTIVE {rng.randint(0, 30)} sec starting index read
+mysql tables in use 1, locked 1
+LOCK WAIT {rng.randint(2, 8)} lock struct(s), heap size 1136, {rng.randint(1, 6)} row lock(s)
+MySQL thread id {rng.randint(100, 99999)}, OS thread handle {rng.randrange(10 ** 14)}, query id {rng.randint(10 ** 8, 10 ** 9)} {rng.choice(_HOSTS)} {rng.choice(_USERS)} updating
+{_update(rng)}
+
+*** ({n}) HOLDS THE LOCK(S):
+RECORD LOCKS space id {rng.randint(10, 900)} page no {rng.randint(3, 9000)} n bits 80 index PRIMARY of table `{schema}`.`{table_a}` trx id {trx_id} lock_mode X locks rec but not gap
+Record lock, heap no {rng.randint(2, 90)} PHYSICAL RECORD: n_fields 8; compact format; info bits 0
+ 0: len 8; hex {rng.randrange(16 ** 16):016x}; asc         ;;
+ 1: len 6; hex {rng.randrange(16 ** 12):012x}; asc       ;;
+
+*** ({n}) WAITING FOR THIS LOCK TO BE GRANTED:
+RECORD LOCKS space id {rng.randint(10, 900)} page no {rng.randint(3, 9000)} n bits 80 index PRIMARY of table `{schema}`.`{table_b}` trx id {trx_id} lock_mode X locks rec but not gap waiting
+Record lock, heap no {rng.randint(2, 90)} PHYSICAL RECORD: n_fields 8; compact format; info bits 0
+""")
+
+        trx_list = '\n'.join(
+            f"---TRANSACTION {rng.randint(10 ** 6, 10 ** 9)}, ACTIVE {rng.randint(0, 600)} sec\n"
+            f"MySQL thread id {rng.randint(100, 99999)}, OS thread handle {rng.randrange(10 ** 14)}, "
+            f"query id {rng.randint(10 ** 8, 10 ** 9)} {rng.choice(_HOSTS)} {rng.choice(_USERS)}"
+            for _ in range(rng.randint(5, 60))
+        )
+
+        corpus.append(f"""
+=====================================
+{now:%Y-%m-%d %H:%M:%S} 0x7f{rng.randrange(16 ** 10):010x} INNODB MONITOR OUTPUT
+=====================================
+Per second averages calculated from the last {rng.randint(5, 60)} seconds
+-----------------
+BACKGROUND THREAD
+-----------------
+srv_master_thread loops: {rng.randint(10 ** 4, 10 ** 7)} srv_active, 0 srv_shutdown, {rng.randint(10 ** 4, 10 ** 7)} srv_idle
+srv_master_thread log flush and writes: {rng.randint(10 ** 4, 10 ** 7)}
+----------
+SEMAPHORES
+----------
+OS WAIT ARRAY INFO: reservation count {rng.randint(10 ** 4, 10 ** 7)}
+OS WAIT ARRAY INFO: signal count {rng.randint(10 ** 4, 10 ** 7)}
+RW-shared spins 0, rounds 0, OS waits 0
+RW-excl spins 0, rounds 0, OS waits 0
+------------------------
+LATEST DETECTED DEADLOCK
+------------------------
+{deadlock_at:%Y-%m-%d %H:%M:%S} 0x7f{rng.randrange(16 ** 10):010x}
+{transactions[0]}
+{transactions[1]}
+*** WE ROLL BACK TRANSACTION ({rng.choice([1, 2])})
+------------
+TRANSACTIONS
+------------
+Trx id counter {rng.randint(10 ** 6, 10 ** 9)}
+Purge done for trx's n:o < {rng.randint(10 ** 6, 10 ** 9)} undo n:o < 0 state: running but idle
+History list length {rng.randint(0, 5000)}
+LIST OF TRANSACTIONS FOR EACH SESSION:
+{trx_list}
+--------
+FILE I/O
+--------
+I/O thread 0 state: waiting for completed aio requests (insert buffer thread)
+Pending normal aio reads: [0, 0, 0, 0] , aio writes: [0, 0, 0, 0] ,
+-------------------------------------
+INSERT BUFFER AND ADAPTIVE HASH INDEX
+-------------------------------------
+Ibuf: size 1, free list len 0, seg size 2, 0 merges
+---
+LOG
+---
+Log sequence number          {rng.randint(10 ** 9, 10 ** 12)}
+Log flushed up to            {rng.randint(10 ** 9, 10 ** 12)}
+----------------------
+BUFFER POOL AND MEMORY
+----------------------
+Total large memory allocated 0
+Buffer pool hit rate 1000 / 1000, young-making rate 0 / 1000 not 0 / 1000
+--------------
+ROW OPERATIONS
+--------------
+0 queries inside InnoDB, 0 queries in queue
+----------------------------
+END OF INNODB MONITOR OUTPUT
+============================
+""")
+
+    return corpus
+
+
+def _explain_table(rng: random.Random) -> dict:
+    table = rng.choice(_TABLES)
+    access_type = rng.choice(['ALL', 'ALL', 'ref', 'eq_ref', 'range', 'index', 'const'])
+    info = {
+        'table_name': table,
+        'access_type': access_type,
+        'rows_examined_per_scan': rng.choice([1, 12, 340, 5600, 120000, 2500000]),
+        'rows_produced_per_join': rng.randint(1, 100000),
+        'filtered': rng.choice(['100.00', '50.00', '10.00', '3.33', '0.50']),
+        'cost_info': {
+            'read_cost': f"{rng.uniform(0, 50000):.2f}",
+            'eval_cost': f"{rng.uniform(0, 50000):.2f}",
+            'prefix_cost': f"{rng.uniform(0, 100000):.2f}",
+            'data_read_per_join': f"{rng.randint(1, 900)}M"
+        },
+        'used_columns': rng.sample(_COLUMNS, rng.randint(2, 10))
+    }
+    if access_type != 'ALL':
+        info['key'] = f"idx_{table}_{rng.choice(_COLUMNS)}"
+        info['used_key_parts'] = [rng.choice(_COLUMNS)]
+        info['key_length'] = str(rng.choice([4, 8, 130, 1022]))
+    if rng.random() < 0.6:
+        info['possible_keys'] = [f"idx_{table}_{c}" for c in rng.sample(_COLUMNS, rng.randint(1, 3))]
+    if rng.random() < 0.7:
+        info['attached_condition'] = ' and '.join(
+            f"(`{rng.choice(_SCHEMAS)}`.`{table}`.`{c}` {rng.choice(['=', '>', '<'])} {rng.randint(1, 1000)})"
+            for c in rng.sample(_COLUMNS, rng.randint(1, 4))
+        )
+    return info
+
+
+def explain_json_corpus(count: int = 500, seed: int = DEFAULT_SEED) -> List[str]:
+    """生成MySQL EXPLAIN FORMAT=JSON 结果（JSON文本）"""
+    rng = random.Random(seed)
+    corpus = []
+
+    for i in range(count):
+        query_block = {
+            'select_id': 1,
+            'cost_info': {'query_cost': f"{rng.uniform(1, 900000):.2f}"}
+        }
+        if rng.random() < 0.5:
+            query_block['nested_loop'] = [{'table': _explain_table(rng)} for _ in range(rng.randint(2, 6))]
+        else:
+            query_block['table'] = _explain_table(rng)
+
+        if rng.random() < 0.3:
+            query_block = {
+                'select_id': 1,
+                'cost_info': query_block['cost_info'],
+                'ordering_operation': {
+                    'using_filesort': True,
+                    'using_temporary_table': rng.random() < 0.5,
+                    **{k: v for k, v in query_block.items() if k in ('table', 'nested_loop')}
+                }
+            }
+
+        corpus.append(json.dumps({'query_block': query_block}, indent=2))
+
+    return corpus
+
+
+_SHOWPLAN_NS = 'http://schemas.microsoft.com/sqlserver/2004/07/showplan'
+_PHYSICAL_OPS = ['Clustered Index Scan', 'Clustered Index Seek', 'Index Seek', 'Index Scan',
+                 'Table Scan', 'Key Lookup', 'Hash Match', 'Nested Loops', 'Sort']
+
+
+def _showplan_relop(rng: random.Random, node_id: List[int], depth: int) -> str:
+    node_id[0] += 1
+    physical_op = rng.choice(_PHYSICAL_OPS)
+    table = rng.choice(_TABLES)
+    children = ''
+    if depth < 4 and physical_op in ('Hash Match', 'Nested Loops', 'Sort'):
+        children = ''.join(_showplan_relop(rng, node_id, depth + 1) for _ in range(2 if physical_op != 'Sort' else 1))
+    warnings = ''
+    if rng.random() < 0.15:
+        warnings = (f'<Warnings><PlanAffectingConvert ConvertIssue="Seek Plan" '
+                    f'Expression="CONVERT_IMPLICIT(nvarchar(50),[{table}].[{rng.choice(_COLUMNS)}],0)"/></Warnings>')
+    columns = ''.join(f'<ColumnReference Database="[Shop]" Schema="[dbo]" Table="[{table}]" Column="[{c}]"/>'
+                      for c in rng.sample(_COLUMNS, rng.randint(2, 8)))
+    scan = ''
+    if 'Scan' in physical_op or 'Seek' in physical_op or physical_op == 'Key Lookup':
+        scan = (f'<IndexScan Ordered="0" ForcedIndex="0" NoExpandHint="0">'
+                f'<DefinedValues>{columns}</DefinedValues>'
+                f'<Object Database="[Shop]" Schema="[dbo]" Table="[{table}]" Index="[IX_{table}_{rng.choice(_COLUMNS)}]"/>'
+                f'</IndexScan>')
+    return (f'<RelOp NodeId="{node_id[0]}" PhysicalOp="{physical_op}" LogicalOp="{physical_op}" '
+            f'EstimateRows="{rng.uniform(1, 100000):.1f}" EstimatedTotalSubtreeCost="{rng.uniform(0, 500):.4f}">'
+            f'<OutputList>{columns}</OutputList>{warnings}{scan}{children}</RelOp>')
+
+
+def query_plan_corpus(count: int = 200, seed: int = DEFAULT_SEED) -> List[str]:
+    """生成SQL Server Showplan XML（带命名空间，部分含缺失索引和警告）"""
+    rng = random.Random(seed)
+    corpus = []
+
+    for _ in range(count):
+        missing = ''
+        if rng.random() < 0.4:
+            table = rng.choice(_TABLES)
+            missing = (f'<MissingIndexes><MissingIndexGroup Impact="{rng.uniform(10, 99):.4f}">'
+                       f'<MissingIndex Database="[Shop]" Schema="[dbo]" Table="[{table}]">'
+                       f'<ColumnGroup Usage="EQUALITY"><Column Name="[{rng.choice(_COLUMNS)}]" ColumnId="2"/></ColumnGroup>'
+                       f'<ColumnGroup Usage="INCLUDE"><Column Name="[{rng.choice(_COLUMNS)}]" ColumnId="5"/></ColumnGroup>'
+                       f'</MissingIndex></MissingIndexGroup></MissingIndexes>')
+        corpus.append(
+            f'<ShowPlanXML xmlns="{_SHOWPLAN_NS}" Version="1.564" Build="15.0.2000.5"><BatchSequence><Batch><Statements>'
+            f'<StmtSimple StatementText="{xml_escape(_select(rng), {chr(34): "&quot;"})}" StatementId="1" '
+            f'StatementSubTreeCost="{rng.uniform(0.01, 2000):.4f}" StatementEstRows="{rng.randint(1, 500000)}" StatementType="SELECT">'
+            f'<QueryPlan DegreeOfParallelism="{rng.choice([0, 1, 4, 8])}">{missing}'
+            f'{_showplan_relop(rng, [0], 0)}</QueryPlan></StmtSimple></Statements></Batch></BatchSequence></ShowPlanXML>'
+        )
+
+    return corpus
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解析/分析热点路径基准测试
+
+覆盖:
+- SQLFingerprint: tokenize / normalize / generate / extract_metadata
+- SQLTemplateClusterer: 单模板MinHash签名
+- SQLExplainAnalyzer: EXPLAIN JSON 解析与问题识别
+- SQLServerDeadlockCollector.parse_deadlock_graph: 死锁图XML解析
+- xml_stream.extract_query_plan: Showplan XML 流式字段抽取
+- collector_enhanced.MySQLCollector.parse_deadlock_from_status: INNODB STATUS死锁段解析
+
+输出每个用例的 ops/sec、p50/p99 单次耗时和单次调用的内存分配量(tracemalloc峰值)，
+可保存为基线并与之对比。全部离线运行，不需要任何数据库连接。
+
+使用:
+    python benchmarks/run_benchmarks.py                          # 运行并与默认基线对比(若存在)
+    python benchmarks/run_benchmarks.py --save-baseline          # 运行并保存为基线
+    python benchmarks/run_benchmarks.py --filter fingerprint     # 只运行名称包含关键字的用例
+    python benchmarks/run_benchmarks.py --fail-on-regression     # 有退化时返回非0退出码
+
+基线与机器相关，默认保存在 benchmarks/baseline.json（不纳入版本控制）。
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+sys.path.insert(0, ROOT_DIR)
+
+# 被测模块在解析失败时会打日志，基准测试中屏蔽
+logging.disable(logging.CRITICAL)
+
+from corpora import (sql_corpus, deadlock_xml_corpus, innodb_status_corpus, explain_json_corpus,
+                     query_plan_corpus)
+from sql_fingerprint import SQLFingerprint
+from sql_template_cluster import SQLTemplateClusterer
+from sql_explain_analyzer import SQLExplainAnalyzer
+from sqlserver_deadlock_collector import SQLServerDeadlockCollector
+from xml_stream import extract_query_plan
+from collector_enhanced import MySQLCollector
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+
+class _CannedExplainAnalyzer(SQLExplainAnalyzer):
+    """以预先准备的EXPLAIN JSON代替数据库往返，其余分析逻辑不变"""
+
+    def __init__(self):
+        super().__init__(db_connection=None)
+        self.plan_text = None
+
+    def _get_mysql_explain(self, sql_text: str) -> Optional[Dict]:
+        return json.loads(self.plan_text)
+
+
+def build_cases(sql_count: int) -> Dict[str, tuple]:
+    """构建用例: 名称 -> (被测函数, 语料)"""
+    sqls = sql_corpus(sql_count)
+    deadlock_xmls = deadlock_xml_corpus()
+    innodb_statuses = innodb_status_corpus()
+    explain_plans = explain_json_corpus()
+    query_plans = query_plan_corpus()
+
+    clusterer = SQLTemplateClusterer()
+    templates = [SQLFingerprint.normalize(sql) for sql in sqls]
+
+    analyzer = _CannedExplainAnalyzer()
+
+    def analyze_plan(plan_text):
+        analyzer.plan_text = plan_text
+        return analyzer.analyze_sql('SELECT 1', 'mysql')
+
+    deadlock_collector = SQLServerDeadlockCollector(
+        instance_id=1, instance_name='bench', host='localhost', port=1433,
+        user='', password='', monitor_db_config={}
+    )
+    mysql_collector = MySQLCollector({'id': 1, 'db_project': 'bench'})
+
+    return {
+        'fingerprint.tokenize': (SQLFingerprint.tokenize, sqls),
+        'fingerprint.normalize': (SQLFingerprint.normalize, sqls),
+        'fingerprint.generate': (SQLFingerprint.generate, sqls),
+        'fingerprint.extract_metadata': (SQLFingerprint.extract_metadata, sqls),
+        'template_cluster.signature': (lambda t: clusterer.signature(clusterer.shingles(t)), templates),
+        'explain_analyzer.analyze_mysql': (analyze_plan, explain_plans),
+        'deadlock.parse_deadlock_graph': (deadlock_collector.parse_deadlock_graph, deadlock_xmls),
+        'deadlock.parse_innodb_status': (mysql_collector.parse_deadlock_from_status, innodb_statuses),
+        'query_plan.extract': (extract_query_plan, query_plans),
+    }
+
+
+def _percentile(sorted_values: List[int], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return float(sorted_values[index])
+
+
+def run_case(func: Callable, corpus: List, min_time: float, alloc_samples: int) -> Dict:
+    """
+    运行单个用例
+
+    1. 预热一遍语料
+    2. 循环遍历语料直到累计耗时超过 min_time，记录每次调用耗时
+    3. 在tracemalloc下对部分输入单独测量每次调用的内存分配峰值
+    """
+    for item in corpus:
+        func(item)
+
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        while time.perf_counter() - started < min_time:
+            for item in corpus:
+                t0 = time.perf_counter_ns()
+                func(item)
+                timings.append(time.perf_counter_ns() - t0)
+        elapsed = time.perf_counter() - started
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    step = max(1, len(corpus) // alloc_samples)
+    samples = corpus[::step][:alloc_samples]
+    allocated = []
+    tracemalloc.start()
+    try:
+        for item in samples:
+            before = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            func(item)
+            current, peak = tracemalloc.get_traced_memory()
+            allocated.append(max(peak, current) - before)
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'ops_per_sec': len(timings) / elapsed if elapsed > 0 else 0.0,
+        'p50_us': _percentile(timings, 50) / 1000.0,
+        'p99_us': _percentile(timings, 99) / 1000.0,
+        'alloc_bytes_per_call': sum(allocated) / len(allocated) if allocated else 0.0
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """与基线对比，返回退化的用例名称"""
+    regressions = []
+    print()
+    print(f"{'用例':<34}{'ops/sec变化':>14}{'p99变化':>12}{'分配变化':>12}")
+    print('-' * 72)
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<34}{'(无基线)':>14}")
+            continue
+
+        def change(key):
+            return (current[key] - base[key]) / base[key] * 100 if base.get(key) else 0.0
+
+        ops_change = change('ops_per_sec')
+        p99_change = change('p99_us')
+        alloc_change = change('alloc_bytes_per_call')
+        regressed = ops_change < -threshold or p99_change > threshold
+        if regressed:
+            regressions.append(name)
+        flag = '  <-- 退化' if regressed else ''
+        print(f"{name:<34}{ops_change:>+13.1f}%{p99_change:>+11.1f}%{alloc_change:>+11.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析/分析热点路径基准测试')
+    parser.add_argument('--filter', help='只运行名称包含该关键字的用例')
+    parser.add_argument('--min-time', type=float, default=1.0, help='每个用例最少运行秒数 (默认1.0)')
+    parser.add_argument('--sql-count', type=int, default=5000, help='SQL语料条数 (默认5000)')
+    parser.add_argument('--alloc-samples', type=int, default=200, help='内存分配测量的样本数 (默认200)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=10.0, help='判定退化的百分比阈值 (默认10)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有退化时返回退出码1')
+    parser.add_argument('--json', dest='json_output', help='把本次结果写入指定JSON文件')
+
+    args = parser.parse_args()
+
+    cases = build_cases(args.sql_count)
+    if args.filter:
+        cases = {name: case for name, case in cases.items() if args.filter in name}
+
+    print(f"Python {platform.python_version()} / {platform.machine()} / {platform.system()}")
+    print(f"{'用例':<34}{'语料':>7}{'ops/sec':>13}{'p50(us)':>11}{'p99(us)':>11}{'分配(B)/次':>13}")
+    print('-' * 89)
+
+    results = {}
+    for name, (func, corpus) in cases.items():
+        result = run_case(func, corpus, args.min_time, args.alloc_samples)
+        results[name] = result
+        print(f"{name:<34}{len(corpus):>7}{result['ops_per_sec']:>13,.0f}{result['p50_us']:>11.1f}"
+              f"{result['p99_us']:>11.1f}{result['alloc_bytes_per_call']:>13,.0f}")
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'system': platform.system(),
+            'sql_count': args.sql_count
+        },
+        'results': results
+    }
+
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n基线已保存: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n对比基线: {args.baseline} ({baseline['meta'].get('created_at')}, Python {baseline['meta'].get('python')})")
+        regressions = compare(results, baseline.get('results', {}), args.threshold)
+
+    if regressions and args.fail_on_regression:
+        print(f"\n发现 {len(regressions)} 个退化用例: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+告警去重/抑制缓存
+
+同一 (实例, 告警类型, 标识符) 在抑制窗口内只告警一次。原先每条候选告警都要查一次
+alert_history 的 MAX(created_at)、每条历史记录单独提交，故障期间一轮采集就是几百次
+监控库往返。这里改为:
+
+- 进程内字典记录每个键的抑制到期时间，判断是否告警只是一次字典查找
+- 启动时从 alert_history 预热最近一个窗口内的记录，重启后不会重复告警
+- 告警历史先放入缓冲区，每轮采集结束(或缓冲区满)时批量写入
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_MINUTES = 30
+# 缓冲的告警历史达到该条数时立即写入
+DEFAULT_FLUSH_SIZE = 100
+# alert_history.alert_identifier 的长度
+_IDENTIFIER_LENGTH = 200
+
+AlertKey = Tuple[int, str, str]
+
+
+def _key(instance_id: int, alert_type: str, identifier) -> AlertKey:
+    return int(instance_id), alert_type, str(identifier)[:_IDENTIFIER_LENGTH]
+
+
+class AlertSuppressionCache:
+    """告警抑制缓存（线程安全）"""
+
+    def __init__(self, interval_minutes: int = DEFAULT_INTERVAL_MINUTES, flush_size: int = DEFAULT_FLUSH_SIZE):
+        self.interval_seconds = interval_minutes * 60
+        self.flush_size = flush_size
+        self._expires: Dict[AlertKey, float] = {}
+        self._pending: List[Tuple] = []
+        self._lock = threading.Lock()
+        self.warmed = False
+
+    def warm(self, cursor) -> int:
+        """从 alert_history 加载抑制窗口内的告警，返回加载的键数"""
+        cursor.execute("""
+            SELECT db_instance_id, alert_type, alert_identifier,
+                   TIMESTAMPDIFF(SECOND, MAX(created_at), NOW()) AS age_seconds
+            FROM alert_history
+            WHERE created_at >= DATE_SUB(NOW(), INTERVAL %s SECOND)
+              AND alert_identifier IS NOT NULL
+            GROUP BY db_instance_id, alert_type, alert_identifier
+        """, (self.interval_seconds,))
+        now = time.time()
+        with self._lock:
+            for row in cursor.fetchall():
+                key = _key(row['db_instance_id'], row['alert_type'], row['alert_identifier'])
+                expires = now - float(row['age_seconds'] or 0) + self.interval_seconds
+                self._expires[key] = max(self._expires.get(key, 0), expires)
+            self.warmed = True
+            return len(self._expires)
+
+    def should_send(self, instance_id: int, alert_type: str, identifier) -> bool:
+        """抑制窗口内已告警过返回False"""
+        expires = self._expires.get(_key(instance_id, alert_type, identifier))
+        return expires is None or expires <= time.time()
+
+    def record(self, instance_id: int, alert_type: str, identifier, level: str, message: str) -> bool:
+        """
+        记录一次已发送的告警: 立即开始抑制，历史记录进入写入缓冲区
+
+        Returns:
+            缓冲区是否已达到 flush_size(调用方应尽快 flush)
+        """
+        key = _key(instance_id, alert_type, identifier)
+        now = time.time()
+        with self._lock:
+            self._expires[key] = now + self.interval_seconds
+            self._pending.append((key[0], alert_type, key[2], level, message))
+            return len(self._pending) >= self.flush_size
+
+    def flush(self, monitor_conn) -> int:
+        """批量写入缓冲的告警历史，返回写入条数(失败时记录放回缓冲区)"""
+        now = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, []
+            # 顺带清理过期的键，字典大小只与窗口内的告警数有关
+            for expired in [k for k, v in self._expires.items() if v <= now]:
+                del self._expires[expired]
+        if not pending:
+            return 0
+        try:
+            with monitor_conn.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO alert_history (
+                        db_instance_id, alert_type, alert_identifier, alert_level, alert_message
+                    ) VALUES (%s, %s, %s, %s, %s)
+                """, pending)
+            monitor_conn.commit()
+            return len(pending)
+        except Exception as e:
+            logger.error(f"批量保存告警历史失败: {e}")
+            try:
+                monitor_conn.rollback()
+            except Exception:
+                pass
+            with self._lock:
+                # 只保留最近的记录，监控库长时间不可用时缓冲区不会无限增长
+                self._pending = (pending + self._pending)[-self.flush_size * 10:]
+            return 0
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
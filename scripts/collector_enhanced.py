@@ -25,6 +25,7 @@ import logging
 import hashlib
 import argparse
 import re
+import threading
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple
@@ -36,6 +37,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.alert import AlertManager, load_alert_config
 from sqlserver_collector import SQLServerCollector, PYODBC_AVAILABLE
+from table_hotness import save_table_hotness
+from deadlock_signature import innodb_deadlock_signature, save_deadlock_signatures
+from plan_cache import get_plan_cache
+from plan_regression import mysql_plan_hash
+from workload_delta import annotate_running_deltas
+from alert_suppression import AlertSuppressionCache
 
 # 配置日志
 logging.basicConfig(
@@ -96,6 +103,19 @@ COLLECT_INTERVAL = 10  # 采集间隔(秒)
 ALERT_THRESHOLD_MINUTES = 1  # 告警阈值(分钟) - 降低到1分钟更及时告警
 MAX_WORKERS = 5  # 并发采集线程数
 
+# 每个实例每轮最多执行的EXPLAIN次数(按运行时长从长到短)
+MAX_EXPLAINS_PER_TICK = 5
+
+# 死锁计数器触发式采集的进程内状态: 实例ID -> 上次看到的死锁计数 / 上次解析的死锁段MD5
+_deadlock_counters: Dict[int, int] = {}
+_deadlock_section_hashes: Dict[int, str] = {}
+_deadlock_state_lock = threading.Lock()
+
+
+def is_explainable(sql: str) -> bool:
+    """只对SELECT语句执行EXPLAIN"""
+    return sql.strip().upper().startswith('SELECT')
+
 
 def get_sql_fingerprint(sql: str) -> str:
     """
@@ -127,6 +147,8 @@ class MySQLCollector:
         self.alert_manager = alert_manager
         self.instance_id = instance_config['id']
         self.instance_name = instance_config.get('db_project', 'Unknown')
+        # check_deadlocks 返回新死锁时待提交的 (死锁计数, 死锁段MD5)，保存成功后才写入进程内状态
+        self.pending_deadlock_state: Optional[Tuple[Optional[int], str]] = None
 
     def connect(self) -> Optional[pymysql.Connection]:
         """连接数据库"""
@@ -145,65 +167,133 @@ class MySQLCollector:
             logger.error(f"连接失败 {self.instance_name}: {e}")
             return None
 
+    # 一次查询取回所有慢会话及其事务和performance_schema指标
+    # events_statements_current 在存储过程等嵌套语句下每个线程可能有多行，先按线程聚合
+    _RUNNING_SQL_ENRICHED_QUERY = """
+    SELECT
+        p.id as session_id,
+        p.user as username,
+        p.host as machine,
+        p.db as database_name,
+        p.command,
+        p.time as elapsed_seconds,
+        p.state,
+        p.info as sql_text,
+        t.trx_id,
+        t.trx_started,
+        t.trx_isolation_level as isolation_level,
+        t.trx_rows_locked,
+        t.trx_rows_modified,
+        e.wait_time_seconds,
+        e.lock_time_seconds,
+        e.rows_examined,
+        e.rows_sent,
+        e.rows_affected
+    FROM information_schema.processlist p
+    LEFT JOIN information_schema.innodb_trx t
+        ON t.trx_mysql_thread_id = p.id
+    LEFT JOIN performance_schema.threads th
+        ON th.processlist_id = p.id
+    LEFT JOIN (
+        SELECT
+            thread_id,
+            SUM(timer_wait)/1000000000000 as wait_time_seconds,
+            SUM(lock_time)/1000000000000 as lock_time_seconds,
+            SUM(rows_examined) as rows_examined,
+            SUM(rows_sent) as rows_sent,
+            SUM(rows_affected) as rows_affected
+        FROM performance_schema.events_statements_current
+        GROUP BY thread_id
+    ) e ON e.thread_id = th.thread_id
+    WHERE p.command != 'Sleep'
+      AND p.time >= %s
+      AND p.info IS NOT NULL
+      AND p.id != CONNECTION_ID()
+    ORDER BY p.time DESC
+    """
+
+    # performance_schema 不可用时退回只查 processlist + innodb_trx
+    _RUNNING_SQL_BASIC_QUERY = """
+    SELECT
+        p.id as session_id,
+        p.user as username,
+        p.host as machine,
+        p.db as database_name,
+        p.command,
+        p.time as elapsed_seconds,
+        p.state,
+        p.info as sql_text,
+        t.trx_id,
+        t.trx_started,
+        t.trx_isolation_level as isolation_level,
+        t.trx_rows_locked,
+        t.trx_rows_modified
+    FROM information_schema.processlist p
+    LEFT JOIN information_schema.innodb_trx t
+        ON t.trx_mysql_thread_id = p.id
+    WHERE p.command != 'Sleep'
+      AND p.time >= %s
+      AND p.info IS NOT NULL
+      AND p.id != CONNECTION_ID()
+    ORDER BY p.time DESC
+    """
+
     def collect_running_queries(self) -> List[Dict]:
-        """采集正在运行的慢SQL"""
+        """
+        采集正在运行的慢SQL
+
+        会话、事务和performance_schema指标由一条集合查询取回；EXPLAIN每轮最多
+        MAX_EXPLAINS_PER_TICK 次，执行计划缓存(plan_cache)中仍有效的指纹不再EXPLAIN。
+        """
         conn = self.connect()
         if not conn:
             return []
 
         try:
             with conn.cursor() as cursor:
-                # 查询正在运行的SQL
-                query = """
-                SELECT
-                    p.id as session_id,
-                    p.user as username,
-                    p.host as machine,
-                    p.db as database_name,
-                    p.command,
-                    p.time as elapsed_seconds,
-                    p.state,
-                    p.info as sql_text,
-                    t.trx_id,
-                    t.trx_started,
-                    t.trx_isolation_level as isolation_level,
-                    t.trx_rows_locked,
-                    t.trx_rows_modified
-                FROM information_schema.processlist p
-                LEFT JOIN information_schema.innodb_trx t
-                    ON t.trx_mysql_thread_id = p.id
-                WHERE p.command != 'Sleep'
-                  AND p.time >= %s
-                  AND p.info IS NOT NULL
-                  AND p.id != CONNECTION_ID()
-                ORDER BY p.time DESC
-                """
-
-                cursor.execute(query, (LONG_SQL_THRESHOLD_SECONDS,))
+                try:
+                    cursor.execute(self._RUNNING_SQL_ENRICHED_QUERY, (LONG_SQL_THRESHOLD_SECONDS,))
+                except pymysql.MySQLError as e:
+                    logger.debug(f"{self.instance_name} - performance_schema不可用，退回processlist查询: {e}")
+                    cursor.execute(self._RUNNING_SQL_BASIC_QUERY, (LONG_SQL_THRESHOLD_SECONDS,))
                 results = cursor.fetchall()
 
                 logger.info(f"查询到 {len(results)} 条运行中的SQL (阈值={LONG_SQL_THRESHOLD_SECONDS}秒)")
 
+                explain_budget = MAX_EXPLAINS_PER_TICK
+                plan_cache = get_plan_cache()
                 slow_sqls = []
                 for row in results:
                     sql_text = row['sql_text'] or ''
-
-                    # 获取执行计划
-                    explain_result = self.get_explain(cursor, sql_text, row.get('database_name'))
-
-                    # 获取性能指标
-                    perf_metrics = self.get_performance_metrics(cursor, row['session_id'])
+                    database_name = row.get('database_name')
+                    sql_fingerprint = get_sql_fingerprint(sql_text)
+
+                    # 获取执行计划（优先缓存，其次在本轮预算内EXPLAIN）
+                    explain_result = None
+                    if is_explainable(sql_text):
+                        cache_key = (self.instance_id, database_name or '', sql_fingerprint, 'TRADITIONAL')
+                        explain_result = plan_cache.get(cache_key, cursor, sql_text)
+                        if explain_result is None and explain_budget > 0:
+                            explain_budget -= 1
+                            explain_result = self.get_explain(cursor, sql_text, database_name)
+                            if explain_result:
+                                plan_cache.put(cache_key, cursor, sql_text, explain_result)
+                    explain_result = explain_result or {}
+
+                    # 性能指标（已随集合查询取回）
+                    perf_metrics = self.get_performance_metrics(row)
 
                     slow_sql = {
                         'db_instance_id': self.instance_id,
                         'session_id': str(row['session_id']),
                         'sql_id': row.get('trx_id', ''),
-                        'sql_fingerprint': get_sql_fingerprint(sql_text),
+                        'sql_fingerprint': sql_fingerprint,
                         'sql_text': sql_text[:4000] if len(sql_text) > 4000 else sql_text,
                         'sql_fulltext': sql_text,
                         'username': row['username'],
                         'machine': row['machine'],
                         'program': row['command'],
+                        'database_name': database_name,
                         'elapsed_seconds': row['elapsed_seconds'] or 0,
                         'elapsed_minutes': (row['elapsed_seconds'] or 0) / 60.0,
                         'status': row['state'] or 'ACTIVE',
@@ -218,12 +308,16 @@ class MySQLCollector:
                         'execution_plan': json.dumps(explain_result.get('plan', []))if explain_result.get('plan') else None,
                         'index_used': explain_result.get('indexes_used', ''),
                         'full_table_scan': 1 if explain_result.get('has_full_scan') else 0,
+                        'plan_hash': mysql_plan_hash(explain_result.get('plan')),
                         'sql_exec_start': row.get('trx_started', datetime.now()),
                         'detect_time': datetime.now()
                     }
 
                     slow_sqls.append(slow_sql)
 
+                if len(results) > MAX_EXPLAINS_PER_TICK and explain_budget == 0:
+                    logger.debug(f"{self.instance_name} - 本轮EXPLAIN已达上限 {MAX_EXPLAINS_PER_TICK}，其余会话沿用缓存或跳过")
+
                 return slow_sqls
 
         except Exception as e:
@@ -232,56 +326,28 @@ class MySQLCollector:
         finally:
             conn.close()
 
-    def get_performance_metrics(self, cursor, session_id: int) -> Dict:
-        """获取会话性能指标（从performance_schema）"""
-        try:
-            # 尝试从performance_schema获取详细性能指标
-            cursor.execute("""
-                SELECT
-                    SUM(timer_wait)/1000000000000 as wait_time_seconds,
-                    SUM(lock_time)/1000000000000 as lock_time_seconds,
-                    SUM(rows_examined) as rows_examined,
-                    SUM(rows_sent) as rows_sent,
-                    SUM(rows_affected) as rows_affected
-                FROM performance_schema.events_statements_current
-                WHERE thread_id = (SELECT thread_id FROM performance_schema.threads WHERE processlist_id = %s)
-            """, (session_id,))
-
-            result = cursor.fetchone()
-
-            if result and result.get('rows_examined'):
-                return {
-                    'cpu_time': 0,  # MySQL不直接提供CPU时间
-                    'wait_time': result.get('wait_time_seconds', 0) or 0,
-                    'logical_reads': 0,  # MySQL没有逻辑读概念
-                    'physical_reads': 0,  # MySQL没有物理读概念
-                    'rows_examined': result.get('rows_examined', 0) or 0,
-                    'rows_sent': result.get('rows_sent', 0) or 0,
-                }
-
-        except Exception as e:
-            logger.debug(f"获取性能指标失败: {e}")
-
+    def get_performance_metrics(self, row: Dict) -> Dict:
+        """从集合查询结果中整理会话性能指标（performance_schema列缺失时为0）"""
         return {
-            'cpu_time': 0,
-            'wait_time': 0,
-            'logical_reads': 0,
-            'physical_reads': 0,
-            'rows_examined': 0,
-            'rows_sent': 0
+            'cpu_time': 0,  # MySQL不直接提供CPU时间
+            'wait_time': row.get('wait_time_seconds') or 0,
+            'logical_reads': 0,  # MySQL没有逻辑读概念
+            'physical_reads': 0,  # MySQL没有物理读概念
+            'rows_examined': row.get('rows_examined') or 0,
+            'rows_sent': row.get('rows_sent') or 0,
         }
 
     def get_explain(self, cursor, sql: str, database: Optional[str]) -> Dict:
         """获取SQL执行计划"""
         try:
+            # 只对SELECT语句执行EXPLAIN
+            if not is_explainable(sql):
+                return {}
+
             # 切换数据库
             if database:
                 cursor.execute(f"USE `{database}`")
 
-            # 只对SELECT语句执行EXPLAIN
-            if not sql.strip().upper().startswith('SELECT'):
-                return {}
-
             cursor.execute(f"EXPLAIN {sql}")
             explain_rows = cursor.fetchall()
 
@@ -321,13 +387,36 @@ class MySQLCollector:
             return {}
 
     def check_deadlocks(self) -> List[Dict]:
-        """检测死锁"""
+        """
+        检测死锁（计数器触发）
+
+        每轮只读取廉价的死锁计数器，计数变化时才执行 SHOW ENGINE INNODB STATUS
+        (输出大且会持有目标库的锁监控mutex)；LATEST DETECTED DEADLOCK 段与上次
+        解析过的相同(MD5一致)时不再重复解析。计数器不可用时退回每轮读取STATUS。
+
+        解析出新死锁时计数和MD5只暂存在 pending_deadlock_state，由调用方在
+        save_deadlocks 成功后调用 commit_deadlock_state 提交；保存失败时下一轮会重新读取。
+        """
+        self.pending_deadlock_state = None
         conn = self.connect()
         if not conn:
             return []
 
         try:
             with conn.cursor() as cursor:
+                deadlock_count = self.get_deadlock_counter(cursor)
+
+                if deadlock_count is not None:
+                    with _deadlock_state_lock:
+                        last_count = _deadlock_counters.get(self.instance_id)
+                    if deadlock_count == 0 or deadlock_count == last_count:
+                        with _deadlock_state_lock:
+                            _deadlock_counters[self.instance_id] = deadlock_count
+                        return []
+                    if last_count is not None and deadlock_count - last_count > 1:
+                        logger.info(f"{self.instance_name} - 距上次检查新增 {deadlock_count - last_count} 次死锁，"
+                                    f"INNODB STATUS 只保留最近一次")
+
                 cursor.execute("SHOW ENGINE INNODB STATUS")
                 result = cursor.fetchone()
 
@@ -335,10 +424,22 @@ class MySQLCollector:
                     return []
 
                 status_text = result.get('Status', '')
+                section = self.extract_deadlock_section(status_text)
+
+                section_hash = hashlib.md5(section.encode('utf-8')).hexdigest() if section else None
+                with _deadlock_state_lock:
+                    is_new = section_hash is not None and _deadlock_section_hashes.get(self.instance_id) != section_hash
+                    if not is_new and deadlock_count is not None:
+                        # 没有需要保存的新死锁，计数可以直接推进
+                        _deadlock_counters[self.instance_id] = deadlock_count
+                if not is_new:
+                    return []
 
                 # 解析死锁信息
-                deadlocks = self.parse_deadlock_from_status(status_text)
-
+                deadlocks = self.parse_deadlock_section(section)
+                self.pending_deadlock_state = (deadlock_count, section_hash)
+                if not deadlocks:
+                    self.commit_deadlock_state()
                 return deadlocks
 
         except Exception as e:
@@ -347,21 +448,66 @@ class MySQLCollector:
         finally:
             conn.close()
 
-    def parse_deadlock_from_status(self, status_text: str) -> List[Dict]:
-        """从INNODB STATUS解析死锁信息"""
-        deadlocks = []
+    def commit_deadlock_state(self):
+        """死锁保存成功后提交 check_deadlocks 暂存的死锁计数和死锁段MD5"""
+        if not self.pending_deadlock_state:
+            return
+        deadlock_count, section_hash = self.pending_deadlock_state
+        with _deadlock_state_lock:
+            if deadlock_count is not None:
+                _deadlock_counters[self.instance_id] = deadlock_count
+            _deadlock_section_hashes[self.instance_id] = section_hash
+        self.pending_deadlock_state = None
+
+    def get_deadlock_counter(self, cursor) -> Optional[int]:
+        """
+        读取累计死锁次数
+
+        优先 SHOW GLOBAL STATUS 的 Innodb_deadlocks (MariaDB / 较新的MySQL)，
+        其次 information_schema.innodb_metrics 的 lock_deadlocks (需处于enabled状态)。
+        都不可用时返回 None。
+        """
+        try:
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_deadlocks'")
+            row = cursor.fetchone()
+            if row and row.get('Value') is not None:
+                return int(row['Value'])
+        except Exception as e:
+            logger.debug(f"{self.instance_name} - 读取Innodb_deadlocks失败: {e}")
+
+        try:
+            cursor.execute("""
+                SELECT `COUNT` AS deadlock_count, `STATUS` AS metric_status
+                FROM information_schema.innodb_metrics
+                WHERE NAME = 'lock_deadlocks'
+            """)
+            row = cursor.fetchone()
+            if row and str(row.get('metric_status', '')).lower() == 'enabled':
+                return int(row['deadlock_count'])
+        except Exception as e:
+            logger.debug(f"{self.instance_name} - 读取innodb_metrics.lock_deadlocks失败: {e}")
 
-        # 查找最近的死锁
+        return None
+
+    def extract_deadlock_section(self, status_text: str) -> Optional[str]:
+        """从INNODB STATUS中截取 LATEST DETECTED DEADLOCK 段"""
         deadlock_match = re.search(
             r'LATEST DETECTED DEADLOCK\s*\n-+\s*\n(.*?)(?=\n-{5,}|\Z)',
             status_text,
             re.DOTALL | re.IGNORECASE
         )
+        return deadlock_match.group(1) if deadlock_match else None
 
-        if not deadlock_match:
-            return deadlocks
+    def parse_deadlock_from_status(self, status_text: str) -> List[Dict]:
+        """从INNODB STATUS解析死锁信息"""
+        section = self.extract_deadlock_section(status_text)
+        if not section:
+            return []
+        return self.parse_deadlock_section(section)
 
-        deadlock_section = deadlock_match.group(1)
+    def parse_deadlock_section(self, deadlock_section: str) -> List[Dict]:
+        """解析 LATEST DETECTED DEADLOCK 段"""
+        deadlocks = []
 
         # 提取时间
         time_match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', deadlock_section)
@@ -389,6 +535,10 @@ class MySQLCollector:
             # 提取第二个事务(阻塞者)的详细信息
             blocker_info = self.extract_transaction_info(deadlock_section, transactions[1][0])
 
+            signature, components = innodb_deadlock_signature(
+                [transactions[0][1].strip(), transactions[1][1].strip()], deadlock_section
+            )
+
             deadlock = {
                 'db_instance_id': self.instance_id,
                 'deadlock_time': deadlock_time or datetime.now(),
@@ -409,6 +559,8 @@ class MySQLCollector:
                 'wait_resource': self.extract_wait_resource(deadlock_section),
                 'lock_mode': self.extract_lock_mode(deadlock_section),
                 'resolved_action': 'ROLLBACK',
+                'deadlock_signature': signature,
+                'signature_components': components,
                 'detect_time': datetime.now()
             }
 
@@ -473,69 +625,54 @@ class MySQLCollector:
         return match.group(1) if match else ''
 
 
-def should_send_alert(monitor_conn: pymysql.Connection, instance_id: int, alert_type: str, identifier: str, interval_minutes: int = 30) -> bool:
-    """
-    检查是否应该发送告警（避免重复告警）
-
-    Args:
-        monitor_conn: 监控数据库连接
-        instance_id: 实例ID
-        alert_type: 告警类型（slow_sql/deadlock）
-        identifier: 标识符（SQL指纹或死锁时间）
-        interval_minutes: 告警间隔（分钟）
-    """
-    try:
-        with monitor_conn.cursor() as cursor:
-            # 查询最近是否发送过相同告警
-            cursor.execute("""
-                SELECT MAX(created_at) as last_alert_time
-                FROM alert_history
-                WHERE db_instance_id = %s
-                  AND alert_type = %s
-                  AND alert_identifier = %s
-                  AND created_at >= DATE_SUB(NOW(), INTERVAL %s MINUTE)
-            """, (instance_id, alert_type, identifier, interval_minutes))
-
-            result = cursor.fetchone()
-            # 如果没有记录或超过间隔时间，则可以发送告警
-            return result['last_alert_time'] is None
-
-    except Exception as e:
-        logger.debug(f"检查告警间隔失败: {e}")
-        return True  # 出错时默认允许发送
+# 告警抑制缓存: 同一 (实例, 类型, 标识符) 30分钟内只告警一次，历史记录每轮批量写入
+ALERT_SUPPRESSION = AlertSuppressionCache(interval_minutes=30)
 
 
-def save_alert_history(monitor_conn: pymysql.Connection, instance_id: int, identifier: str, alert_type: str, level: str, message: str) -> bool:
-    """
-    保存告警历史记录
-
-    Args:
-        monitor_conn: 监控数据库连接
-        instance_id: 实例ID
-        identifier: 标识符（SQL指纹或死锁时间）
-        alert_type: 告警类型（slow_sql/deadlock）
-        level: 告警级别（WARNING/CRITICAL）
-        message: 告警消息
-    """
+def warm_alert_suppression():
+    """首次采集前从 alert_history 预热告警抑制缓存(失败时下一轮重试)"""
+    if ALERT_SUPPRESSION.warmed:
+        return
     try:
-        with monitor_conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO alert_history (
-                    db_instance_id, alert_type, alert_identifier, alert_level, alert_message
-                ) VALUES (%s, %s, %s, %s, %s)
-            """, (instance_id, alert_type, identifier, level, message))
+        conn = pymysql.connect(**MONITOR_DB_CONFIG)
+        try:
+            with conn.cursor() as cursor:
+                count = ALERT_SUPPRESSION.warm(cursor)
+            logger.info(f"告警抑制缓存已预热: {count} 条")
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"预热告警抑制缓存失败: {e}")
 
-            monitor_conn.commit()
-            return True
 
+def flush_alert_history() -> int:
+    """批量写入缓冲的告警历史"""
+    if not ALERT_SUPPRESSION.pending_count():
+        return 0
+    try:
+        conn = pymysql.connect(**MONITOR_DB_CONFIG)
     except Exception as e:
         logger.error(f"保存告警历史失败: {e}")
-        monitor_conn.rollback()
-        return False
+        return 0
+    try:
+        return ALERT_SUPPRESSION.flush(conn)
+    finally:
+        conn.close()
+
+
+def record_alert(instance_id: int, identifier, alert_type: str, level: str, message: str):
+    """记录已发送的告警，缓冲区满时立即写入"""
+    if ALERT_SUPPRESSION.record(instance_id, alert_type, identifier, level, message):
+        flush_alert_history()
 
 
 def save_slow_sqls(slow_sqls: List[Dict], monitor_conn: pymysql.Connection) -> int:
-    """保存慢SQL到监控数据库"""
+    """
+    保存慢SQL到监控数据库
+
+    processlist只能看到超过阈值仍在运行的SQL，无法为执行计划建立基线；
+    计划基线和回归检测由 mysql_perfschema_collector 基于digest增量完成。
+    """
     if not slow_sqls:
         return 0
 
@@ -547,17 +684,18 @@ def save_slow_sqls(slow_sqls: List[Dict], monitor_conn: pymysql.Connection) -> i
                 sql_text, sql_fulltext, username, machine, program,
                 elapsed_seconds, elapsed_minutes, status, isolation_level,
                 rows_examined, rows_sent, execution_plan, index_used,
-                full_table_scan, sql_exec_start, detect_time
+                full_table_scan, plan_hash, sql_exec_start, detect_time
             ) VALUES (
                 %(db_instance_id)s, %(session_id)s, %(sql_id)s, %(sql_fingerprint)s,
                 %(sql_text)s, %(sql_fulltext)s, %(username)s, %(machine)s, %(program)s,
                 %(elapsed_seconds)s, %(elapsed_minutes)s, %(status)s, %(isolation_level)s,
                 %(rows_examined)s, %(rows_sent)s, %(execution_plan)s, %(index_used)s,
-                %(full_table_scan)s, %(sql_exec_start)s, %(detect_time)s
+                %(full_table_scan)s, %(plan_hash)s, %(sql_exec_start)s, %(detect_time)s
             )
             """
 
             cursor.executemany(insert_query, slow_sqls)
+            save_table_hotness(cursor, slow_sqls)
             monitor_conn.commit()
 
             return len(slow_sqls)
@@ -568,14 +706,14 @@ def save_slow_sqls(slow_sqls: List[Dict], monitor_conn: pymysql.Connection) -> i
         return 0
 
 
-def save_deadlocks(deadlocks: List[Dict], monitor_conn: pymysql.Connection) -> int:
-    """保存死锁信息到监控数据库（带去重）"""
+def save_deadlocks(deadlocks: List[Dict], monitor_conn: pymysql.Connection) -> Optional[int]:
+    """保存死锁信息到监控数据库（带去重），新增的死锁累加到签名统计；保存失败返回None"""
     if not deadlocks:
         return 0
 
     try:
         with monitor_conn.cursor() as cursor:
-            saved_count = 0
+            saved = []
 
             for deadlock in deadlocks:
                 # 去重检查：检查是否已存在相同的死锁记录
@@ -602,26 +740,30 @@ def save_deadlocks(deadlocks: List[Dict], monitor_conn: pymysql.Connection) -> i
                     victim_trx_id, victim_session_id, victim_sql,
                     blocker_trx_id, blocker_session_id, blocker_sql,
                     deadlock_graph, wait_resource, lock_mode,
-                    resolved_action, detect_time
+                    resolved_action, deadlock_signature, detect_time
                 ) VALUES (
                     %(db_instance_id)s, %(deadlock_time)s,
                     %(victim_trx_id)s, %(victim_session_id)s, %(victim_sql)s,
                     %(blocker_trx_id)s, %(blocker_session_id)s, %(blocker_sql)s,
                     %(deadlock_graph)s, %(wait_resource)s, %(lock_mode)s,
-                    %(resolved_action)s, %(detect_time)s
+                    %(resolved_action)s, %(deadlock_signature)s, %(detect_time)s
                 )
                 """
 
-                cursor.execute(insert_query, deadlock)
-                saved_count += 1
+                # 签名组成是字典，不能作为SQL参数
+                params = {k: v for k, v in deadlock.items() if k != 'signature_components'}
+                params.setdefault('deadlock_signature', None)
+                cursor.execute(insert_query, params)
+                saved.append(deadlock)
 
+            save_deadlock_signatures(cursor, saved)
             monitor_conn.commit()
-            return saved_count
+            return len(saved)
 
     except Exception as e:
         logger.error(f"保存死锁信息失败: {e}")
         monitor_conn.rollback()
-        return 0
+        return None
 
 
 def collect_from_instance(instance: Dict, alert_manager: Optional[AlertManager]) -> Tuple[int, int]:
@@ -644,23 +786,30 @@ def collect_from_instance(instance: Dict, alert_manager: Optional[AlertManager])
             slow_sqls = collector.collect_running_queries()
             deadlocks = collector.check_deadlocks()
 
+        # 运行中的SQL每轮都会被采到，按 (会话, 指纹, 开始执行时间) 换算成本周期增量
+        annotate_running_deltas(slow_sqls)
+
         # 保存到监控数据库
         monitor_conn = pymysql.connect(**MONITOR_DB_CONFIG)
 
         sql_count = save_slow_sqls(slow_sqls, monitor_conn)
         deadlock_count = save_deadlocks(deadlocks, monitor_conn)
+        if deadlock_count is None:
+            # 保存失败不推进死锁计数/段MD5，下一轮重新读取
+            deadlock_count = 0
+        elif isinstance(collector, MySQLCollector):
+            collector.commit_deadlock_state()
 
         monitor_conn.close()
 
         # 发送告警（带历史记录和间隔控制）
+        # 异步投递时 send_* 只负责入队，返回True即记录告警历史，发送和重试在投递线程中进行
         if alert_manager:
-            monitor_conn_for_alert = pymysql.connect(**MONITOR_DB_CONFIG)
-
             # 慢SQL告警
             for slow_sql in slow_sqls:
                 if slow_sql['elapsed_minutes'] >= ALERT_THRESHOLD_MINUTES:
                     # 检查是否需要发送告警（控制告警间隔）
-                    if should_send_alert(monitor_conn_for_alert, instance['id'], 'slow_sql', slow_sql.get('sql_fingerprint')):
+                    if ALERT_SUPPRESSION.should_send(instance['id'], 'slow_sql', slow_sql.get('sql_fingerprint')):
                         slow_sql_info = {
                             **slow_sql,
                             'instance_name': instance_name,
@@ -671,8 +820,7 @@ def collect_from_instance(instance: Dict, alert_manager: Optional[AlertManager])
                         # 发送告警
                         if alert_manager.send_slow_sql_alert(slow_sql_info, ALERT_THRESHOLD_MINUTES):
                             # 记录告警历史
-                            save_alert_history(
-                                monitor_conn_for_alert,
+                            record_alert(
                                 instance['id'],
                                 slow_sql.get('sql_fingerprint'),
                                 'slow_sql',
@@ -683,7 +831,7 @@ def collect_from_instance(instance: Dict, alert_manager: Optional[AlertManager])
             # 死锁告警(立即发送)
             for deadlock in deadlocks:
                 # 检查是否需要发送告警
-                if should_send_alert(monitor_conn_for_alert, instance['id'], 'deadlock', deadlock.get('deadlock_time')):
+                if ALERT_SUPPRESSION.should_send(instance['id'], 'deadlock', deadlock.get('deadlock_time')):
                     deadlock_info = {
                         **deadlock,
                         'instance_name': instance_name,
@@ -695,8 +843,7 @@ def collect_from_instance(instance: Dict, alert_manager: Optional[AlertManager])
                     # 发送告警
                     if alert_manager.send_deadlock_alert(deadlock_info):
                         # 记录告警历史
-                        save_alert_history(
-                            monitor_conn_for_alert,
+                        record_alert(
                             instance['id'],
                             str(deadlock.get('deadlock_time')),
                             'deadlock',
@@ -704,8 +851,6 @@ def collect_from_instance(instance: Dict, alert_manager: Optional[AlertManager])
                             f"死锁告警: {deadlock.get('victim_sql', '')[:100]}"
                         )
 
-            monitor_conn_for_alert.close()
-
         logger.info(f"采集完成: {instance_name} - 慢SQL:{sql_count}, 死锁:{deadlock_count}")
 
         return sql_count, deadlock_count
@@ -750,6 +895,9 @@ def collect_all(alert_manager: Optional[AlertManager] = None):
 
     logger.info(f"找到 {len(instances)} 个启用的实例")
 
+    if alert_manager:
+        warm_alert_suppression()
+
     total_sqls = 0
     total_deadlocks = 0
 
@@ -769,6 +917,8 @@ def collect_all(alert_manager: Optional[AlertManager] = None):
                 instance = futures[future]
                 logger.error(f"实例采集异常 {instance.get('db_project')}: {e}")
 
+    flush_alert_history()
+
     elapsed = time.time() - start_time
     logger.info(f"采集完成: 总计慢SQL {total_sqls} 条, 死锁 {total_deadlocks} 个, 耗时 {elapsed:.2f}秒")
     logger.info("=" * 60)
@@ -788,20 +938,27 @@ def run_daemon(interval: int = 10, alert_config: Optional[Dict] = None):
     # 初始化告警管理器
     alert_manager = None
     if alert_config:
-        alert_manager = AlertManager(alert_config)
+        alert_manager = AlertManager(alert_config, async_dispatch=True)
         logger.info(f"告警通道已加载: {len(alert_manager.channels)} 个")
 
-    while True:
-        try:
-            collect_all(alert_manager)
-        except KeyboardInterrupt:
-            logger.info("收到停止信号，退出...")
-            break
-        except Exception as e:
-            logger.error(f"采集过程异常: {e}")
-
-        logger.info(f"等待 {interval} 秒后进行下一次采集...")
-        time.sleep(interval)
+    try:
+        while True:
+            try:
+                collect_all(alert_manager)
+            except KeyboardInterrupt:
+                logger.info("收到停止信号，退出...")
+                break
+            except Exception as e:
+                logger.error(f"采集过程异常: {e}")
+
+            logger.info(f"等待 {interval} 秒后进行下一次采集...")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("收到停止信号，退出...")
+    finally:
+        # 发出未结束窗口的慢SQL汇总，并等待投递队列发完
+        if alert_manager:
+            alert_manager.flush()
 
 
 def main():
@@ -830,7 +987,11 @@ def main():
     if args.daemon:
         run_daemon(args.interval, alert_config)
     else:
-        collect_all(AlertManager(alert_config) if alert_config else None)
+        alert_manager = AlertManager(alert_config, async_dispatch=True) if alert_config else None
+        collect_all(alert_manager)
+        if alert_manager:
+            # 单次运行: 退出前等待投递队列发完
+            alert_manager.flush()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+死锁签名与重复死锁聚合
+
+同一对语句在同一个索引上反复死锁时，deadlock_log 里只是一条条孤立的记录。
+这里为每个死锁计算一个与时间、会话、事务ID无关的签名:
+    参与者SQL指纹(及其请求的锁模式) + 锁资源(类型/对象/索引/锁模式)
+排序后做MD5，参与者顺序不同的同一类死锁得到相同签名。
+
+入库时按 (实例, 签名, 小时) 累加到 deadlock_signature_stats，
+/api/deadlocks?group_by=signature 直接按聚合表回答"哪类死锁最频繁"。
+"""
+
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from scripts.sql_fingerprint import SQLFingerprint
+except ImportError:
+    from sql_fingerprint import SQLFingerprint
+
+logger = logging.getLogger(__name__)
+
+# INNODB STATUS 中的锁描述，例如:
+# RECORD LOCKS space id 58 page no 3 n bits 72 index PRIMARY of table `shop`.`orders` trx id 1234 lock_mode X locks rec but not gap
+_INNODB_LOCK_PATTERN = re.compile(
+    r'(RECORD|TABLE) LOCKS?\b[^\n]*?(?:index\s+`?(\w+)`?\s+)?of table\s+`([^`]+)`\.`([^`]+)`'
+    r'[^\n]*?lock[_ ]mode\s+(\w+(?:-\w+)?(?: locks (?:rec but not gap|gap before rec))?)',
+    re.IGNORECASE
+)
+
+
+def _normalize_name(name: Optional[str]) -> str:
+    return (name or '').replace('[', '').replace(']', '').replace('`', '').strip().lower()
+
+
+def deadlock_signature(participants: Iterable[Tuple[str, Optional[str]]],
+                       resources: Iterable[Tuple[str, str, str, str]]) -> Tuple[str, Dict]:
+    """
+    计算死锁签名
+
+    Args:
+        participants: [(sql_text, 请求的锁模式)]
+        resources: [(资源类型, 对象名, 索引名, 锁模式)]
+
+    Returns:
+        (32位签名, 签名组成 {'fingerprints': [...], 'resources': [...]})
+    """
+    fingerprints = sorted(
+        f"{SQLFingerprint.generate(sql_text) if sql_text else '-'}:{(lock_mode or '').upper()}"
+        for sql_text, lock_mode in participants
+    )
+    resource_keys = sorted({
+        '|'.join((_normalize_name(resource_type), _normalize_name(object_name),
+                  _normalize_name(index_name), (mode or '').upper()))
+        for resource_type, object_name, index_name, mode in resources
+    })
+
+    components = {'fingerprints': fingerprints, 'resources': resource_keys}
+    signature = hashlib.md5(json.dumps(components, sort_keys=True).encode('utf-8')).hexdigest()
+    return signature, components
+
+
+def sqlserver_deadlock_signature(deadlock_info: Dict) -> Tuple[str, Dict]:
+    """由 xml_stream.extract_deadlock_graph 的结果计算签名"""
+    participants = [(proc.get('sql_text'), proc.get('lock_mode'))
+                    for proc in deadlock_info.get('process_list', [])]
+    resources = [(res.get('resource_type'), res.get('object_name'), res.get('index_name'), res.get('mode'))
+                 for res in deadlock_info.get('resource_list', [])]
+    return deadlock_signature(participants, resources)
+
+
+def innodb_deadlock_signature(sql_texts: List[str], deadlock_section: str) -> Tuple[str, Dict]:
+    """由 INNODB STATUS 的 LATEST DETECTED DEADLOCK 段计算签名"""
+    resources = [(lock_type, f"{schema}.{table}", index_name, mode)
+                 for lock_type, index_name, schema, table, mode in _INNODB_LOCK_PATTERN.findall(deadlock_section)]
+    return deadlock_signature([(sql_text, None) for sql_text in sql_texts], resources)
+
+
+def save_deadlock_signatures(cursor, deadlocks: List[Dict]) -> int:
+    """
+    累加死锁签名统计（在调用方的事务中执行，由调用方提交）
+
+    Args:
+        cursor: 监控库游标
+        deadlocks: 本次新入库的死锁，需含 db_instance_id / deadlock_signature /
+                   signature_components / deadlock_time，可选 victim_sql
+
+    Returns:
+        更新的 (签名, 小时) 行数
+    """
+    stat_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    stats: Dict[Tuple, Dict] = {}
+
+    for deadlock in deadlocks:
+        signature = deadlock.get('deadlock_signature')
+        if not signature:
+            continue
+        key = (deadlock['db_instance_id'], signature, stat_hour)
+        deadlock_time = deadlock.get('deadlock_time')
+        if isinstance(deadlock_time, str):
+            deadlock_time = datetime.strptime(deadlock_time, '%Y-%m-%d %H:%M:%S')
+        deadlock_time = deadlock_time or datetime.now()
+
+        entry = stats.get(key)
+        if entry is None:
+            components = deadlock.get('signature_components') or {}
+            stats[key] = {
+                'count': 1,
+                'first_seen': deadlock_time,
+                'last_seen': deadlock_time,
+                'fingerprints': ','.join(components.get('fingerprints', []))[:1000],
+                'resources': json.dumps(components.get('resources', []), ensure_ascii=False),
+                'sample_sql': (deadlock.get('victim_sql') or '')[:2000]
+            }
+        else:
+            entry['count'] += 1
+            entry['first_seen'] = min(entry['first_seen'], deadlock_time)
+            entry['last_seen'] = max(entry['last_seen'], deadlock_time)
+
+    if not stats:
+        return 0
+
+    try:
+        cursor.executemany("""
+            INSERT INTO deadlock_signature_stats
+            (db_instance_id, deadlock_signature, stat_hour, deadlock_count,
+             first_seen, last_seen, sql_fingerprints, lock_resources, sample_sql)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                deadlock_count = deadlock_count + VALUES(deadlock_count),
+                first_seen = LEAST(first_seen, VALUES(first_seen)),
+                last_seen = GREATEST(last_seen, VALUES(last_seen))
+        """, [key + (entry['count'], entry['first_seen'], entry['last_seen'],
+                     entry['fingerprints'], entry['resources'], entry['sample_sql'])
+              for key, entry in stats.items()])
+        return len(stats)
+    except Exception as e:
+        logger.warning(f"更新死锁签名统计失败: {e}")
+        return 0
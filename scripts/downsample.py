@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+趋势序列降采样 (Largest-Triangle-Three-Buckets)
+
+一周的1分钟数据有一万多个点，浏览器逐点绘制既慢又看不出差别。LTTB 把序列分成
+max_points - 2 个桶，首尾点保留，每个桶里选出与"上一个选中点"和"下一个桶平均点"
+构成三角形面积最大的点，因此尖峰、低谷这类视觉特征会被保留下来。
+
+安装了 NumPy 时桶内面积计算向量化，否则使用纯Python实现，两者选点结果一致。
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 降采样至少保留首、中、尾三个点(LTTB 至少需要一个桶)
+MIN_POINTS = 3
+
+# 桶内循环的单次NumPy调用有固定开销，实测约4万点以下纯Python更快
+_NUMPY_MIN_POINTS = 40000
+
+
+def _bucket_bounds(n: int, threshold: int) -> List[int]:
+    """中间 n-2 个点分成 threshold-2 个桶，返回各桶起点(最后一个元素为结束位置)"""
+    every = (n - 2) / (threshold - 2)
+    return [int(math.floor(i * every)) + 1 for i in range(threshold - 2)] + [n - 1]
+
+
+def _lttb_python(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    n = len(xs)
+    bounds = _bucket_bounds(n, threshold)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        # 下一个桶的平均点(最后一个桶的下一个是末点)
+        next_start, next_end = end, (bounds[i + 2] if i + 2 < len(bounds) else n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def _lttb_numpy(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    n = len(x)
+    bounds = _bucket_bounds(n, threshold)
+
+    # 每个桶对应的"下一个桶"平均点一次算好
+    edges = np.asarray(bounds[1:] + [n])
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    next_start, next_end = edges[:-1], edges[1:]
+    counts = next_end - next_start
+    avg_x = (cum_x[next_end] - cum_x[next_start]) / counts
+    avg_y = (cum_y[next_end] - cum_y[next_start]) / counts
+
+    # 面积 |(ax-avg_x)(y-ay) - (ax-x)(avg_y-ay)| 展开为 |p*y + q*x + r|，系数用Python标量计算
+    avg_x, avg_y = avg_x.tolist(), avg_y.tolist()
+    xs_list, ys_list = x.tolist(), y.tolist()
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        ax, ay = xs_list[a], ys_list[a]
+        p, q = ax - avg_x[i], avg_y[i] - ay
+        areas = np.abs(p * y[start:end] + q * x[start:end] - (p * ay + q * ax))
+        a = start + int(areas.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], max_points: int) -> List[int]:
+    """
+    LTTB 降采样，返回选中点的下标(升序)
+
+    Args:
+        xs: 横坐标(单调递增)
+        ys: 纵坐标，NaN/None 在选点时按0处理
+        max_points: 最多保留的点数；点数不超过时原样返回，小于3(含0和负数)时只保留首尾两点
+    """
+    n = len(xs)
+    if max_points is None or max_points >= n or n <= 2:
+        return list(range(n))
+    if max_points < MIN_POINTS:
+        return [0, n - 1]
+
+    ys = [0.0 if v is None or v != v else v for v in ys]
+    if NUMPY_AVAILABLE and n >= _NUMPY_MIN_POINTS:
+        return _lttb_numpy(xs, ys, max_points)
+    return _lttb_python(xs, ys, max_points)
+
+
+def downsample_points(points: List[Dict], max_points: Optional[int],
+                      x_key: str = 'timestamp', y_key: str = 'value') -> List[Dict]:
+    """
+    对 [{'timestamp': ts, 'value': v}, ...] 形式的序列降采样
+
+    x_key 为 None 时按下标作为横坐标(等间隔的聚合结果，如按小时分组的统计)。
+    max_points 为空时不降采样，小于3时按3处理。
+    """
+    if max_points is None or len(points) <= max_points:
+        return points
+    max_points = max(max_points, MIN_POINTS)
+    if len(points) <= max_points:
+        return points
+    xs = [float(p[x_key]) for p in points] if x_key else list(range(len(points)))
+    ys = [float(p[y_key]) if p.get(y_key) is not None else None for p in points]
+    return [points[i] for i in lttb_indices(xs, ys, max_points)]
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量执行计划分析引擎
+
+把近期未分析过的慢SQL按实例分组:
+- 每个实例只建立一个目标库连接，实例之间并行
+- 执行计划缓存(plan_cache)命中的指纹不再EXPLAIN
+- 每个实例分析完后，用一个监控库连接批量写入 sql_execution_plan 和 index_suggestion
+
+分析以后台任务运行，HTTP请求只负责提交任务和查询进度。
+"""
+
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import pymysql
+
+try:
+    from scripts.sql_fingerprint import SQLFingerprint
+    from scripts.sql_explain_analyzer import SQLExplainAnalyzer
+    from scripts.plan_cache import get_plan_cache
+except ImportError:
+    from sql_fingerprint import SQLFingerprint
+    from sql_explain_analyzer import SQLExplainAnalyzer
+    from plan_cache import get_plan_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+# 内存中保留的任务数(最早的已结束任务先淘汰)
+MAX_KEPT_JOBS = 20
+# 任务结果中保留的逐条明细数
+MAX_RESULT_DETAILS = 500
+
+_jobs: 'OrderedDict[str, BatchExplainJob]' = OrderedDict()
+_jobs_lock = threading.Lock()
+_job_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-explain')
+
+
+def connect_target(instance: Dict):
+    """连接目标库；未指定库名时MySQL连接information_schema，SQL Server连接master"""
+    db_name = instance.get('db_name') or ('information_schema' if instance['db_type'] == 'MySQL' else 'master')
+    conn = pymysql.connect(
+        host=instance['db_ip'],
+        port=instance['db_port'],
+        user=instance['db_user'],
+        password=instance['db_password'],
+        database=db_name,
+        charset='utf8mb4',
+        connect_timeout=5,
+        cursorclass=pymysql.cursors.DictCursor
+    )
+    return conn, db_name
+
+
+class BatchExplainJob:
+    """一次批量分析任务"""
+
+    def __init__(self, hours: int, limit: int, max_workers: int):
+        self.job_id = uuid.uuid4().hex[:16]
+        self.hours = hours
+        self.limit = limit
+        self.max_workers = max_workers
+        self.status = 'pending'
+        self.error = None
+        self.total = 0
+        self.analyzed = 0
+        self.cached = 0
+        self.failed = 0
+        self.saved_plans = 0
+        self.saved_suggestions = 0
+        self.instances: Dict[int, Dict] = {}
+        self.results: List[Dict] = []
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def record(self, instance_id: int, sql_row: Dict, result: Dict):
+        """记录单条SQL的分析结果"""
+        with self._lock:
+            progress = self.instances[instance_id]
+            progress['done'] += 1
+            if result.get('success'):
+                self.analyzed += 1
+                if result.get('plan_cached'):
+                    self.cached += 1
+                detail = {
+                    'sql_id': sql_row['id'],
+                    'fingerprint': sql_row['sql_fingerprint'],
+                    'status': 'success',
+                    'cached': bool(result.get('plan_cached')),
+                    'issues_count': len(result.get('issues', []))
+                }
+            else:
+                self.failed += 1
+                progress['failed'] += 1
+                detail = {
+                    'sql_id': sql_row['id'],
+                    'fingerprint': sql_row['sql_fingerprint'],
+                    'status': 'failed',
+                    'error': result.get('error')
+                }
+            if len(self.results) < MAX_RESULT_DETAILS:
+                self.results.append(detail)
+
+    def to_dict(self, include_results: bool = True) -> Dict:
+        with self._lock:
+            done = self.analyzed + self.failed
+            data = {
+                'job_id': self.job_id,
+                'status': self.status,
+                'error': self.error,
+                'hours': self.hours,
+                'limit': self.limit,
+                'total': self.total,
+                'done': done,
+                'progress': round(done / self.total * 100, 1) if self.total else (100.0 if self.finished else 0.0),
+                'analyzed': self.analyzed,
+                'cached': self.cached,
+                'failed': self.failed,
+                'saved_plans': self.saved_plans,
+                'saved_suggestions': self.saved_suggestions,
+                'instances': list(self.instances.values()),
+                'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+                'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+            }
+            if include_results:
+                data['results'] = list(self.results)
+            return data
+
+
+class BatchExplainEngine:
+    """按实例分组、连接复用、实例间并行的批量分析引擎"""
+
+    def __init__(self, monitor_conn_factory: Callable,
+                 target_conn_factory: Callable = connect_target, plan_cache=None):
+        """
+        Args:
+            monitor_conn_factory: 返回监控库连接的函数
+            target_conn_factory: instance -> (目标库连接, 默认库名)
+            plan_cache: 执行计划缓存，默认使用进程内共享缓存
+        """
+        self.monitor_conn_factory = monitor_conn_factory
+        self.target_conn_factory = target_conn_factory
+        self.plan_cache = plan_cache or get_plan_cache(monitor_conn_factory)
+
+    def load_pending_sqls(self, hours: int, limit: int) -> List[Dict]:
+        """取近期未分析过执行计划的慢SQL（每个指纹取耗时最长的一条）"""
+        conn = self.monitor_conn_factory()
+        if not conn:
+            raise RuntimeError('数据库连接失败')
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT l.id, l.sql_text, l.sql_fingerprint, l.db_instance_id, l.elapsed_seconds
+                    FROM long_running_sql_log l
+                    LEFT JOIN sql_execution_plan p ON l.sql_fingerprint = p.sql_fingerprint
+                    WHERE l.detect_time >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+                      AND l.elapsed_seconds > 1
+                      AND p.id IS NULL
+                    ORDER BY l.elapsed_seconds DESC
+                    LIMIT %s
+                """, (hours, limit * 4))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        pending = []
+        seen = set()
+        for row in rows:
+            key = (row['db_instance_id'], row['sql_fingerprint'])
+            if key in seen or not row.get('sql_text'):
+                continue
+            seen.add(key)
+            pending.append(row)
+            if len(pending) >= limit:
+                break
+        return pending
+
+    def load_instances(self, instance_ids: List[int]) -> Dict[int, Dict]:
+        if not instance_ids:
+            return {}
+        conn = self.monitor_conn_factory()
+        if not conn:
+            raise RuntimeError('数据库连接失败')
+        try:
+            with conn.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(instance_ids))
+                cursor.execute(f"SELECT * FROM db_instance_info WHERE id IN ({placeholders})", instance_ids)
+                return {row['id']: row for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def run(self, job: BatchExplainJob):
+        """执行任务（在后台线程中调用）"""
+        job.status = 'running'
+        job.started_at = datetime.now()
+        started = time.time()
+        try:
+            sql_rows = self.load_pending_sqls(job.hours, job.limit)
+            grouped: Dict[int, List[Dict]] = {}
+            for row in sql_rows:
+                grouped.setdefault(row['db_instance_id'], []).append(row)
+            instances = self.load_instances(list(grouped))
+
+            with job._lock:
+                job.total = len(sql_rows)
+                for instance_id, rows in grouped.items():
+                    instance = instances.get(instance_id) or {}
+                    job.instances[instance_id] = {
+                        'instance_id': instance_id,
+                        'instance_name': instance.get('instance_name') or instance.get('db_project'),
+                        'total': len(rows), 'done': 0, 'failed': 0, 'status': 'pending'
+                    }
+
+            if grouped:
+                workers = max(1, min(job.max_workers, len(grouped)))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-explain-instance') as pool:
+                    futures = [pool.submit(self._run_instance, job, instances.get(instance_id), instance_id, rows)
+                               for instance_id, rows in grouped.items()]
+                    for future in futures:
+                        future.result()
+
+            job.status = 'completed'
+            logger.info(f"批量执行计划分析完成 {job.job_id}: 共{job.total}条, 成功{job.analyzed}(缓存{job.cached}), "
+                        f"失败{job.failed}, 耗时{time.time() - started:.1f}秒")
+        except Exception as e:
+            logger.error(f"批量执行计划分析失败 {job.job_id}: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.now()
+
+    def _run_instance(self, job: BatchExplainJob, instance: Optional[Dict], instance_id: int, sql_rows: List[Dict]):
+        """分析单个实例的全部SQL（复用一个目标库连接），结束后批量保存"""
+        progress = job.instances[instance_id]
+        progress['status'] = 'running'
+
+        if not instance:
+            for row in sql_rows:
+                job.record(instance_id, row, {'success': False, 'error': '实例不存在'})
+            progress['status'] = 'failed'
+            return
+
+        try:
+            target_conn, db_name = self.target_conn_factory(instance)
+        except Exception as e:
+            for row in sql_rows:
+                job.record(instance_id, row, {'success': False, 'error': f'连接目标库失败: {e}'})
+            progress['status'] = 'failed'
+            return
+
+        analyzed = []
+        try:
+            analyzer = SQLExplainAnalyzer(target_conn, instance_id=instance_id, schema=db_name,
+                                          plan_cache=self.plan_cache)
+            for row in sql_rows:
+                try:
+                    result = analyzer.analyze_sql(row['sql_text'], instance['db_type'])
+                except Exception as e:
+                    result = {'success': False, 'error': str(e)}
+                job.record(instance_id, row, result)
+                if result.get('success') and not result.get('plan_cached'):
+                    analyzed.append((row, result))
+        finally:
+            target_conn.close()
+
+        plans, suggestions = self.save_results(instance_id, db_name, analyzed)
+        with job._lock:
+            job.saved_plans += plans
+            job.saved_suggestions += suggestions
+        progress['status'] = 'completed'
+
+    def save_results(self, instance_id: int, schema_name: str, analyzed: List) -> tuple:
+        """
+        批量保存执行计划和索引建议
+
+        Returns:
+            (保存的计划数, 保存的索引建议数)
+        """
+        if not analyzed:
+            return 0, 0
+
+        plan_rows = []
+        suggestion_rows = []
+        for row, result in analyzed:
+            fingerprint = row.get('sql_fingerprint') or SQLFingerprint.generate(row['sql_text'])
+            issues = result.get('issues', [])
+            plan_rows.append((
+                fingerprint, row['id'], instance_id, schema_name,
+                json.dumps(result.get('plan_json', {})),
+                1 if result.get('has_full_scan') else 0,
+                1 if result.get('has_temp_table') else 0,
+                1 if result.get('has_filesort') else 0,
+                sum(i.get('rows', 0) for i in issues),
+                json.dumps(issues),
+                json.dumps(result['table_versions']) if result.get('table_versions') is not None else None,
+                result.get('plan_hash')
+            ))
+            for suggestion in result.get('index_suggestions', []):
+                suggestion_rows.append((
+                    fingerprint, instance_id, schema_name,
+                    suggestion.get('table', ''),
+                    ','.join(suggestion.get('columns', [])),
+                    suggestion.get('create_statement', ''),
+                    80.0 if suggestion.get('type') == 'CREATE_INDEX' else 60.0
+                ))
+
+        conn = self.monitor_conn_factory()
+        if not conn:
+            logger.error(f"保存批量分析结果失败: 数据库连接失败 (实例 {instance_id})")
+            return 0, 0
+        try:
+            with conn.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO sql_execution_plan (
+                        sql_fingerprint, longsql_id, db_instance_id, schema_name,
+                        plan_json, has_full_scan, has_temp_table, has_filesort,
+                        estimated_rows, analysis_result, table_versions, plan_hash
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, plan_rows)
+                if suggestion_rows:
+                    cursor.executemany("""
+                        INSERT INTO index_suggestion (
+                            sql_fingerprint, db_instance_id, schema_name,
+                            table_name, suggested_columns,
+                            create_statement, benefit_score
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """, suggestion_rows)
+            conn.commit()
+            return len(plan_rows), len(suggestion_rows)
+        except Exception as e:
+            logger.error(f"保存批量分析结果失败 (实例 {instance_id}): {e}")
+            conn.rollback()
+            return 0, 0
+        finally:
+            conn.close()
+
+
+def start_batch_job(monitor_conn_factory: Callable, hours: int = 24, limit: int = 50,
+                    max_workers: int = DEFAULT_MAX_WORKERS) -> tuple:
+    """
+    提交批量分析任务；已有任务在运行时直接返回该任务
+
+    Returns:
+        (任务, 是否新提交)
+    """
+    with _jobs_lock:
+        for job in _jobs.values():
+            if not job.finished:
+                return job, False
+
+        job = BatchExplainJob(hours, limit, max_workers)
+        _jobs[job.job_id] = job
+        while len(_jobs) > MAX_KEPT_JOBS:
+            oldest_id = next((job_id for job_id, j in _jobs.items() if j.finished), None)
+            if oldest_id is None:
+                break
+            del _jobs[oldest_id]
+
+    engine = BatchExplainEngine(monitor_conn_factory)
+    _job_runner.submit(engine.run, job)
+    return job, True
+
+
+def get_batch_job(job_id: str) -> Optional[BatchExplainJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_batch_jobs() -> List[BatchExplainJob]:
+    with _jobs_lock:
+        return list(reversed(_jobs.values()))
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时Top SQL (Heavy Hitters) 跟踪器
+
+采集器每次拿到SQL指纹的执行次数/耗时就喂给跟踪器，接口可以直接读出
+"当前哪些SQL形态压力最大"，不再需要去聚合原始日志表。
+
+实现:
+- Space-Saving 算法: 每个窗口只保留固定数量的计数器，内存有界，
+  保证真实Top-K一定在其中，计数的高估上界记录在 error 字段
+- 前向衰减(forward decay): 权重按 exp((t - landmark) / tau) 放大后累加，
+  读取时再统一缩小，1分钟/5分钟/1小时三个窗口只是tau不同
+- 同时维护按执行次数(count)和按执行耗时(time)加权的两套计数
+- 两次写入之间的读取直接复用排好序的快照，耗时O(k)
+
+性能视图里的累计值(Performance Schema / Query Store)通过 observe_cumulative
+转成增量；processlist / DMV 的运行中快照通过 observe_running 去重。
+"""
+
+import math
+import time
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 衰减窗口: 名称 -> 时间常数(秒)
+DECAY_WINDOWS = {
+    '1m': 60,
+    '5m': 300,
+    '1h': 3600
+}
+
+WEIGHT_TYPES = ('count', 'time')
+
+# 每个窗口/权重保留的计数器数量
+DEFAULT_CAPACITY = 1000
+
+# 累计值/运行中会话的状态条目上限
+DEFAULT_STATE_LIMIT = 50000
+
+# 样例SQL最大保留长度
+SAMPLE_MAX_LENGTH = 500
+
+# 前向衰减指数超过该值时重置landmark，防止浮点溢出
+_RESCALE_EXPONENT = 30.0
+
+
+class SpaceSavingCounter:
+    """带前向衰减的Space-Saving计数器"""
+
+    def __init__(self, capacity: int, tau: float):
+        self.capacity = capacity
+        self.tau = tau
+        self.landmark = time.time()
+        # key -> [计数, 高估上界, 样例SQL]
+        self._counters: Dict[str, list] = {}
+        # 最小堆 (计数, key)，计数变化后旧条目惰性失效
+        self._heap: List[Tuple[float, str]] = []
+        self._version = 0
+        self._snapshot: List[Tuple[str, float, float, Optional[str]]] = []
+        self._snapshot_version = -1
+
+    def _rescale(self, now: float):
+        """把所有计数换算到新的landmark"""
+        factor = math.exp(-(now - self.landmark) / self.tau)
+        for entry in self._counters.values():
+            entry[0] *= factor
+            entry[1] *= factor
+        self.landmark = now
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(entry[0], key) for key, entry in self._counters.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[float, str]:
+        """弹出当前计数最小的有效条目"""
+        while True:
+            count, key = heapq.heappop(self._heap)
+            entry = self._counters.get(key)
+            if entry is not None and entry[0] == count:
+                return count, key
+
+    def add(self, key: str, weight: float, now: float, sample: Optional[str] = None):
+        """累加一次观测"""
+        if weight <= 0:
+            return
+
+        if (now - self.landmark) / self.tau > _RESCALE_EXPONENT:
+            self._rescale(now)
+
+        value = weight * math.exp((now - self.landmark) / self.tau)
+        entry = self._counters.get(key)
+
+        if entry is not None:
+            entry[0] += value
+            if sample:
+                entry[2] = sample
+        elif len(self._counters) < self.capacity:
+            entry = [value, 0.0, sample]
+            self._counters[key] = entry
+        else:
+            # 替换计数最小的条目，新条目继承其计数作为高估上界
+            min_count, min_key = self._pop_min()
+            evicted = self._counters.pop(min_key)
+            entry = [min_count + value, min_count, sample or evicted[2]]
+            self._counters[key] = entry
+
+        heapq.heappush(self._heap, (entry[0], key))
+        if len(self._heap) > self.capacity * 4:
+            self._rebuild_heap()
+        self._version += 1
+
+    def top(self, k: int, now: float) -> List[Dict]:
+        """返回衰减后的Top-K"""
+        if self._snapshot_version != self._version or len(self._snapshot) < min(k, len(self._counters)):
+            ranked = heapq.nlargest(k, self._counters.items(), key=lambda item: item[1][0])
+            self._snapshot = [(key, entry[0], entry[1], entry[2]) for key, entry in ranked]
+            self._snapshot_version = self._version
+
+        factor = math.exp(-(now - self.landmark) / self.tau)
+        return [
+            {
+                'fingerprint': key,
+                'weight': count * factor,
+                'error': error * factor,
+                'rate_per_sec': count * factor / self.tau,
+                'sample_sql': sample
+            }
+            for key, count, error, sample in self._snapshot[:k]
+        ]
+
+    def __len__(self):
+        return len(self._counters)
+
+
+class HeavyHittersTracker:
+    """多窗口、多权重的实时Top SQL跟踪器（线程安全）"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, state_limit: int = DEFAULT_STATE_LIMIT):
+        self.started_at = time.time()
+        self.state_limit = state_limit
+        self._lock = threading.Lock()
+        self._summaries = {
+            (window, weight_type): SpaceSavingCounter(capacity, tau)
+            for window, tau in DECAY_WINDOWS.items()
+            for weight_type in WEIGHT_TYPES
+        }
+        # (instance_id, counter_key) -> (累计次数, 累计耗时)
+        self._cumulative: OrderedDict = OrderedDict()
+        # (instance_id, session_id, fingerprint) -> 上次看到的已运行秒数
+        self._running: OrderedDict = OrderedDict()
+
+    def _remember(self, state: OrderedDict, key, value):
+        """写入有界LRU状态"""
+        state[key] = value
+        state.move_to_end(key)
+        while len(state) > self.state_limit:
+            state.popitem(last=False)
+
+    def _observe_locked(self, fingerprint: str, count: float, elapsed: float,
+                        sample: Optional[str], now: float):
+        if sample:
+            sample = sample[:SAMPLE_MAX_LENGTH]
+        for (window, weight_type), summary in self._summaries.items():
+            summary.add(fingerprint, count if weight_type == 'count' else elapsed, now, sample)
+
+    def observe(self, fingerprint: str, count: float = 1, elapsed_seconds: float = 0,
+                sample: Optional[str] = None, now: Optional[float] = None):
+        """
+        记录一次指纹观测
+
+        Args:
+            fingerprint: SQL指纹
+            count: 执行次数增量
+            elapsed_seconds: 执行耗时增量(秒)
+            sample: 样例SQL
+            now: 观测时间戳，默认当前时间
+        """
+        if not fingerprint:
+            return
+        with self._lock:
+            self._observe_locked(fingerprint, count, elapsed_seconds, sample, now or time.time())
+
+    def observe_cumulative(self, instance_id, fingerprint: str, count_total: float, time_total: float,
+                           sample: Optional[str] = None, counter_key: Optional[str] = None,
+                           baseline_on_first: bool = True, now: Optional[float] = None):
+        """
+        记录累计型计数器(如 events_statements_summary_by_digest)，内部换算成增量
+
+        Args:
+            instance_id: 实例ID
+            fingerprint: SQL指纹
+            count_total: 累计执行次数
+            time_total: 累计执行耗时(秒)
+            sample: 样例SQL
+            counter_key: 累计值所属的计数器标识，默认等于指纹
+            baseline_on_first: 首次看到时只记录基线(累计值包含历史数据时应为True)
+            now: 观测时间戳
+        """
+        if not fingerprint:
+            return
+        state_key = (instance_id, counter_key or fingerprint)
+        with self._lock:
+            previous = self._cumulative.get(state_key)
+            self._remember(self._cumulative, state_key, (count_total, time_total))
+
+            if previous is None:
+                if baseline_on_first:
+                    return
+                delta_count, delta_time = count_total, time_total
+            elif count_total < previous[0] or time_total < previous[1]:
+                # 计数器被重置(TRUNCATE / 实例重启)
+                delta_count, delta_time = count_total, time_total
+            else:
+                delta_count, delta_time = count_total - previous[0], time_total - previous[1]
+
+            if delta_count > 0 or delta_time > 0:
+                self._observe_locked(fingerprint, delta_count, delta_time, sample, now or time.time())
+
+    def observe_running(self, instance_id, session_id, fingerprint: str, elapsed_seconds: float,
+                        sample: Optional[str] = None, now: Optional[float] = None):
+        """
+        记录processlist/DMV中正在运行的SQL
+
+        同一会话上的同一条SQL在多次快照中只计一次执行，耗时按两次快照的差值累加
+        """
+        if not fingerprint:
+            return
+        state_key = (instance_id, session_id, fingerprint)
+        with self._lock:
+            previous = self._running.get(state_key)
+            self._remember(self._running, state_key, elapsed_seconds)
+
+            if previous is None or elapsed_seconds < previous:
+                delta_count, delta_time = 1, elapsed_seconds
+            else:
+                delta_count, delta_time = 0, elapsed_seconds - previous
+
+            self._observe_locked(fingerprint, delta_count, delta_time, sample, now or time.time())
+
+    def top(self, window: str = '5m', k: int = 20, weight: str = 'count') -> List[Dict]:
+        """
+        读取Top-K
+
+        Args:
+            window: 衰减窗口 1m / 5m / 1h
+            k: 返回条数
+            weight: count(按执行次数) / time(按执行耗时)
+        """
+        if window not in DECAY_WINDOWS:
+            raise ValueError(f"不支持的窗口: {window}")
+        if weight not in WEIGHT_TYPES:
+            raise ValueError(f"不支持的权重: {weight}")
+        with self._lock:
+            return self._summaries[(window, weight)].top(k, time.time())
+
+    def size(self) -> Dict[str, int]:
+        """当前跟踪的条目数"""
+        with self._lock:
+            return {
+                'counters': len(self._summaries[('1h', 'count')]),
+                'cumulative_states': len(self._cumulative),
+                'running_states': len(self._running)
+            }
+
+
+_tracker: Optional[HeavyHittersTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> HeavyHittersTracker:
+    """获取进程内共享的跟踪器"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = HeavyHittersTracker()
+    return _tracker
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引建议合并
+
+SQLExplainAnalyzer 对每次表访问各给出一条建议，几百个指纹累积下来，同一张表上
+会出现大量互相重叠的单用途索引，全部创建会明显拖慢写入。本模块把 index_suggestion
+中待处理的建议合并成尽量少的复合索引:
+
+- 覆盖规则(最左前缀): 建议列是等值条件提取出来的，列顺序不重要，因此索引
+  (c1, c2, ..., cn) 能覆盖列集合等于其某个前缀 {c1..ck} 的建议
+- 合并: 同一张表上列集合互相包含(构成一条链)的建议可以由同一个索引覆盖，
+  索引列顺序按链从小到大依次追加
+- 已有索引: 从目标库 information_schema.STATISTICS 读取，已被现有索引覆盖的建议
+  直接剔除；新索引若以某个现有索引为最左前缀，标记为可替换该索引
+- 排序: 每个候选索引按其覆盖指纹的总慢SQL耗时(sql_fingerprint_stats.total_elapsed_seconds)
+  排序，每张表最多保留 max_per_table 个
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PER_TABLE = 3
+
+# 不参与表名解析的系统库
+_SYSTEM_SCHEMAS = ('mysql', 'information_schema', 'performance_schema', 'sys')
+
+TableKey = Tuple[str, str]
+
+
+def covers(index_columns: List[str], columns: List[str]) -> bool:
+    """索引是否以最左前缀覆盖这组(等值条件)列"""
+    if not columns or len(columns) > len(index_columns):
+        return False
+    return {c.lower() for c in index_columns[:len(columns)]} == {c.lower() for c in columns}
+
+
+def load_pending_suggestions(cursor, instance_id: int, hours: int) -> List[Dict]:
+    """读取实例待处理的建索引建议，附带指纹的累计慢SQL耗时"""
+    cursor.execute("""
+        SELECT s.id, s.sql_fingerprint, s.schema_name, s.table_name, s.suggested_columns,
+               COALESCE(fps.total_elapsed_seconds, 0) AS total_elapsed_seconds,
+               COALESCE(fps.occurrence_count, 0) AS occurrence_count
+        FROM index_suggestion s
+        LEFT JOIN sql_fingerprint_stats fps ON s.sql_fingerprint = fps.fingerprint
+        WHERE s.db_instance_id = %s
+          AND s.status = 'pending'
+          AND s.suggested_columns IS NOT NULL AND s.suggested_columns != ''
+          AND s.created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+    """, (instance_id, hours))
+
+    suggestions = []
+    for row in cursor.fetchall():
+        columns = [c.strip() for c in row['suggested_columns'].split(',') if c.strip()]
+        if not columns or not row.get('table_name'):
+            continue
+        # 未指定库名时分析连接的是 information_schema，记录下来的库名不是表所在库
+        schema_name = row.get('schema_name') or ''
+        if schema_name.lower() in _SYSTEM_SCHEMAS:
+            schema_name = ''
+        suggestions.append({
+            'id': row['id'],
+            'sql_fingerprint': row['sql_fingerprint'],
+            'schema_name': schema_name,
+            'table_name': row['table_name'],
+            'columns': columns,
+            'total_elapsed_seconds': float(row['total_elapsed_seconds'] or 0),
+            'occurrence_count': int(row['occurrence_count'] or 0)
+        })
+    return suggestions
+
+
+def resolve_schemas(cursor, table_names: List[str]) -> Dict[str, str]:
+    """为未记录库名的建议按表名查找所在库（只接受唯一匹配）"""
+    if not table_names:
+        return {}
+    placeholders = ', '.join(['%s'] * len(table_names))
+    cursor.execute(f"""
+        SELECT TABLE_NAME AS table_name, MIN(TABLE_SCHEMA) AS schema_name, COUNT(*) AS cnt
+        FROM information_schema.TABLES
+        WHERE TABLE_NAME IN ({placeholders})
+          AND TABLE_SCHEMA NOT IN ({', '.join(['%s'] * len(_SYSTEM_SCHEMAS))})
+        GROUP BY TABLE_NAME
+    """, list(table_names) + list(_SYSTEM_SCHEMAS))
+    return {row['table_name'].lower(): row['schema_name'] for row in cursor.fetchall() if row['cnt'] == 1}
+
+
+def load_existing_indexes(cursor, tables: List[TableKey]) -> Tuple[Dict[TableKey, Dict[str, List[str]]], set]:
+    """
+    一次查询读取多张表的现有索引
+
+    Returns:
+        ({(库, 表): {索引名: [列...]}}, {(库, 表, 唯一索引名)})
+    """
+    if not tables:
+        return {}, set()
+    placeholders = ', '.join(['(%s, %s)'] * len(tables))
+    cursor.execute(f"""
+        SELECT TABLE_SCHEMA AS schema_name, TABLE_NAME AS table_name,
+               INDEX_NAME AS index_name, COLUMN_NAME AS column_name, NON_UNIQUE AS non_unique
+        FROM information_schema.STATISTICS
+        WHERE (TABLE_SCHEMA, TABLE_NAME) IN ({placeholders})
+        ORDER BY TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """, [part for table in tables for part in table])
+
+    lookup = {(s.lower(), t.lower()): (s, t) for s, t in tables}
+    indexes: Dict[TableKey, Dict[str, List[str]]] = {table: {} for table in tables}
+    unique_indexes = set()
+    for row in cursor.fetchall():
+        table = lookup.get((row['schema_name'].lower(), row['table_name'].lower()))
+        if table is None:
+            continue
+        if not int(row['non_unique']):
+            unique_indexes.add(table + (row['index_name'],))
+        if not row.get('column_name'):
+            continue  # 函数索引没有列名
+        indexes[table].setdefault(row['index_name'], []).append(row['column_name'])
+    return indexes, unique_indexes
+
+
+class _Candidate:
+    """一个候选索引：列集合构成包含链的一组建议"""
+
+    def __init__(self, suggestion: Dict):
+        self.chain: List[frozenset] = []
+        self.suggestions: List[Dict] = []
+        self.add(suggestion)
+
+    @property
+    def column_set(self) -> frozenset:
+        return max(self.chain, key=len)
+
+    def accepts(self, columns: frozenset) -> bool:
+        # 新列集合必须与链上每个集合可比较(互相包含)，否则无法排出同一个最左前缀
+        return all(columns <= s or s <= columns for s in self.chain)
+
+    def add(self, suggestion: Dict):
+        columns = frozenset(c.lower() for c in suggestion['columns'])
+        if columns not in self.chain:
+            self.chain.append(columns)
+        self.suggestions.append(suggestion)
+
+    def ordered_columns(self) -> List[str]:
+        """按链从小到大追加列，同一层内保持建议中出现的顺序"""
+        names = {}
+        for suggestion in self.suggestions:
+            for column in suggestion['columns']:
+                names.setdefault(column.lower(), column)
+        ordered: List[str] = []
+        for columns in sorted(self.chain, key=len):
+            ordered.extend(c for c in names if c in columns and c not in ordered)
+        return [names[c] for c in ordered]
+
+
+def consolidate_suggestions(suggestions: List[Dict],
+                            existing_indexes: Dict[TableKey, Dict[str, List[str]]],
+                            max_per_table: Optional[int] = DEFAULT_MAX_PER_TABLE,
+                            unique_indexes: Optional[set] = None) -> Dict:
+    """
+    合并索引建议
+
+    Args:
+        suggestions: load_pending_suggestions 的结果(schema_name 已补全)
+        existing_indexes: load_existing_indexes 的结果
+        max_per_table: 每张表最多推荐的新索引数，None 表示不限制
+        unique_indexes: load_existing_indexes 返回的唯一索引，新索引不会替换它们
+
+    Returns:
+        {'indexes': [...], 'deferred': [...], 'covered_by_existing': [...]}
+    """
+    covered_by_existing = []
+    by_table: Dict[TableKey, List[Dict]] = {}
+    for suggestion in suggestions:
+        table = (suggestion['schema_name'], suggestion['table_name'])
+        existing = existing_indexes.get(table, {})
+        index_name = next((name for name, cols in existing.items() if covers(cols, suggestion['columns'])), None)
+        if index_name:
+            covered_by_existing.append({
+                'suggestion_id': suggestion['id'],
+                'sql_fingerprint': suggestion['sql_fingerprint'],
+                'schema_name': table[0], 'table_name': table[1],
+                'columns': suggestion['columns'],
+                'existing_index': index_name
+            })
+            continue
+        by_table.setdefault(table, []).append(suggestion)
+
+    indexes = []
+    deferred = []
+    for table, table_suggestions in by_table.items():
+        # 长的列集合先成链，其余建议尽量挂到已有链上
+        table_suggestions.sort(key=lambda s: (-len(s['columns']), -s['total_elapsed_seconds']))
+        candidates: List[_Candidate] = []
+        for suggestion in table_suggestions:
+            columns = frozenset(c.lower() for c in suggestion['columns'])
+            target = next((c for c in candidates if columns <= c.column_set and c.accepts(columns)), None)
+            if target is None:
+                candidates.append(_Candidate(suggestion))
+            else:
+                target.add(suggestion)
+
+        ranked = sorted((_describe_candidate(table, c, existing_indexes.get(table, {}),
+                                             unique_indexes or set()) for c in candidates),
+                        key=lambda c: (-c['covered_slow_seconds'], -len(c['covered_fingerprints'])))
+        limit = len(ranked) if max_per_table is None else max_per_table
+        indexes.extend(ranked[:limit])
+        deferred.extend(ranked[limit:])
+
+    indexes.sort(key=lambda c: -c['covered_slow_seconds'])
+    deferred.sort(key=lambda c: -c['covered_slow_seconds'])
+    return {'indexes': indexes, 'deferred': deferred, 'covered_by_existing': covered_by_existing}
+
+
+def _describe_candidate(table: TableKey, candidate: _Candidate, existing: Dict[str, List[str]],
+                        unique_indexes: set) -> Dict:
+    schema_name, table_name = table
+    columns = candidate.ordered_columns()
+    lowered = [c.lower() for c in columns]
+
+    # 每个指纹只计一次耗时
+    fingerprints: Dict[str, float] = {}
+    for suggestion in candidate.suggestions:
+        fingerprints[suggestion['sql_fingerprint']] = suggestion['total_elapsed_seconds']
+
+    # 唯一索引(含主键)承担约束，即使是新索引的最左前缀也不能删除
+    replaces = [name for name, cols in existing.items()
+                if name != 'PRIMARY' and table + (name,) not in unique_indexes
+                and [c.lower() for c in cols] == lowered[:len(cols)]]
+
+    index_name = f"idx_{'_'.join(lowered)}"[:64]
+    qualified = f"`{schema_name}`.`{table_name}`" if schema_name else f"`{table_name}`"
+    column_list = ', '.join(f"`{c}`" for c in columns)
+    if replaces:
+        drops = ', '.join(f"DROP INDEX `{name}`" for name in replaces)
+        statement = f"ALTER TABLE {qualified} {drops}, ADD INDEX `{index_name}` ({column_list})"
+    else:
+        statement = f"ALTER TABLE {qualified} ADD INDEX `{index_name}` ({column_list})"
+
+    return {
+        'schema_name': schema_name,
+        'table_name': table_name,
+        'columns': columns,
+        'index_name': index_name,
+        'create_statement': statement,
+        'replaces_indexes': replaces,
+        'covered_slow_seconds': round(sum(fingerprints.values()), 2),
+        'covered_fingerprints': list(fingerprints),
+        'suggestion_ids': [s['id'] for s in candidate.suggestions]
+    }
+
+
+def consolidate_instance_suggestions(monitor_cursor, target_cursor, instance_id: int, hours: int = 168,
+                                     max_per_table: Optional[int] = DEFAULT_MAX_PER_TABLE) -> Dict:
+    """
+    合并一个实例的待处理索引建议
+
+    Args:
+        monitor_cursor: 监控库游标
+        target_cursor: 目标库游标(读取 information_schema)
+        instance_id: 实例ID
+        hours: 只看最近多少小时产生的建议
+        max_per_table: 每张表最多推荐的新索引数
+    """
+    suggestions = load_pending_suggestions(monitor_cursor, instance_id, hours)
+
+    unresolved = sorted({s['table_name'] for s in suggestions if not s['schema_name']})
+    if unresolved:
+        schemas = resolve_schemas(target_cursor, unresolved)
+        for suggestion in suggestions:
+            if not suggestion['schema_name']:
+                suggestion['schema_name'] = schemas.get(suggestion['table_name'].lower(), '')
+
+    skipped = [s['id'] for s in suggestions if not s['schema_name']]
+    if skipped:
+        logger.info(f"实例{instance_id}: {len(skipped)} 条索引建议无法确定所在库，跳过")
+    suggestions = [s for s in suggestions if s['schema_name']]
+
+    tables = sorted({(s['schema_name'], s['table_name']) for s in suggestions})
+    existing, unique_indexes = load_existing_indexes(target_cursor, tables)
+
+    result = consolidate_suggestions(suggestions, existing, max_per_table, unique_indexes)
+    result['summary'] = {
+        'suggestions': len(suggestions),
+        'tables': len(tables),
+        'recommended_indexes': len(result['indexes']),
+        'deferred_indexes': len(result['deferred']),
+        'covered_by_existing': len(result['covered_by_existing']),
+        'unresolved_suggestions': len(skipped)
+    }
+    return result
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引使用情况采集（未使用/冗余索引）
+
+db-monitor 只会建议加索引，而多余的索引会拖慢目标库的写入。本模块定期采集
+目标库的索引使用计数，累加到监控库 index_usage_stats，据此给出"可删除索引"报告。
+
+数据源:
+- MySQL: performance_schema.table_io_waits_summary_by_index_usage(读次数)、
+  table_io_waits_summary_by_table(表写次数，每次行写入都要维护全部二级索引)、
+  sys.schema_unused_indexes / sys.schema_redundant_indexes、
+  mysql.innodb_index_stats(索引大小)
+- SQL Server: sys.dm_db_index_usage_stats(seek/scan/lookup 与 update 次数)、
+  sys.dm_db_partition_stats(索引大小)；冗余索引按键列最左前缀自行判断
+
+目标库的计数都是"自实例启动以来"的累计值，重启后归零。每次采集与监控库中保存的
+上次原始计数做差，实例启动时间变化或计数回退时以当前值作为增量，因此累计值
+不受目标库重启影响，也不依赖本进程内存。
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from scripts.explain_batch import connect_target
+    from scripts.sqlserver_collector import SQLServerCollector, PYODBC_AVAILABLE
+except ImportError:
+    from explain_batch import connect_target
+    from sqlserver_collector import SQLServerCollector, PYODBC_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# 观察满多少天仍未被读过才算未使用
+DEFAULT_MIN_OBSERVED_DAYS = 7
+# 启动时间由 NOW() - Uptime 推算，允许的抖动(秒)
+_SERVER_START_TOLERANCE = 60
+
+_MYSQL_SYSTEM_SCHEMAS = ('mysql', 'information_schema', 'performance_schema', 'sys')
+
+IndexKey = Tuple[str, str, str]
+
+
+def find_redundant_indexes(index_columns: Dict[Tuple[str, str], Dict[str, List[str]]],
+                           unique_indexes: set) -> Dict[IndexKey, str]:
+    """
+    键列是同表另一个索引键列最左前缀的非唯一索引视为冗余
+
+    Returns:
+        {(库, 表, 冗余索引): 覆盖它的索引}
+    """
+    redundant = {}
+    for (schema_name, table_name), indexes in index_columns.items():
+        for name, columns in indexes.items():
+            if (schema_name, table_name, name) in unique_indexes:
+                continue
+            for other, other_columns in indexes.items():
+                if other == name or len(other_columns) < len(columns):
+                    continue
+                if other_columns[:len(columns)] != columns:
+                    continue
+                # 键列完全相同时只保留一个(按名称)
+                if len(other_columns) == len(columns) and other > name:
+                    continue
+                redundant[(schema_name, table_name, name)] = other
+                break
+    return redundant
+
+
+def collect_mysql_index_usage(cursor) -> Tuple[Optional[datetime], List[Dict]]:
+    """读取MySQL实例的索引使用计数，返回 (实例启动时间, 索引列表)"""
+    cursor.execute("""
+        SELECT DATE_SUB(NOW(), INTERVAL VARIABLE_VALUE SECOND) AS server_start
+        FROM performance_schema.global_status
+        WHERE VARIABLE_NAME = 'Uptime'
+    """)
+    row = cursor.fetchone()
+    server_start = row['server_start'] if row else None
+
+    system_placeholders = ', '.join(['%s'] * len(_MYSQL_SYSTEM_SCHEMAS))
+    cursor.execute(f"""
+        SELECT i.OBJECT_SCHEMA AS schema_name, i.OBJECT_NAME AS table_name, i.INDEX_NAME AS index_name,
+               i.COUNT_READ AS read_count, t.COUNT_WRITE AS write_count
+        FROM performance_schema.table_io_waits_summary_by_index_usage i
+        JOIN performance_schema.table_io_waits_summary_by_table t
+          ON t.OBJECT_TYPE = i.OBJECT_TYPE AND t.OBJECT_SCHEMA = i.OBJECT_SCHEMA AND t.OBJECT_NAME = i.OBJECT_NAME
+        WHERE i.INDEX_NAME IS NOT NULL
+          AND i.OBJECT_SCHEMA NOT IN ({system_placeholders})
+    """, _MYSQL_SYSTEM_SCHEMAS)
+    usage = cursor.fetchall()
+
+    cursor.execute(f"""
+        SELECT TABLE_SCHEMA AS schema_name, TABLE_NAME AS table_name, INDEX_NAME AS index_name,
+               MIN(NON_UNIQUE) AS non_unique
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA NOT IN ({system_placeholders})
+        GROUP BY TABLE_SCHEMA, TABLE_NAME, INDEX_NAME
+    """, _MYSQL_SYSTEM_SCHEMAS)
+    unique_indexes = {(r['schema_name'], r['table_name'], r['index_name'])
+                      for r in cursor.fetchall() if not int(r['non_unique'])}
+
+    sizes = {}
+    try:
+        cursor.execute(f"""
+            SELECT database_name AS schema_name, table_name, index_name,
+                   stat_value * @@innodb_page_size AS size_bytes
+            FROM mysql.innodb_index_stats
+            WHERE stat_name = 'size'
+              AND database_name NOT IN ({system_placeholders})
+        """, _MYSQL_SYSTEM_SCHEMAS)
+        sizes = {(r['schema_name'], r['table_name'], r['index_name']): int(r['size_bytes'] or 0)
+                 for r in cursor.fetchall()}
+    except Exception as e:
+        logger.debug(f"读取索引大小失败(需要mysql库的SELECT权限): {e}")
+
+    unused = set()
+    redundant = {}
+    try:
+        cursor.execute("SELECT object_schema, object_name, index_name FROM sys.schema_unused_indexes")
+        unused = {(r['object_schema'], r['object_name'], r['index_name']) for r in cursor.fetchall()}
+        cursor.execute("""
+            SELECT table_schema, table_name, redundant_index_name, dominant_index_name
+            FROM sys.schema_redundant_indexes
+        """)
+        redundant = {(r['table_schema'], r['table_name'], r['redundant_index_name']): r['dominant_index_name']
+                     for r in cursor.fetchall()}
+    except Exception as e:
+        logger.debug(f"读取sys库索引视图失败: {e}")
+
+    indexes = []
+    for r in usage:
+        key = (r['schema_name'], r['table_name'], r['index_name'])
+        indexes.append({
+            'schema_name': key[0],
+            'table_name': key[1],
+            'index_name': key[2],
+            'is_primary': 1 if key[2] == 'PRIMARY' else 0,
+            'is_unique': 1 if key in unique_indexes else 0,
+            'read_count': int(r['read_count'] or 0),
+            'write_count': int(r['write_count'] or 0),
+            'size_bytes': sizes.get(key),
+            'sys_unused': 1 if key in unused else 0,
+            'redundant_with': redundant.get(key),
+            'drop_statement': f"ALTER TABLE `{key[0]}`.`{key[1]}` DROP INDEX `{key[2]}`"
+        })
+    return server_start, indexes
+
+
+def collect_sqlserver_index_usage(conn) -> Tuple[Optional[datetime], List[Dict]]:
+    """读取SQL Server实例各用户库的非聚集索引使用计数"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT sqlserver_start_time FROM sys.dm_os_sys_info")
+    row = cursor.fetchone()
+    server_start = row[0] if row else None
+
+    cursor.execute("""
+        SELECT name FROM sys.databases
+        WHERE database_id > 4 AND state_desc = 'ONLINE'
+    """)
+    databases = [r[0] for r in cursor.fetchall()]
+
+    indexes = []
+    for database in databases:
+        try:
+            cursor.execute(f"""
+                USE [{database}];
+
+                SELECT s.name AS schema_name, o.name AS table_name, i.name AS index_name,
+                       CAST(i.is_unique AS INT) AS is_unique,
+                       CAST(i.is_primary_key AS INT) AS is_primary,
+                       ISNULL(u.user_seeks, 0) + ISNULL(u.user_scans, 0) + ISNULL(u.user_lookups, 0) AS read_count,
+                       ISNULL(u.user_updates, 0) AS write_count,
+                       (SELECT SUM(ps.used_page_count) * 8192 FROM sys.dm_db_partition_stats ps
+                        WHERE ps.object_id = i.object_id AND ps.index_id = i.index_id) AS size_bytes,
+                       STUFF((SELECT ',' + c.name FROM sys.index_columns ic
+                              JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+                              WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id
+                                AND ic.key_ordinal > 0
+                              ORDER BY ic.key_ordinal
+                              FOR XML PATH('')), 1, 1, '') AS key_columns
+                FROM sys.indexes i
+                JOIN sys.objects o ON o.object_id = i.object_id
+                JOIN sys.schemas s ON s.schema_id = o.schema_id
+                LEFT JOIN sys.dm_db_index_usage_stats u
+                  ON u.database_id = DB_ID() AND u.object_id = i.object_id AND u.index_id = i.index_id
+                WHERE o.type = 'U' AND o.is_ms_shipped = 0
+                  AND i.index_id > 1 AND i.type_desc = 'NONCLUSTERED'
+            """)
+            rows = cursor.fetchall()
+        except Exception as e:
+            logger.warning(f"{database}: 读取索引使用情况失败: {e}")
+            continue
+
+        index_columns: Dict[Tuple[str, str], Dict[str, List[str]]] = {}
+        unique_indexes = set()
+        for r in rows:
+            table_name = f"{r.schema_name}.{r.table_name}"
+            index_columns.setdefault((database, table_name), {})[r.index_name] = (r.key_columns or '').split(',')
+            if r.is_unique or r.is_primary:
+                unique_indexes.add((database, table_name, r.index_name))
+        redundant = find_redundant_indexes(index_columns, unique_indexes)
+
+        for r in rows:
+            table_name = f"{r.schema_name}.{r.table_name}"
+            indexes.append({
+                'schema_name': database,
+                'table_name': table_name,
+                'index_name': r.index_name,
+                'is_primary': int(r.is_primary or 0),
+                'is_unique': int(r.is_unique or 0),
+                'read_count': int(r.read_count or 0),
+                'write_count': int(r.write_count or 0),
+                'size_bytes': int(r.size_bytes) if r.size_bytes is not None else None,
+                'sys_unused': 0,
+                'redundant_with': redundant.get((database, table_name, r.index_name)),
+                'drop_statement': f"DROP INDEX [{r.index_name}] ON [{database}].[{r.schema_name}].[{r.table_name}]"
+            })
+
+    cursor.close()
+    return server_start, indexes
+
+
+def accumulate_index_usage(cursor, instance_id: int, server_start: Optional[datetime],
+                           indexes: List[Dict]) -> int:
+    """
+    与监控库中保存的上次原始计数做差，累加到 index_usage_stats（由调用方提交）
+
+    Returns:
+        写入的索引数
+    """
+    if not indexes:
+        return 0
+
+    cursor.execute("""
+        SELECT schema_name, table_name, index_name, total_reads, total_writes,
+               last_read_count, last_write_count, server_start_time, last_used_at
+        FROM index_usage_stats
+        WHERE db_instance_id = %s
+    """, (instance_id,))
+    previous = {(r['schema_name'], r['table_name'], r['index_name']): r for r in cursor.fetchall()}
+
+    now = datetime.now()
+    rows = []
+    for index in indexes:
+        key = (index['schema_name'], index['table_name'], index['index_name'])
+        prev = previous.get(key)
+        reads, writes = index['read_count'], index['write_count']
+
+        if prev is None:
+            # 首次看到: 实例启动以来的计数全部计入
+            read_delta, write_delta = reads, writes
+            total_reads, total_writes, last_used_at = 0, 0, None
+        else:
+            restarted = (
+                server_start is not None and prev['server_start_time'] is not None
+                and abs((server_start - prev['server_start_time']).total_seconds()) > _SERVER_START_TOLERANCE
+            ) or reads < (prev['last_read_count'] or 0) or writes < (prev['last_write_count'] or 0)
+            if restarted:
+                read_delta, write_delta = reads, writes
+            else:
+                read_delta = reads - (prev['last_read_count'] or 0)
+                write_delta = writes - (prev['last_write_count'] or 0)
+            total_reads, total_writes = int(prev['total_reads'] or 0), int(prev['total_writes'] or 0)
+            last_used_at = prev['last_used_at']
+
+        rows.append((
+            instance_id, key[0], key[1], key[2],
+            index['is_primary'], index['is_unique'], index['size_bytes'],
+            total_reads + read_delta, total_writes + write_delta,
+            reads, writes, server_start,
+            index['sys_unused'], index['redundant_with'], index['drop_statement'],
+            now, now, now if read_delta > 0 else last_used_at
+        ))
+
+    cursor.executemany("""
+        INSERT INTO index_usage_stats
+        (db_instance_id, schema_name, table_name, index_name, is_primary, is_unique, size_bytes,
+         total_reads, total_writes, last_read_count, last_write_count, server_start_time,
+         sys_unused, redundant_with, drop_statement, first_seen, last_seen, last_used_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            is_primary = VALUES(is_primary),
+            is_unique = VALUES(is_unique),
+            size_bytes = VALUES(size_bytes),
+            total_reads = VALUES(total_reads),
+            total_writes = VALUES(total_writes),
+            last_read_count = VALUES(last_read_count),
+            last_write_count = VALUES(last_write_count),
+            server_start_time = VALUES(server_start_time),
+            sys_unused = VALUES(sys_unused),
+            redundant_with = VALUES(redundant_with),
+            drop_statement = VALUES(drop_statement),
+            last_seen = VALUES(last_seen),
+            last_used_at = VALUES(last_used_at)
+    """, rows)
+    return len(rows)
+
+
+def collect_instance_index_usage(instance: Dict, monitor_conn_factory: Callable) -> int:
+    """采集单个实例的索引使用情况"""
+    instance_name = instance.get('db_project', 'Unknown')
+    target_conn = None
+    try:
+        if instance['db_type'] == 'SQLServer':
+            if not PYODBC_AVAILABLE:
+                return 0
+            target_conn = SQLServerCollector(instance).connect()
+            if not target_conn:
+                return 0
+            server_start, indexes = collect_sqlserver_index_usage(target_conn)
+        else:
+            target_conn, _ = connect_target(instance)
+            with target_conn.cursor() as cursor:
+                server_start, indexes = collect_mysql_index_usage(cursor)
+    except Exception as e:
+        logger.error(f"采集索引使用情况失败 {instance_name}: {e}")
+        return 0
+    finally:
+        if target_conn:
+            target_conn.close()
+
+    conn = monitor_conn_factory()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            saved = accumulate_index_usage(cursor, instance['id'], server_start, indexes)
+        conn.commit()
+        logger.info(f"{instance_name}: 索引使用情况 {saved} 个索引")
+        return saved
+    except Exception as e:
+        logger.error(f"保存索引使用情况失败 {instance_name}: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+
+def collect_all_index_usage(monitor_conn_factory: Callable) -> int:
+    """采集所有启用的MySQL/SQL Server实例"""
+    conn = monitor_conn_factory()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT * FROM db_instance_info
+                WHERE status = 1 AND db_type IN ('MySQL', 'SQLServer')
+            """)
+            instances = cursor.fetchall()
+    finally:
+        conn.close()
+
+    return sum(collect_instance_index_usage(instance, monitor_conn_factory) for instance in instances)
+
+
+def get_drop_candidates(cursor, instance_id: Optional[int] = None,
+                        min_days: int = DEFAULT_MIN_OBSERVED_DAYS, limit: int = 100) -> List[Dict]:
+    """
+    可删除索引报告: 观察满 min_days 天仍未被读过的索引，以及冗余索引
+
+    主键和唯一索引承担约束，不作为候选。写代价按观察期内的日均维护次数估算。
+    """
+    where = [
+        "s.is_primary = 0", "s.is_unique = 0",
+        # 上次采集时仍存在
+        "s.last_seen >= DATE_SUB(NOW(), INTERVAL 1 DAY)",
+        "((s.total_reads = 0 AND s.first_seen <= DATE_SUB(NOW(), INTERVAL %s DAY)) OR s.redundant_with IS NOT NULL)"
+    ]
+    params: List = [min_days]
+    if instance_id:
+        where.append("s.db_instance_id = %s")
+        params.append(instance_id)
+
+    cursor.execute(f"""
+        SELECT s.*, i.db_project, i.db_type
+        FROM index_usage_stats s
+        LEFT JOIN db_instance_info i ON s.db_instance_id = i.id
+        WHERE {' AND '.join(where)}
+        ORDER BY s.size_bytes DESC, s.total_writes DESC
+        LIMIT %s
+    """, params + [limit])
+
+    now = datetime.now()
+    candidates = []
+    for row in cursor.fetchall():
+        observed_days = max((now - row['first_seen']).total_seconds() / 86400, 1 / 24)
+        reasons = []
+        if int(row['total_reads'] or 0) == 0 and now - row['first_seen'] >= timedelta(days=min_days):
+            reasons.append('unused')
+        if row.get('redundant_with'):
+            reasons.append('redundant')
+        candidates.append({
+            'db_instance_id': row['db_instance_id'],
+            'db_project': row.get('db_project'),
+            'db_type': row.get('db_type'),
+            'schema_name': row['schema_name'],
+            'table_name': row['table_name'],
+            'index_name': row['index_name'],
+            'reasons': reasons,
+            'redundant_with': row.get('redundant_with'),
+            'size_mb': round(row['size_bytes'] / 1024 / 1024, 2) if row.get('size_bytes') is not None else None,
+            'total_reads': int(row['total_reads'] or 0),
+            'total_writes': int(row['total_writes'] or 0),
+            'writes_per_day': round(int(row['total_writes'] or 0) / observed_days, 1),
+            'observed_days': round(observed_days, 1),
+            'last_used_at': row['last_used_at'].strftime('%Y-%m-%d %H:%M:%S') if row.get('last_used_at') else None,
+            'drop_statement': row.get('drop_statement')
+        })
+    return candidates
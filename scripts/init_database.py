@@ -15,7 +15,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 当前数据库架构版本
-CURRENT_SCHEMA_VERSION = '1.2.0'
+CURRENT_SCHEMA_VERSION = '1.5.0'
 
 def load_config():
     """加载配置文件"""
@@ -53,6 +53,18 @@ def check_column_exists(cursor, table_name, column_name):
     result = cursor.fetchone()
     return result['count'] > 0
 
+def check_index_exists(cursor, table_name, index_name):
+    """检查索引是否存在"""
+    cursor.execute(f"""
+        SELECT COUNT(*) as count
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = '{table_name}'
+        AND INDEX_NAME = '{index_name}'
+    """)
+    result = cursor.fetchone()
+    return result['count'] > 0
+
 def create_schema_version_table(cursor):
     """创建数据库版本表"""
     logger.info("创建数据库版本表...")
@@ -140,6 +152,7 @@ def create_long_running_sql_log_table(cursor):
             rows_examined BIGINT COMMENT '扫描行数',
             rows_sent BIGINT COMMENT '返回行数',
             query_cost DECIMAL(15,4) COMMENT '查询成本',
+            plan_hash CHAR(32) COMMENT '归一化执行计划哈希',
             execution_plan JSON COMMENT '执行计划(JSON格式)',
             index_used VARCHAR(500) COMMENT '使用的索引',
             full_table_scan TINYINT DEFAULT 0 COMMENT '是否全表扫描',
@@ -179,6 +192,10 @@ def create_deadlock_log_table(cursor):
             blocker_sql TEXT COMMENT '阻塞者SQL',
             blocker_trx_id VARCHAR(50) COMMENT '阻塞者事务ID',
             deadlock_graph JSON COMMENT '完整死锁图(JSON格式)',
+            victim_spid VARCHAR(100) COMMENT '受害者进程ID(SQL Server)',
+            process_count INT DEFAULT 0 COMMENT '参与进程数',
+            deadlock_xml MEDIUMTEXT COMMENT '原始死锁图XML(SQL Server)',
+            deadlock_signature CHAR(32) COMMENT '死锁签名(参与SQL指纹+锁资源+锁模式)',
             wait_resource VARCHAR(200) COMMENT '等待资源',
             lock_mode VARCHAR(50) COMMENT '锁模式',
             lock_type VARCHAR(50) COMMENT '锁类型',
@@ -191,7 +208,9 @@ def create_deadlock_log_table(cursor):
             INDEX idx_db_instance_id (db_instance_id),
             INDEX idx_deadlock_time (deadlock_time),
             INDEX idx_detect_time (detect_time),
-            INDEX idx_alert_sent (alert_sent)
+            INDEX idx_alert_sent (alert_sent),
+            INDEX idx_deadlock_signature (deadlock_signature),
+            UNIQUE KEY uk_instance_time_victim (db_instance_id, deadlock_time, victim_spid)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='死锁监控日志表'
     """)
 
@@ -224,6 +243,7 @@ def create_alert_history_table(cursor):
             sql_log_id BIGINT COMMENT '关联的SQL日志ID',
             alert_level VARCHAR(20) NOT NULL COMMENT '告警级别',
             alert_type VARCHAR(50) NOT NULL COMMENT '告警类型',
+            alert_identifier VARCHAR(200) COMMENT '告警标识符(SQL指纹/死锁时间)，用于告警去重',
             alert_message TEXT COMMENT '告警消息',
             alert_detail JSON COMMENT '告警详情(JSON格式)',
             is_acknowledged TINYINT DEFAULT 0 COMMENT '是否已确认',
@@ -234,7 +254,8 @@ def create_alert_history_table(cursor):
             INDEX idx_alert_level (alert_level),
             INDEX idx_alert_type (alert_type),
             INDEX idx_created_at (created_at),
-            INDEX idx_is_acknowledged (is_acknowledged)
+            INDEX idx_is_acknowledged (is_acknowledged),
+            INDEX idx_alert_dedup (db_instance_id, alert_type, alert_identifier, created_at)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='告警历史记录表'
     """)
 
@@ -262,11 +283,27 @@ def add_missing_columns(cursor):
         'long_running_sql_log': [
             ('wait_type', "VARCHAR(100) COMMENT '等待类型'"),
             ('wait_resource', "VARCHAR(200) COMMENT '等待资源'"),
-            ('query_cost', "DECIMAL(15,4) COMMENT '查询成本'")
+            ('query_cost', "DECIMAL(15,4) COMMENT '查询成本'"),
+            ('plan_hash', "CHAR(32) COMMENT '归一化执行计划哈希'")
         ],
         'alert_history': [
             ('alert_type', "VARCHAR(50) NOT NULL DEFAULT 'unknown' COMMENT '告警类型'"),
+            ('alert_identifier', "VARCHAR(200) COMMENT '告警标识符(SQL指纹/死锁时间)，用于告警去重'"),
             ('alert_detail', "JSON COMMENT '告警详情(JSON格式)'")
+        ],
+        'sql_fingerprint_stats': [
+            ('cluster_id', "VARCHAR(64) COMMENT '近似模板簇ID(簇代表指纹)'")
+        ],
+        'deadlock_log': [
+            ('victim_spid', "VARCHAR(100) COMMENT '受害者进程ID(SQL Server)'"),
+            ('process_count', "INT DEFAULT 0 COMMENT '参与进程数'"),
+            ('deadlock_xml', "MEDIUMTEXT COMMENT '原始死锁图XML(SQL Server)'"),
+            ('deadlock_signature', "CHAR(32) COMMENT '死锁签名(参与SQL指纹+锁资源+锁模式)'")
+        ],
+        'sql_execution_plan': [
+            ('schema_name', "VARCHAR(128) COMMENT '执行EXPLAIN时的默认库名'"),
+            ('table_versions', "JSON COMMENT '引用表的版本标记(执行计划缓存失效依据)'"),
+            ('plan_hash', "CHAR(32) COMMENT '归一化执行计划哈希'")
         ]
     }
 
@@ -283,6 +320,42 @@ def add_missing_columns(cursor):
                 except Exception as e:
                     logger.error(f"  添加字段失败: {e}")
 
+def add_missing_indexes(cursor):
+    """添加缺失的索引（用于数据库升级）"""
+    logger.info("检查并添加缺失的索引...")
+
+    # (索引名, 索引类型, 列)
+    required_indexes = {
+        'alert_history': [
+            # 启动时按 (实例, 类型, 标识符) 预热告警抑制缓存
+            ('idx_alert_dedup', 'INDEX', "(db_instance_id, alert_type, alert_identifier, created_at)")
+        ],
+        'sql_fingerprint_stats': [
+            ('idx_cluster_id', 'INDEX', "(cluster_id)")
+        ],
+        'deadlock_log': [
+            # SQL Server死锁按(实例, 时间, 受害者)去重，采集器直接INSERT IGNORE
+            ('uk_instance_time_victim', 'UNIQUE INDEX', "(db_instance_id, deadlock_time, victim_spid)"),
+            ('idx_deadlock_signature', 'INDEX', "(deadlock_signature)")
+        ],
+        'sql_execution_plan': [
+            ('idx_plan_cache', 'INDEX', "(db_instance_id, sql_fingerprint, schema_name, plan_type)")
+        ]
+    }
+
+    for table_name, indexes in required_indexes.items():
+        if not check_table_exists(cursor, table_name):
+            logger.warning(f"表 {table_name} 不存在，跳过索引检查")
+            continue
+
+        for index_name, index_type, index_def in indexes:
+            if not check_index_exists(cursor, table_name, index_name):
+                logger.info(f"  添加缺失索引: {table_name}.{index_name}")
+                try:
+                    cursor.execute(f"ALTER TABLE {table_name} ADD {index_type} {index_name} {index_def}")
+                except Exception as e:
+                    logger.error(f"  添加索引失败: {e}")
+
 def create_sql_fingerprint_stats_table(cursor):
     """创建SQL指纹统计表"""
     logger.info("创建SQL指纹统计表...")
@@ -303,12 +376,14 @@ def create_sql_fingerprint_stats_table(cursor):
             avg_rows_examined BIGINT DEFAULT 0 COMMENT '平均扫描行数',
             full_scan_count INT DEFAULT 0 COMMENT '全表扫描次数',
             has_index_suggestion TINYINT DEFAULT 0 COMMENT '是否有索引建议',
+            cluster_id VARCHAR(64) COMMENT '近似模板簇ID(簇代表指纹)',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
             INDEX idx_sql_type (sql_type),
             INDEX idx_occurrence (occurrence_count DESC),
             INDEX idx_avg_elapsed (avg_elapsed_seconds DESC),
-            INDEX idx_last_seen (last_seen DESC)
+            INDEX idx_last_seen (last_seen DESC),
+            INDEX idx_cluster_id (cluster_id)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='SQL指纹统计表'
     """)
 
@@ -321,6 +396,7 @@ def create_sql_execution_plan_table(cursor):
             sql_fingerprint VARCHAR(64) COMMENT 'SQL指纹',
             longsql_id BIGINT COMMENT '关联的long_running_sql_log ID',
             db_instance_id INT COMMENT '数据库实例ID',
+            schema_name VARCHAR(128) COMMENT '执行EXPLAIN时的默认库名',
             plan_type VARCHAR(20) DEFAULT 'EXPLAIN' COMMENT '执行计划类型',
             plan_json JSON COMMENT '执行计划JSON',
             plan_text TEXT COMMENT '执行计划文本',
@@ -329,11 +405,14 @@ def create_sql_execution_plan_table(cursor):
             has_filesort TINYINT DEFAULT 0 COMMENT '是否使用文件排序',
             estimated_rows BIGINT COMMENT '预估扫描行数',
             analysis_result JSON COMMENT '分析结果(问题列表)',
+            table_versions JSON COMMENT '引用表的版本标记(执行计划缓存失效依据)',
+            plan_hash CHAR(32) COMMENT '归一化执行计划哈希',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
             INDEX idx_fingerprint (sql_fingerprint),
             INDEX idx_longsql (longsql_id),
             INDEX idx_instance (db_instance_id),
-            INDEX idx_created (created_at DESC)
+            INDEX idx_created (created_at DESC),
+            INDEX idx_plan_cache (db_instance_id, sql_fingerprint, schema_name, plan_type)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='SQL执行计划表'
     """)
 
@@ -363,6 +442,139 @@ def create_index_suggestion_table(cursor):
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='索引建议表'
     """)
 
+def create_sql_digest_histogram_tables(cursor):
+    """创建digest延迟直方图表(MySQL 8 events_statements_histogram_by_digest增量)"""
+    logger.info("创建digest延迟直方图表...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sql_digest_histogram (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY COMMENT '主键ID',
+            db_instance_id INT NOT NULL COMMENT '数据库实例ID',
+            schema_name VARCHAR(64) COMMENT '库名',
+            digest VARCHAR(64) NOT NULL COMMENT 'Performance Schema digest',
+            sample_time DATETIME NOT NULL COMMENT '采样时间',
+            sample_count BIGINT DEFAULT 0 COMMENT '本周期执行次数',
+            bucket_counts JSON COMMENT '稀疏桶增量 {bucket_number: count}',
+            INDEX idx_digest_time (db_instance_id, digest, sample_time),
+            INDEX idx_sample_time (sample_time)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='SQL digest延迟直方图增量表'
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sql_digest_histogram_bucket (
+            bucket_number INT PRIMARY KEY COMMENT '桶编号',
+            bucket_timer_low BIGINT NOT NULL COMMENT '桶下界(皮秒)',
+            bucket_timer_high BIGINT NOT NULL COMMENT '桶上界(皮秒)'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='digest直方图桶边界表'
+    """)
+
+def create_table_hotness_hourly_table(cursor):
+    """创建表级热度小时聚合表"""
+    logger.info("创建表级热度小时聚合表...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS table_hotness_hourly (
+            db_instance_id INT NOT NULL COMMENT '数据库实例ID',
+            schema_name VARCHAR(128) NOT NULL DEFAULT '' COMMENT '库名/架构名',
+            table_name VARCHAR(128) NOT NULL COMMENT '表名',
+            stat_hour DATETIME NOT NULL COMMENT '统计小时(整点)',
+            slow_count INT DEFAULT 0 COMMENT '慢SQL次数',
+            total_elapsed_seconds DECIMAL(20,2) DEFAULT 0 COMMENT '慢SQL总耗时(秒)',
+            total_rows_examined BIGINT DEFAULT 0 COMMENT '总扫描行数',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+            PRIMARY KEY (db_instance_id, schema_name, table_name, stat_hour),
+            INDEX idx_stat_hour (stat_hour),
+            INDEX idx_table_hour (schema_name, table_name, stat_hour)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='表级热度小时聚合表'
+    """)
+
+def create_deadlock_signature_stats_table(cursor):
+    """创建死锁签名统计表"""
+    logger.info("创建死锁签名统计表...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deadlock_signature_stats (
+            db_instance_id INT NOT NULL COMMENT '数据库实例ID',
+            deadlock_signature CHAR(32) NOT NULL COMMENT '死锁签名',
+            stat_hour DATETIME NOT NULL COMMENT '统计小时(按检测时间整点)',
+            deadlock_count INT DEFAULT 0 COMMENT '死锁次数',
+            first_seen DATETIME COMMENT '本小时内最早死锁时间',
+            last_seen DATETIME COMMENT '本小时内最近死锁时间',
+            sql_fingerprints VARCHAR(1000) COMMENT '参与SQL指纹:锁模式(逗号分隔)',
+            lock_resources TEXT COMMENT '锁资源 类型|对象|索引|锁模式 (JSON数组)',
+            sample_sql TEXT COMMENT '受害者SQL样例',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+            PRIMARY KEY (db_instance_id, deadlock_signature, stat_hour),
+            INDEX idx_stat_hour (stat_hour),
+            INDEX idx_signature_hour (deadlock_signature, stat_hour)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='死锁签名小时聚合表'
+    """)
+
+def create_sql_plan_regression_tables(cursor):
+    """创建执行计划基线表和回归记录表"""
+    logger.info("创建执行计划基线表...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sql_plan_baseline (
+            db_instance_id INT NOT NULL COMMENT '数据库实例ID',
+            sql_fingerprint VARCHAR(64) NOT NULL COMMENT 'SQL指纹',
+            plan_hash CHAR(32) NOT NULL COMMENT '归一化执行计划哈希',
+            execution_count BIGINT DEFAULT 0 COMMENT '累计执行次数(样本数)',
+            total_elapsed_seconds DECIMAL(20,6) DEFAULT 0 COMMENT '累计耗时(秒)',
+            first_seen DATETIME COMMENT '首次出现时间',
+            last_seen DATETIME COMMENT '最近出现时间',
+            sample_sql TEXT COMMENT 'SQL样例',
+            PRIMARY KEY (db_instance_id, sql_fingerprint, plan_hash),
+            INDEX idx_last_seen (last_seen)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='执行计划基线表'
+    """)
+
+    logger.info("创建执行计划回归记录表...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sql_plan_regression (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY COMMENT '主键ID',
+            db_instance_id INT NOT NULL COMMENT '数据库实例ID',
+            sql_fingerprint VARCHAR(64) NOT NULL COMMENT 'SQL指纹',
+            old_plan_hash CHAR(32) NOT NULL COMMENT '原执行计划哈希',
+            new_plan_hash CHAR(32) NOT NULL COMMENT '新执行计划哈希',
+            old_avg_elapsed DECIMAL(20,6) COMMENT '原计划平均耗时(秒)',
+            new_avg_elapsed DECIMAL(20,6) COMMENT '新计划平均耗时(秒)',
+            slowdown_ratio DECIMAL(12,2) COMMENT '变慢倍数',
+            old_executions BIGINT COMMENT '原计划样本数',
+            new_executions BIGINT COMMENT '新计划样本数',
+            sample_sql TEXT COMMENT 'SQL样例',
+            status VARCHAR(20) DEFAULT 'open' COMMENT '状态: open/resolved/ignored',
+            alert_sent TINYINT DEFAULT 0 COMMENT '是否已发送告警',
+            detected_at DATETIME NOT NULL COMMENT '检测时间',
+            UNIQUE KEY uk_plan_change (db_instance_id, sql_fingerprint, old_plan_hash, new_plan_hash),
+            INDEX idx_detected_at (detected_at),
+            INDEX idx_status (status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='执行计划回归记录表'
+    """)
+
+def create_index_usage_stats_table(cursor):
+    """创建索引使用情况累计表"""
+    logger.info("创建索引使用情况累计表...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS index_usage_stats (
+            db_instance_id INT NOT NULL COMMENT '数据库实例ID',
+            schema_name VARCHAR(128) NOT NULL COMMENT '库名',
+            table_name VARCHAR(256) NOT NULL COMMENT '表名(SQL Server为 架构.表)',
+            index_name VARCHAR(128) NOT NULL COMMENT '索引名',
+            is_primary TINYINT DEFAULT 0 COMMENT '是否主键',
+            is_unique TINYINT DEFAULT 0 COMMENT '是否唯一索引',
+            size_bytes BIGINT COMMENT '索引大小(字节)',
+            total_reads BIGINT DEFAULT 0 COMMENT '累计读次数(跨目标库重启)',
+            total_writes BIGINT DEFAULT 0 COMMENT '累计维护写次数(跨目标库重启)',
+            last_read_count BIGINT DEFAULT 0 COMMENT '上次采集的原始读计数',
+            last_write_count BIGINT DEFAULT 0 COMMENT '上次采集的原始写计数',
+            server_start_time DATETIME COMMENT '上次采集时目标实例的启动时间',
+            sys_unused TINYINT DEFAULT 0 COMMENT 'sys.schema_unused_indexes 是否列出',
+            redundant_with VARCHAR(128) COMMENT '覆盖该索引的索引(冗余时)',
+            drop_statement TEXT COMMENT '删除语句',
+            first_seen DATETIME COMMENT '首次采集时间',
+            last_seen DATETIME COMMENT '最近采集时间',
+            last_used_at DATETIME COMMENT '最近一次观察到读的时间',
+            PRIMARY KEY (db_instance_id, schema_name, table_name, index_name),
+            INDEX idx_last_seen (last_seen)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='索引使用情况累计表'
+    """)
+
 def create_all_tables(cursor):
     """创建所有表"""
     create_schema_version_table(cursor)
@@ -375,6 +587,11 @@ def create_all_tables(cursor):
     create_sql_fingerprint_stats_table(cursor)
     create_sql_execution_plan_table(cursor)
     create_index_suggestion_table(cursor)
+    create_sql_digest_histogram_tables(cursor)
+    create_table_hotness_hourly_table(cursor)
+    create_deadlock_signature_stats_table(cursor)
+    create_sql_plan_regression_tables(cursor)
+    create_index_usage_stats_table(cursor)
 
 def verify_tables(cursor):
     """验证所有必需的表是否存在"""
@@ -418,6 +635,7 @@ def init_database():
 
         # 添加缺失的列（升级功能）
         add_missing_columns(cursor)
+        add_missing_indexes(cursor)
 
         # 插入默认配置
         insert_default_alert_config(cursor)
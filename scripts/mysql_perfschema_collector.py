@@ -23,11 +23,26 @@ import time
 import logging
 import hashlib
 import argparse
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import pymysql
 
+try:
+    from scripts.heavy_hitters import get_tracker
+    from scripts.plan_cache import PlanCache
+    from scripts.plan_regression import mysql_plan_hash, record_plan_samples, send_regression_alerts
+    from scripts.table_hotness import save_table_hotness
+    from scripts.workload_delta import annotate_cumulative_deltas, annotate_running_deltas
+except ImportError:
+    from heavy_hitters import get_tracker
+    from plan_cache import PlanCache
+    from plan_regression import mysql_plan_hash, record_plan_samples, send_regression_alerts
+    from table_hotness import save_table_hotness
+    from workload_delta import annotate_cumulative_deltas, annotate_running_deltas
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -71,6 +86,25 @@ def load_monitor_db_config() -> Dict:
 
 MONITOR_DB_CONFIG = load_monitor_db_config()
 
+# 直方图快照: (instance_id, schema_name, digest) -> {bucket_number: count_bucket}
+# events_statements_histogram_by_digest 的计数是累计值，需要与上一次快照做差得到本周期增量
+# 按LRU保留最近的快照，digest被淘汰(或实例下线)后不会一直占用内存
+HISTOGRAM_SNAPSHOT_LIMIT = 50000
+_histogram_snapshots: 'OrderedDict[tuple, Dict[int, int]]' = OrderedDict()
+_histogram_lock = threading.Lock()
+# 桶边界在所有MySQL 8实例上都是固定的，每个桶每个进程只需写入一次
+_histogram_saved_buckets = set()
+
+# 执行计划基线采样: 每轮读取的活跃SELECT digest数、每个实例每轮最多新执行的EXPLAIN数
+PLAN_SAMPLE_DIGEST_LIMIT = 500
+PLAN_SAMPLE_EXPLAINS_PER_CYCLE = 20
+# digest -> 计划哈希的缓存有效期(秒)，表结构/索引/数据量级变化时提前失效
+PLAN_SAMPLE_TTL = 600
+_plan_sample_cache = PlanCache(ttl=PLAN_SAMPLE_TTL)
+
+# 默认输出的百分位
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 99, 99.9)
+
 
 class MySQLPerfSchemaCollector:
     """
@@ -88,6 +122,13 @@ class MySQLPerfSchemaCollector:
         self.instance_name = instance_config.get('db_project', 'Unknown')
         self.threshold_seconds = threshold_seconds
         self.threshold_microseconds = threshold_seconds * 1000000000000  # Performance Schema用纳秒
+        # 本次采集中发生的错误(各步骤自行捕获异常，调用方据此判断采集是否失败)
+        self.errors: List[str] = []
+
+    def record_error(self, message: str):
+        """记录采集错误: 写日志并保留在 self.errors 中"""
+        logger.error(message)
+        self.errors.append(message)
 
     def connect_target(self) -> Optional[pymysql.Connection]:
         """连接目标MySQL实例"""
@@ -103,7 +144,7 @@ class MySQLPerfSchemaCollector:
             )
             return conn
         except Exception as e:
-            logger.error(f"连接目标MySQL失败 {self.instance_name}: {e}")
+            self.record_error(f"连接目标MySQL失败 {self.instance_name}: {e}")
             return None
 
     def connect_monitor(self) -> Optional[pymysql.Connection]:
@@ -111,7 +152,7 @@ class MySQLPerfSchemaCollector:
         try:
             return pymysql.connect(**MONITOR_DB_CONFIG)
         except Exception as e:
-            logger.error(f"连接监控数据库失败: {e}")
+            self.record_error(f"连接监控数据库失败: {e}")
             return None
 
     def check_perfschema_enabled(self, conn: pymysql.Connection) -> bool:
@@ -128,7 +169,7 @@ class MySQLPerfSchemaCollector:
 
                 return enabled
         except Exception as e:
-            logger.error(f"检查Performance Schema失败: {e}")
+            self.record_error(f"检查Performance Schema失败: {e}")
             return False
 
     def collect_from_perfschema(self, conn: pymysql.Connection) -> List[Dict]:
@@ -217,10 +258,17 @@ class MySQLPerfSchemaCollector:
 
                     slow_sqls.append(slow_sql)
 
-                return slow_sqls
+                # digest统计是累计值，换算成本周期增量
+                return annotate_cumulative_deltas(
+                    slow_sqls,
+                    counter_key=lambda r: (r['db_instance_id'], r['database_name'] or '', r['sql_fingerprint']),
+                    totals=lambda r: (r['execution_count'], r['total_elapsed_seconds'], r['rows_examined']),
+                    started_field='first_seen', seen_field='last_seen',
+                    watermark_key=('performance_schema', self.instance_id)
+                )
 
         except Exception as e:
-            logger.error(f"{self.instance_name}: 从Performance Schema采集失败: {e}")
+            self.record_error(f"{self.instance_name}: 从Performance Schema采集失败: {e}")
             return []
 
     def collect_from_processlist(self, conn: pymysql.Connection) -> List[Dict]:
@@ -280,12 +328,172 @@ class MySQLPerfSchemaCollector:
 
                     slow_sqls.append(slow_sql)
 
-                return slow_sqls
+                    get_tracker().observe_running(
+                        self.instance_id, row['session_id'], sql_fingerprint,
+                        slow_sql['elapsed_seconds'], sample=slow_sql['sql_text']
+                    )
+
+                return annotate_running_deltas(slow_sqls)
 
         except Exception as e:
-            logger.error(f"{self.instance_name}: 从Processlist采集失败: {e}")
+            self.record_error(f"{self.instance_name}: 从Processlist采集失败: {e}")
             return []
 
+    def feed_heavy_hitters(self, conn: pymysql.Connection) -> int:
+        """
+        把最近活跃的全部digest累计值喂给实时Top SQL跟踪器
+
+        与慢SQL采集不同，这里不按耗时阈值过滤: 高频的快SQL同样会压垮实例
+        """
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT
+                        schema_name,
+                        digest,
+                        LEFT(digest_text, 500) AS digest_text,
+                        count_star,
+                        sum_timer_wait / 1000000000000 AS total_time_seconds
+                    FROM performance_schema.events_statements_summary_by_digest
+                    WHERE last_seen >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+                      AND digest IS NOT NULL
+                    LIMIT 2000
+                """)
+                rows = cursor.fetchall()
+
+            tracker = get_tracker()
+            for row in rows:
+                tracker.observe_cumulative(
+                    self.instance_id, row['digest'][:64],
+                    int(row['count_star'] or 0), float(row['total_time_seconds'] or 0),
+                    sample=row['digest_text'],
+                    counter_key=f"{row['schema_name']}.{row['digest']}"
+                )
+            return len(rows)
+
+        except Exception as e:
+            logger.warning(f"{self.instance_name}: 更新实时Top SQL失败: {e}")
+            return 0
+
+    def collect_plan_samples(self, conn: pymysql.Connection) -> List[Dict]:
+        """
+        采集执行计划基线样本 (MySQL 8.0.3+)
+
+        慢SQL记录只包含超过阈值的SQL，旧计划很快时永远进不了基线，计划变慢后也就
+        没有可比较的对象。这里不按耗时过滤: 全部活跃SELECT digest的累计次数/耗时换算成
+        本周期增量，归到该digest当前的执行计划下。计划由 query_sample_text 的EXPLAIN
+        得到，按 (实例, 库, digest) 缓存 PLAN_SAMPLE_TTL 秒。
+
+        Returns:
+            本周期有执行的样本记录(含 plan_hash 和 delta_* 字段)
+        """
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT
+                        schema_name,
+                        digest,
+                        query_sample_text,
+                        count_star,
+                        sum_timer_wait / 1000000000000 AS total_time_seconds,
+                        sum_rows_examined,
+                        first_seen,
+                        last_seen
+                    FROM performance_schema.events_statements_summary_by_digest
+                    WHERE last_seen >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+                      AND digest IS NOT NULL
+                      AND digest_text LIKE 'SELECT%%'
+                      AND query_sample_text IS NOT NULL
+                    ORDER BY sum_timer_wait DESC
+                    LIMIT %s
+                """, (PLAN_SAMPLE_DIGEST_LIMIT,))
+                rows = cursor.fetchall()
+        except Exception as e:
+            # MySQL 5.7 没有 query_sample_text
+            logger.debug(f"{self.instance_name}: 读取执行计划采样digest失败: {e}")
+            return []
+
+        detect_time = datetime.now()
+        samples = [{
+            'db_instance_id': self.instance_id,
+            'database_name': row['schema_name'] or '',
+            'sql_fingerprint': row['digest'][:64],
+            'sql_text': row['query_sample_text'][:4000],
+            'execution_count': int(row['count_star'] or 0),
+            'total_elapsed_seconds': float(row['total_time_seconds'] or 0),
+            'rows_examined': int(row['sum_rows_examined'] or 0),
+            'first_seen': row['first_seen'],
+            'last_seen': row['last_seen'],
+            'detect_time': detect_time
+        } for row in rows]
+        annotate_cumulative_deltas(
+            samples,
+            counter_key=lambda r: ('plan_sample', r['db_instance_id'], r['database_name'], r['sql_fingerprint']),
+            totals=lambda r: (r['execution_count'], r['total_elapsed_seconds'], r['rows_examined']),
+            started_field='first_seen', seen_field='last_seen',
+            watermark_key=('plan_sample', self.instance_id)
+        )
+
+        explain_budget = PLAN_SAMPLE_EXPLAINS_PER_CYCLE
+        resolved = []
+        with conn.cursor() as cursor:
+            for sample in samples:
+                if not sample['delta_executions']:
+                    continue
+                cache_key = (self.instance_id, sample['database_name'], sample['sql_fingerprint'], 'PLAN_HASH')
+                cached = _plan_sample_cache.get(cache_key, cursor, sample['sql_text'])
+                if cached is None and explain_budget > 0:
+                    explain_budget -= 1
+                    plan_hash = self.explain_plan_hash(cursor, sample['sql_text'], sample['database_name'])
+                    if plan_hash:
+                        cached = {'plan_hash': plan_hash}
+                        _plan_sample_cache.put(cache_key, cursor, sample['sql_text'], cached)
+                if cached:
+                    sample['plan_hash'] = cached['plan_hash']
+                    resolved.append(sample)
+
+        logger.info(f"{self.instance_name}: 执行计划基线样本 {len(resolved)} 条")
+        return resolved
+
+    def explain_plan_hash(self, cursor, sql_text: str, database: str) -> Optional[str]:
+        """EXPLAIN样例SQL并计算计划哈希，样例被截断或无法EXPLAIN时返回None"""
+        try:
+            if database:
+                cursor.execute(f"USE `{database}`")
+            cursor.execute(f"EXPLAIN {sql_text}")
+            return mysql_plan_hash(list(cursor.fetchall()))
+        except Exception as e:
+            logger.debug(f"{self.instance_name}: EXPLAIN样例SQL失败: {e}")
+            return None
+
+    def save_plan_samples(self, samples: List[Dict]) -> int:
+        """累加执行计划基线并发送回归告警，返回新发现的回归数"""
+        if not samples:
+            return 0
+
+        monitor_conn = self.connect_monitor()
+        if not monitor_conn:
+            return 0
+
+        try:
+            with monitor_conn.cursor() as cursor:
+                regressions = record_plan_samples(cursor, samples)
+            monitor_conn.commit()
+
+            if regressions:
+                with monitor_conn.cursor() as cursor:
+                    send_regression_alerts(cursor, regressions,
+                                           instance_names={self.instance_id: self.instance_name})
+                monitor_conn.commit()
+            return len(regressions)
+
+        except Exception as e:
+            self.record_error(f"保存执行计划基线失败: {e}")
+            monitor_conn.rollback()
+            return 0
+        finally:
+            monitor_conn.close()
+
     def generate_fingerprint(self, sql: str) -> str:
         """生成SQL指纹 (简化版，Performance Schema的digest更准确)"""
         if not sql:
@@ -301,6 +509,135 @@ class MySQLPerfSchemaCollector:
 
         return hashlib.md5(sql.encode()).hexdigest()
 
+    def collect_digest_histograms(self, conn: pymysql.Connection, slow_sqls: List[Dict]) -> Tuple[List[Dict], Dict[int, Tuple[int, int]]]:
+        """
+        采集已采集digest的延迟直方图增量 (MySQL 8.0.19+)
+
+        数据源: performance_schema.events_statements_histogram_by_digest
+
+        说明:
+        - 只查询本轮从summary表采集到的digest，不额外扫描整张直方图表
+        - 直方图计数为累计值，与上一次快照做差得到本周期增量
+        - 首次看到的digest只记录快照，不产生增量(无法区分历史累计)
+        - 计数回退(TRUNCATE或实例重启)时，以当前值作为增量
+
+        Returns:
+            (直方图增量记录列表, 桶边界 {bucket_number: (timer_low, timer_high)})
+        """
+        digests = sorted({
+            s['sql_fingerprint'] for s in slow_sqls
+            if s.get('collection_method') == 'performance_schema' and s.get('sql_fingerprint')
+        })
+        if not digests:
+            return [], {}
+
+        try:
+            with conn.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(digests))
+                cursor.execute(f"""
+                    SELECT
+                        schema_name,
+                        digest,
+                        bucket_number,
+                        bucket_timer_low,
+                        bucket_timer_high,
+                        count_bucket
+                    FROM performance_schema.events_statements_histogram_by_digest
+                    WHERE digest IN ({placeholders})
+                      AND count_bucket > 0
+                """, digests)
+                rows = cursor.fetchall()
+        except Exception as e:
+            # MySQL 5.7 / 8.0.19之前没有该表
+            logger.debug(f"{self.instance_name}: 读取digest直方图失败: {e}")
+            return [], {}
+
+        current: Dict[tuple, Dict[int, int]] = {}
+        bucket_bounds: Dict[int, Tuple[int, int]] = {}
+        for row in rows:
+            key = (self.instance_id, row['schema_name'] or '', row['digest'])
+            bucket = int(row['bucket_number'])
+            current.setdefault(key, {})[bucket] = int(row['count_bucket'])
+            bucket_bounds[bucket] = (int(row['bucket_timer_low']), int(row['bucket_timer_high']))
+
+        sample_time = datetime.now()
+        records = []
+        with _histogram_lock:
+            for key, counts in current.items():
+                previous = _histogram_snapshots.get(key)
+                _histogram_snapshots[key] = counts
+                _histogram_snapshots.move_to_end(key)
+                while len(_histogram_snapshots) > HISTOGRAM_SNAPSHOT_LIMIT:
+                    _histogram_snapshots.popitem(last=False)
+                if previous is None:
+                    continue
+
+                if any(counts.get(b, 0) < c for b, c in previous.items()):
+                    delta = counts
+                else:
+                    delta = {b: c - previous.get(b, 0) for b, c in counts.items() if c > previous.get(b, 0)}
+
+                if not delta:
+                    continue
+
+                records.append({
+                    'db_instance_id': key[0],
+                    'schema_name': key[1],
+                    'digest': key[2],
+                    'sample_time': sample_time,
+                    'sample_count': sum(delta.values()),
+                    'bucket_counts': delta
+                })
+
+        logger.info(f"{self.instance_name}: 采集到 {len(records)} 条digest直方图增量")
+        return records, bucket_bounds
+
+    def save_digest_histograms(self, records: List[Dict], bucket_bounds: Dict[int, Tuple[int, int]]) -> int:
+        """保存digest直方图增量(稀疏桶JSON)到监控数据库"""
+        if not records:
+            return 0
+
+        monitor_conn = self.connect_monitor()
+        if not monitor_conn:
+            return 0
+
+        try:
+            with monitor_conn.cursor() as cursor:
+                new_bounds = [
+                    (b, low, high) for b, (low, high) in sorted(bucket_bounds.items())
+                    if b not in _histogram_saved_buckets
+                ]
+                if new_bounds:
+                    cursor.executemany("""
+                        INSERT IGNORE INTO sql_digest_histogram_bucket
+                        (bucket_number, bucket_timer_low, bucket_timer_high)
+                        VALUES (%s, %s, %s)
+                    """, new_bounds)
+
+                cursor.executemany("""
+                    INSERT INTO sql_digest_histogram
+                    (db_instance_id, schema_name, digest, sample_time, sample_count, bucket_counts)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, [(
+                    r['db_instance_id'],
+                    r['schema_name'],
+                    r['digest'],
+                    r['sample_time'],
+                    r['sample_count'],
+                    json.dumps(r['bucket_counts'], separators=(',', ':'))
+                ) for r in records])
+
+            monitor_conn.commit()
+            _histogram_saved_buckets.update(bucket_bounds)
+            return len(records)
+
+        except Exception as e:
+            self.record_error(f"保存digest直方图失败: {e}")
+            monitor_conn.rollback()
+            return 0
+        finally:
+            monitor_conn.close()
+
     def save_to_monitor_db(self, slow_sqls: List[Dict]) -> int:
         """保存慢SQL到监控数据库"""
         if not slow_sqls:
@@ -311,6 +648,7 @@ class MySQLPerfSchemaCollector:
             return 0
 
         saved_count = 0
+        saved_records = []
 
         try:
             with monitor_conn.cursor() as cursor:
@@ -343,15 +681,19 @@ class MySQLPerfSchemaCollector:
                         ))
 
                         saved_count += 1
+                        saved_records.append(sql_record)
 
                     except Exception as e:
                         logger.debug(f"保存单条记录失败: {e}")
 
+                # 表级热度与慢SQL日志同一事务提交
+                save_table_hotness(cursor, saved_records)
+
             monitor_conn.commit()
             logger.info(f"{self.instance_name}: 成功保存 {saved_count} 条慢SQL记录")
 
         except Exception as e:
-            logger.error(f"保存到监控数据库失败: {e}")
+            self.record_error(f"保存到监控数据库失败: {e}")
             monitor_conn.rollback()
         finally:
             monitor_conn.close()
@@ -359,7 +701,13 @@ class MySQLPerfSchemaCollector:
         return saved_count
 
     def collect(self) -> int:
-        """执行完整采集流程"""
+        """
+        执行完整采集流程
+
+        Returns:
+            保存的慢SQL条数；连接失败或某个步骤出错时错误信息记录在 self.errors
+        """
+        self.errors = []
         target_conn = self.connect_target()
         if not target_conn:
             return 0
@@ -375,6 +723,16 @@ class MySQLPerfSchemaCollector:
                 perfschema_sqls = self.collect_from_perfschema(target_conn)
                 all_slow_sqls.extend(perfschema_sqls)
 
+                # 同一批digest的延迟直方图增量 (MySQL 8)
+                histograms, bucket_bounds = self.collect_digest_histograms(target_conn, perfschema_sqls)
+                self.save_digest_histograms(histograms, bucket_bounds)
+
+                # 实时Top SQL (全部活跃digest，不限慢SQL)
+                self.feed_heavy_hitters(target_conn)
+
+                # 执行计划基线 (全部活跃SELECT digest，不限慢SQL)
+                self.save_plan_samples(self.collect_plan_samples(target_conn))
+
             # 辅助从Processlist采集当前正在运行的 (补充数据源)
             processlist_sqls = self.collect_from_processlist(target_conn)
             all_slow_sqls.extend(processlist_sqls)
@@ -388,6 +746,53 @@ class MySQLPerfSchemaCollector:
             target_conn.close()
 
 
+def compute_histogram_percentiles(bucket_counts: Dict[int, int],
+                                  bucket_bounds: Dict[int, Tuple[int, int]],
+                                  percentiles=DEFAULT_PERCENTILES) -> Dict:
+    """
+    根据合并后的直方图桶计算百分位延迟和累计分布曲线
+
+    桶内按线性插值估算，误差不超过单个桶宽度(MySQL 8的桶宽约为下界的4.7%)
+
+    Args:
+        bucket_counts: {bucket_number: count}
+        bucket_bounds: {bucket_number: (timer_low, timer_high)}，单位皮秒
+        percentiles: 需要计算的百分位
+
+    Returns:
+        {'total_count', 'percentiles': {'p99': 秒, ...}, 'curve': [{'le_seconds', 'ratio'}, ...]}
+    """
+    buckets = sorted(b for b, c in bucket_counts.items() if c > 0 and b in bucket_bounds)
+    total = sum(bucket_counts[b] for b in buckets)
+    result = {'total_count': total, 'percentiles': {}, 'curve': []}
+    if total == 0:
+        return result
+
+    cumulative = 0
+    for b in buckets:
+        cumulative += bucket_counts[b]
+        result['curve'].append({
+            'le_seconds': bucket_bounds[b][1] / 1e12,
+            'ratio': round(cumulative / total, 6)
+        })
+
+    for p in percentiles:
+        rank = total * p / 100.0
+        cumulative = 0
+        value = bucket_bounds[buckets[-1]][1]
+        for b in buckets:
+            count = bucket_counts[b]
+            if cumulative + count >= rank:
+                low, high = bucket_bounds[b]
+                value = low + (high - low) * (rank - cumulative) / count
+                break
+            cumulative += count
+        label = f"p{p:g}".replace('.', '_')
+        result['percentiles'][label] = round(value / 1e12, 6)
+
+    return result
+
+
 def get_mysql_instances() -> List[Dict]:
     """获取所有MySQL实例"""
     try:
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+执行计划缓存
+
+同一形态的慢SQL反复出现时，每次都在生产库上跑EXPLAIN既浪费又有风险。
+缓存以 (实例, 库名, SQL指纹, 计划类型) 为键，保存在进程内存中，并可由
+sql_execution_plan 表回填(重启后或另一个工作线程产生的计划)。
+
+失效条件:
+- TTL: 缓存时间超过 ttl 秒
+- 表版本: SQL引用的每张表记录一个版本标记
+      CREATE_TIME | 索引名集合 | TABLE_ROWS 的数量级(每4倍一档)
+  表重建/加减索引/数据量跨档时标记变化，缓存随之失效。
+  UPDATE_TIME 在繁忙表上每次写入都会变化，不作为失效依据。
+
+表版本按 (实例, 库, 表) 缓存 validate_interval 秒，过期的表在一次
+information_schema 查询中批量刷新，多个指纹共享同一张表时只查一次。
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from scripts.sql_fingerprint import SQLFingerprint
+except ImportError:
+    from sql_fingerprint import SQLFingerprint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600  # 秒
+DEFAULT_VALIDATE_INTERVAL = 60  # 秒
+DEFAULT_MAX_ENTRIES = 5000
+
+# 表不存在(临时表、视图、已删除)时的版本标记
+_MISSING_TABLE = 'missing'
+
+PlanKey = Tuple[int, str, str, str]
+
+
+def referenced_tables(sql_text: str, default_schema: str) -> List[Tuple[str, str]]:
+    """SQL引用的 (库名, 表名)，未限定库名的表归到 default_schema"""
+    tables = []
+    for ref in SQLFingerprint.extract_table_refs(sql_text):
+        schema_name = ref[-2] if len(ref) > 1 else default_schema
+        if not schema_name:
+            continue
+        table = (schema_name, ref[-1])
+        if table not in tables:
+            tables.append(table)
+    return tables
+
+
+def query_mysql_table_versions(cursor, tables: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """一次查询取回多张表的版本标记"""
+    if not tables:
+        return {}
+
+    placeholders = ', '.join(['(%s, %s)'] * len(tables))
+    params = [part for table in tables for part in table]
+    cursor.execute(f"""
+        SELECT t.TABLE_SCHEMA AS schema_name, t.TABLE_NAME AS table_name,
+               t.CREATE_TIME AS create_time, t.TABLE_ROWS AS table_rows,
+               (SELECT GROUP_CONCAT(DISTINCT s.INDEX_NAME ORDER BY s.INDEX_NAME)
+                FROM information_schema.STATISTICS s
+                WHERE s.TABLE_SCHEMA = t.TABLE_SCHEMA AND s.TABLE_NAME = t.TABLE_NAME) AS index_names
+        FROM information_schema.TABLES t
+        WHERE (t.TABLE_SCHEMA, t.TABLE_NAME) IN ({placeholders})
+    """, params)
+
+    versions = {table: _MISSING_TABLE for table in tables}
+    lookup = {(s.lower(), t.lower()): (s, t) for s, t in tables}
+    for row in cursor.fetchall():
+        table = lookup.get((str(row['schema_name']).lower(), str(row['table_name']).lower()))
+        if table is None:
+            continue
+        versions[table] = '|'.join((
+            str(row.get('create_time') or ''),
+            row.get('index_names') or '',
+            str(int(row.get('table_rows') or 0).bit_length() // 2)
+        ))
+    return versions
+
+
+class PlanCache:
+    """执行计划缓存（线程安全）"""
+
+    def __init__(self, ttl: int = DEFAULT_TTL, validate_interval: int = DEFAULT_VALIDATE_INTERVAL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 monitor_conn_factory: Optional[Callable] = None):
+        """
+        Args:
+            ttl: 计划最长缓存秒数
+            validate_interval: 表版本的复查间隔(秒)
+            max_entries: 内存中最多缓存的计划数(LRU淘汰)
+            monitor_conn_factory: 返回监控库连接的函数，提供时未命中内存会回查 sql_execution_plan
+        """
+        self.ttl = ttl
+        self.validate_interval = validate_interval
+        self.max_entries = max_entries
+        self.monitor_conn_factory = monitor_conn_factory
+        # key -> {'plan', 'cached_at', 'versions'}
+        self._entries: 'OrderedDict[PlanKey, Dict]' = OrderedDict()
+        # (实例, 库, 表) -> (检查时间, 版本标记)
+        self._table_versions: Dict[Tuple[int, str, str], Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def current_versions(self, instance_id: int, cursor,
+                         tables: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        取表的当前版本标记，只刷新超过复查间隔的表
+
+        Returns:
+            {'库.表': 版本标记}；版本查询失败时返回 None
+        """
+        now = time.time()
+        result = {}
+        stale = []
+        with self._lock:
+            for schema_name, table_name in tables:
+                cached = self._table_versions.get((instance_id, schema_name, table_name))
+                if cached and now - cached[0] < self.validate_interval:
+                    result[f"{schema_name}.{table_name}"] = cached[1]
+                else:
+                    stale.append((schema_name, table_name))
+
+        if stale:
+            try:
+                fresh = query_mysql_table_versions(cursor, stale)
+            except Exception as e:
+                logger.debug(f"查询表版本失败: {e}")
+                return None
+            with self._lock:
+                for (schema_name, table_name), version in fresh.items():
+                    self._table_versions[(instance_id, schema_name, table_name)] = (now, version)
+                    result[f"{schema_name}.{table_name}"] = version
+        return result
+
+    def get(self, key: PlanKey, cursor, sql_text: str) -> Optional[Dict]:
+        """
+        读取仍然有效的计划
+
+        Args:
+            key: (实例ID, 库名, SQL指纹, 计划类型)
+            cursor: 目标库游标，用于复查表版本
+            sql_text: 原始SQL，用于提取引用的表
+        """
+        instance_id, schema_name = key[0], key[1]
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['cached_at'] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+        if entry is None:
+            entry = self._load_persisted(key)
+            if entry is None or now - entry['cached_at'] > self.ttl:
+                self.misses += 1
+                return None
+
+        versions = self.current_versions(instance_id, cursor, referenced_tables(sql_text, schema_name))
+        if versions is None or versions != entry['versions']:
+            with self._lock:
+                self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+        self.hits += 1
+        return entry['plan']
+
+    def put(self, key: PlanKey, cursor, sql_text: str, plan: Dict) -> Optional[Dict[str, str]]:
+        """
+        缓存刚执行EXPLAIN得到的计划
+
+        Returns:
+            本次记录的表版本(调用方持久化到 sql_execution_plan.table_versions)；
+            表版本查询失败时不缓存，返回 None
+        """
+        versions = self.current_versions(key[0], cursor, referenced_tables(sql_text, key[1]))
+        if versions is None:
+            return None
+        with self._lock:
+            self._entries[key] = {'plan': plan, 'cached_at': time.time(), 'versions': versions}
+            self._entries.move_to_end(key)
+            self._evict()
+        return versions
+
+    def invalidate(self, instance_id: Optional[int] = None):
+        """清空缓存（指定实例时只清该实例）"""
+        with self._lock:
+            if instance_id is None:
+                self._entries.clear()
+                self._table_versions.clear()
+                return
+            for key in [k for k in self._entries if k[0] == instance_id]:
+                del self._entries[key]
+            for key in [k for k in self._table_versions if k[0] == instance_id]:
+                del self._table_versions[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'tables': len(self._table_versions),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_persisted(self, key: PlanKey) -> Optional[Dict]:
+        """从 sql_execution_plan 回填最近一次带表版本的计划"""
+        if self.monitor_conn_factory is None:
+            return None
+
+        instance_id, schema_name, fingerprint, plan_type = key
+        conn = None
+        try:
+            conn = self.monitor_conn_factory()
+            if not conn:
+                return None
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT plan_json, table_versions, created_at
+                    FROM sql_execution_plan
+                    WHERE db_instance_id = %s AND sql_fingerprint = %s
+                      AND schema_name = %s AND plan_type = %s
+                      AND table_versions IS NOT NULL
+                      AND created_at >= DATE_SUB(NOW(), INTERVAL %s SECOND)
+                    ORDER BY id DESC
+                    LIMIT 1
+                """, (instance_id, fingerprint, schema_name, plan_type, self.ttl))
+                row = cursor.fetchone()
+        except Exception as e:
+            logger.debug(f"回查sql_execution_plan失败: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+        if not row or not row.get('plan_json'):
+            return None
+
+        plan = row['plan_json']
+        versions = row['table_versions']
+        created_at = row['created_at']
+        return {
+            'plan': json.loads(plan) if isinstance(plan, str) else plan,
+            'versions': json.loads(versions) if isinstance(versions, str) else versions,
+            'cached_at': created_at.timestamp() if isinstance(created_at, datetime) else time.time()
+        }
+
+
+_plan_cache: Optional[PlanCache] = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache(monitor_conn_factory: Optional[Callable] = None) -> PlanCache:
+    """获取进程内共享的执行计划缓存（首次调用时可指定监控库连接函数）"""
+    global _plan_cache
+    if _plan_cache is None:
+        with _plan_cache_lock:
+            if _plan_cache is None:
+                _plan_cache = PlanCache(monitor_conn_factory=monitor_conn_factory)
+    if monitor_conn_factory is not None and _plan_cache.monitor_conn_factory is None:
+        _plan_cache.monitor_conn_factory = monitor_conn_factory
+    return _plan_cache
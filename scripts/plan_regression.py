@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+执行计划回归检测
+
+每个采集到的执行计划都计算一个归一化的计划哈希:
+- MySQL: 按连接顺序取每张表的 (表名, 访问类型, 使用的索引)，
+  EXPLAIN FORMAT=JSON 和传统 EXPLAIN 行格式得到相同的哈希
+- SQL Server: Showplan 算子树(xml_stream.extract_query_plan 中计算)
+
+入库时按 (实例, SQL指纹, 计划哈希) 累加本周期的执行次数和耗时增量(workload_delta)到
+sql_plan_baseline。基线必须覆盖全部执行(包括很快的旧计划)，不能只来自慢SQL:
+- MySQL: 全部活跃SELECT digest的累计值增量，归到该digest当前的EXPLAIN计划下
+  (mysql_perfschema_collector.collect_plan_samples)
+- SQL Server: 查询出现在慢SQL中时，读取它全部计划的Query Store运行统计，不按耗时过滤
+  (sqlserver_querystore_collector.collect_plan_samples)
+同一指纹出现不同计划时比较两个计划的平均耗时，新计划明显变慢即记为一次回归
+(sql_plan_regression，同一对计划只记录一次)，并可通过 AlertManager 发送告警。
+全部增量计算，只读取本批次涉及的指纹。
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    from scripts.workload_delta import record_delta
+except ImportError:
+    from workload_delta import record_delta
+
+logger = logging.getLogger(__name__)
+
+# 新计划平均耗时达到旧计划的多少倍算回归
+REGRESSION_RATIO = 3.0
+# 新旧计划各自至少需要的执行次数
+MIN_EXECUTIONS = 3
+# 新计划平均耗时低于该值(秒)时不告警
+MIN_REGRESSED_SECONDS = 0.5
+
+
+def _collect_mysql_tables(node, tables: List[Tuple[str, str, str]]):
+    """按文档顺序(即连接顺序)收集EXPLAIN JSON中的表访问"""
+    if isinstance(node, dict):
+        table = node.get('table')
+        if isinstance(table, dict) and 'table_name' in table:
+            tables.append((str(table.get('table_name', '')), str(table.get('access_type', '')),
+                           str(table.get('key', '') or '')))
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                _collect_mysql_tables(value, tables)
+    elif isinstance(node, list):
+        for item in node:
+            _collect_mysql_tables(item, tables)
+
+
+def mysql_plan_hash(plan: Union[Dict, List, str, None]) -> Optional[str]:
+    """
+    计算MySQL执行计划哈希
+
+    Args:
+        plan: EXPLAIN FORMAT=JSON 结果(dict)，或传统EXPLAIN的行列表
+              [{'table', 'type', 'key', ...}]，也可以是它们的JSON文本
+    """
+    if isinstance(plan, str):
+        try:
+            plan = json.loads(plan)
+        except ValueError:
+            return None
+    if not plan:
+        return None
+
+    tables: List[Tuple[str, str, str]] = []
+    if isinstance(plan, list) and plan and isinstance(plan[0], dict) and 'type' in plan[0]:
+        tables = [(str(row.get('table') or ''), str(row.get('type') or ''), str(row.get('key') or ''))
+                  for row in plan]
+    else:
+        _collect_mysql_tables(plan, tables)
+
+    if not tables:
+        return None
+    signature = '\n'.join('|'.join(t) for t in tables)
+    return hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+
+def _aggregate_samples(records: List[Dict]) -> Dict[Tuple, Dict]:
+    samples: Dict[Tuple, Dict] = {}
+    for record in records:
+        plan_hash = record.get('plan_hash')
+        fingerprint = record.get('sql_fingerprint')
+        if not plan_hash or not fingerprint:
+            continue
+        executions, elapsed, _ = record_delta(record)
+        if not executions and not elapsed:
+            continue
+        seen_at = record.get('detect_time') or datetime.now()
+
+        key = (record.get('db_instance_id'), fingerprint, plan_hash)
+        sample = samples.get(key)
+        if sample is None:
+            samples[key] = {
+                'executions': int(executions),
+                'total_elapsed': float(elapsed),
+                'seen_at': seen_at,
+                'sample_sql': (record.get('sql_text') or '')[:2000]
+            }
+        else:
+            sample['executions'] += int(executions)
+            sample['total_elapsed'] += float(elapsed)
+            sample['seen_at'] = max(sample['seen_at'], seen_at)
+    return samples
+
+
+def record_plan_samples(cursor, records: List[Dict]) -> List[Dict]:
+    """
+    累加计划样本并检测回归（在调用方的事务中执行，由调用方提交）
+
+    Args:
+        cursor: 监控库游标(DictCursor)
+        records: 执行计划基线样本，需含 db_instance_id / sql_fingerprint / plan_hash，
+                 次数和耗时取 workload_delta.annotate_* 计算的本周期增量
+
+    Returns:
+        本次新发现的回归列表
+    """
+    samples = _aggregate_samples(records)
+    if not samples:
+        return []
+
+    try:
+        cursor.executemany("""
+            INSERT INTO sql_plan_baseline
+            (db_instance_id, sql_fingerprint, plan_hash, execution_count, total_elapsed_seconds,
+             first_seen, last_seen, sample_sql)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                execution_count = execution_count + VALUES(execution_count),
+                total_elapsed_seconds = total_elapsed_seconds + VALUES(total_elapsed_seconds),
+                last_seen = GREATEST(last_seen, VALUES(last_seen))
+        """, [key + (s['executions'], s['total_elapsed'], s['seen_at'], s['seen_at'], s['sample_sql'])
+              for key, s in samples.items()])
+
+        pairs = sorted({key[:2] for key in samples})
+        placeholders = ', '.join(['(%s, %s)'] * len(pairs))
+        cursor.execute(f"""
+            SELECT db_instance_id, sql_fingerprint, plan_hash, execution_count,
+                   total_elapsed_seconds, first_seen, last_seen
+            FROM sql_plan_baseline
+            WHERE (db_instance_id, sql_fingerprint) IN ({placeholders})
+        """, [part for pair in pairs for part in pair])
+        plans_by_fingerprint: Dict[Tuple, List[Dict]] = {}
+        for row in cursor.fetchall():
+            plans_by_fingerprint.setdefault((row['db_instance_id'], row['sql_fingerprint']), []).append(row)
+    except Exception as e:
+        logger.warning(f"更新执行计划基线失败: {e}")
+        return []
+
+    regressions = []
+    for (instance_id, fingerprint, plan_hash), sample in samples.items():
+        plans = plans_by_fingerprint.get((instance_id, fingerprint), [])
+        current = next((p for p in plans if p['plan_hash'] == plan_hash), None)
+        others = [p for p in plans if p['plan_hash'] != plan_hash]
+        if current is None or not others:
+            continue
+
+        # 与最近一次使用的其他计划比较
+        previous = max(others, key=lambda p: p['last_seen'])
+        if current['execution_count'] < MIN_EXECUTIONS or previous['execution_count'] < MIN_EXECUTIONS:
+            continue
+
+        new_avg = float(current['total_elapsed_seconds']) / current['execution_count']
+        old_avg = float(previous['total_elapsed_seconds']) / previous['execution_count']
+        if new_avg < MIN_REGRESSED_SECONDS or new_avg < old_avg * REGRESSION_RATIO:
+            continue
+
+        regression = {
+            'db_instance_id': instance_id,
+            'sql_fingerprint': fingerprint,
+            'old_plan_hash': previous['plan_hash'],
+            'new_plan_hash': plan_hash,
+            'old_avg_elapsed': round(old_avg, 6),
+            'new_avg_elapsed': round(new_avg, 6),
+            'slowdown_ratio': round(new_avg / old_avg, 2) if old_avg > 0 else None,
+            'old_executions': previous['execution_count'],
+            'new_executions': current['execution_count'],
+            'sample_sql': sample['sample_sql']
+        }
+        try:
+            inserted = cursor.execute("""
+                INSERT IGNORE INTO sql_plan_regression
+                (db_instance_id, sql_fingerprint, old_plan_hash, new_plan_hash,
+                 old_avg_elapsed, new_avg_elapsed, slowdown_ratio,
+                 old_executions, new_executions, sample_sql, detected_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            """, (instance_id, fingerprint, regression['old_plan_hash'], plan_hash,
+                  regression['old_avg_elapsed'], regression['new_avg_elapsed'], regression['slowdown_ratio'],
+                  regression['old_executions'], regression['new_executions'], regression['sample_sql']))
+        except Exception as e:
+            logger.warning(f"记录执行计划回归失败: {e}")
+            continue
+
+        if inserted:
+            regression['id'] = cursor.lastrowid
+            regressions.append(regression)
+            logger.warning(f"执行计划回归: 实例{instance_id} 指纹{fingerprint} "
+                           f"{old_avg:.3f}s -> {new_avg:.3f}s ({regression['slowdown_ratio']}x)")
+
+    return regressions
+
+
+def send_regression_alerts(cursor, regressions: List[Dict], alert_manager=None,
+                           instance_names: Optional[Dict[int, str]] = None) -> int:
+    """
+    发送执行计划回归告警，并标记 alert_sent
+
+    Args:
+        cursor: 监控库游标
+        regressions: record_plan_samples 的返回值
+        alert_manager: utils.alert.AlertManager，未提供时按 alert_config.json 创建(异步投递，
+                       此时 alert_sent 表示告警已进入投递队列)
+        instance_names: 实例ID -> 名称
+
+    Returns:
+        发送成功的告警数
+    """
+    if not regressions:
+        return 0
+
+    if alert_manager is None:
+        try:
+            from utils.alert import AlertManager, load_alert_config
+        except ImportError:
+            logger.debug("utils.alert 不可用，跳过执行计划回归告警")
+            return 0
+        alert_manager = AlertManager(load_alert_config(), async_dispatch=True)
+        if not alert_manager.channels:
+            return 0
+
+    sent = 0
+    for regression in regressions:
+        info = dict(regression)
+        info['instance_name'] = (instance_names or {}).get(regression['db_instance_id'], regression['db_instance_id'])
+        if alert_manager.send_plan_regression_alert(info):
+            sent += 1
+            try:
+                cursor.execute("UPDATE sql_plan_regression SET alert_sent = 1 WHERE id = %s", (regression['id'],))
+            except Exception as e:
+                logger.debug(f"标记回归告警状态失败: {e}")
+    return sent
+
+
+class _MemoryBaselineCursor:
+    """测试用: 在内存中模拟 sql_plan_baseline / sql_plan_regression 的写入和查询"""
+
+    def __init__(self):
+        self.baseline: Dict[Tuple, Dict] = {}
+        self.regressions: Dict[Tuple, Dict] = {}
+        self.lastrowid = 0
+        self._rows: List[Dict] = []
+
+    def executemany(self, sql: str, rows: List[Tuple]):
+        for instance_id, fingerprint, plan_hash, executions, elapsed, first_seen, last_seen, _ in rows:
+            plan = self.baseline.setdefault((instance_id, fingerprint, plan_hash), {
+                'db_instance_id': instance_id, 'sql_fingerprint': fingerprint, 'plan_hash': plan_hash,
+                'execution_count': 0, 'total_elapsed_seconds': 0.0, 'first_seen': first_seen, 'last_seen': last_seen})
+            plan['execution_count'] += executions
+            plan['total_elapsed_seconds'] += elapsed
+            plan['last_seen'] = max(plan['last_seen'], last_seen)
+
+    def execute(self, sql: str, params=()):
+        if 'FROM sql_plan_baseline' in sql:
+            pairs = set(zip(params[::2], params[1::2]))
+            self._rows = [dict(p) for p in self.baseline.values() if (p['db_instance_id'], p['sql_fingerprint']) in pairs]
+            return len(self._rows)
+        key = tuple(params[:4])
+        if key in self.regressions:
+            return 0
+        self.lastrowid += 1
+        self.regressions[key] = {'id': self.lastrowid}
+        return 1
+
+    def fetchall(self) -> List[Dict]:
+        return self._rows
+
+
+# 测试代码: 很快的旧计划切换为慢100倍的新计划，应记录一次回归
+if __name__ == '__main__':
+    from datetime import timedelta
+
+    try:
+        from scripts.workload_delta import WorkloadDeltaTracker, annotate_cumulative_deltas
+    except ImportError:
+        from workload_delta import WorkloadDeltaTracker, annotate_cumulative_deltas
+
+    tracker = WorkloadDeltaTracker()
+    cursor = _MemoryBaselineCursor()
+    start = datetime(2026, 1, 1)
+    count, total = 1000, 20.0  # 旧计划 20ms
+    found = []
+    for cycle in range(6):
+        slow = cycle >= 3
+        count += 50
+        total += 50 * (2.0 if slow else 0.02)  # 新计划 2s
+        sample = {
+            'db_instance_id': 1, 'sql_fingerprint': 'digest', 'sql_text': 'SELECT * FROM t WHERE a = 1',
+            'plan_hash': 'slow_plan' if slow else 'fast_plan',
+            'execution_count': count, 'total_elapsed_seconds': total,
+            'last_seen': start + timedelta(minutes=cycle), 'detect_time': start + timedelta(minutes=cycle)
+        }
+        annotate_cumulative_deltas([sample], lambda r: (r['db_instance_id'], r['sql_fingerprint']),
+                                   lambda r: (r['execution_count'], r['total_elapsed_seconds'], 0),
+                                   tracker=tracker)
+        found.extend(record_plan_samples(cursor, [sample]))
+
+    assert len(found) == 1 and len(cursor.regressions) == 1, found
+    regression = found[0]
+    assert (regression['old_plan_hash'], regression['new_plan_hash']) == ('fast_plan', 'slow_plan'), regression
+    print(f"检测到回归: {regression['old_avg_elapsed']}s -> {regression['new_avg_elapsed']}s "
+          f"({regression['slowdown_ratio']}x)")
@@ -3,26 +3,128 @@
 """
 Prometheus客户端
 用于查询Prometheus API获取MySQL监控指标
+
+进程内通过 get_prometheus_client() 共享同一个客户端: 复用 requests.Session 的
+keep-alive 连接池，互不依赖的PromQL由小线程池并发执行，健康检查结果缓存几秒，
+趋势类范围查询经 RangeQueryCache 增量获取。
 """
 
+import re
+import time
 import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+from requests.adapters import HTTPAdapter
+
+try:
+    from scripts.prometheus_range_cache import (RangeQueryCache, DEFAULT_SEGMENT_POINTS,
+                                                parse_step, parse_time, split_range, merge_matrix)
+    from scripts.downsample import downsample_points
+    from scripts.prometheus_targets import TargetIndex
+except ImportError:
+    from prometheus_range_cache import (RangeQueryCache, DEFAULT_SEGMENT_POINTS,
+                                        parse_step, parse_time, split_range, merge_matrix)
+    from downsample import downsample_points
+    from prometheus_targets import TargetIndex
 
 logger = logging.getLogger(__name__)
 
+# 并发执行PromQL的线程数(同时也是连接池大小)
+DEFAULT_MAX_WORKERS = 16
+# 健康检查结果缓存秒数
+HEALTH_CACHE_SECONDS = 5
+# 目标索引建立失败后的重试间隔(秒)
+TARGETS_RETRY_SECONDS = 60
+
+# 查询超过该长度时改用POST(大规模实例的 ip=~ 正则会让URL过长)
+POST_QUERY_THRESHOLD = 2000
+
+# 进程CPU/内存指标的键: 由 process_exporter/node_exporter 等其他job采集，只按 ip 标签匹配
+PROCESS_METRIC_KEYS = frozenset({'cpu_usage', 'memory_bytes'})
+
+# MySQL即时指标: (指标键, PromQL模板)，{sel} 为 ip 标签选择器
+MYSQL_INSTANT_METRICS = (
+    # 1. 连接数指标
+    ('connections', 'mysql_global_status_threads_connected{{{sel}}}'),
+    ('max_connections', 'mysql_global_variables_max_connections{{{sel}}}'),
+    ('threads_running', 'mysql_global_status_threads_running{{{sel}}}'),
+    # 2. QPS/TPS指标
+    ('qps', 'rate(mysql_global_status_questions{{{sel}}}[1m])'),
+    ('tps', 'rate(mysql_global_status_commands_total{{command="commit",{sel}}}[1m])'
+            ' + ignoring(command) rate(mysql_global_status_commands_total{{command="rollback",{sel}}}[1m])'),
+    # 3. Buffer Pool指标: 命中率、使用率、脏页比例
+    ('buffer_pool_hit_rate', '(mysql_global_status_innodb_buffer_pool_read_requests{{{sel}}}'
+                             ' - mysql_global_status_innodb_buffer_pool_reads{{{sel}}})'
+                             ' / mysql_global_status_innodb_buffer_pool_read_requests{{{sel}}} * 100'),
+    ('buffer_pool_usage', 'mysql_global_status_innodb_buffer_pool_bytes_data{{{sel}}}'
+                          ' / mysql_global_variables_innodb_buffer_pool_size{{{sel}}} * 100'),
+    ('buffer_pool_dirty_pages', 'mysql_global_status_innodb_buffer_pool_pages_dirty{{{sel}}}'
+                                ' / mysql_global_status_innodb_buffer_pool_pages_total{{{sel}}} * 100'),
+    # 4. 复制延迟及IO/SQL线程
+    ('replication_lag', 'mysql_slave_status_seconds_behind_master{{{sel}}}'),
+    ('slave_io_running', 'mysql_slave_status_slave_io_running{{{sel}}}'),
+    ('slave_sql_running', 'mysql_slave_status_slave_sql_running{{{sel}}}'),
+    # 5. 慢查询
+    ('slow_queries_rate', 'rate(mysql_global_status_slow_queries{{{sel}}}[5m])'),
+    # 6. InnoDB行锁
+    ('innodb_row_lock_waits', 'mysql_global_status_innodb_row_lock_waits{{{sel}}}'),
+    ('innodb_row_lock_time_avg', 'mysql_global_status_innodb_row_lock_time_avg{{{sel}}}'),
+    # 7. 表锁
+    ('table_locks_waited', 'mysql_global_status_table_locks_waited{{{sel}}}'),
+    # 8. 临时表
+    ('tmp_tables_rate', 'rate(mysql_global_status_created_tmp_tables{{{sel}}}[1m])'),
+    ('tmp_disk_tables_rate', 'rate(mysql_global_status_created_tmp_disk_tables{{{sel}}}[1m])'),
+    # 9. 磁盘IO
+    ('innodb_data_reads_rate', 'rate(mysql_global_status_innodb_data_reads{{{sel}}}[1m])'),
+    ('innodb_data_writes_rate', 'rate(mysql_global_status_innodb_data_writes{{{sel}}}[1m])'),
+    # 10. 进程CPU使用率（需要process_exporter或node_exporter）
+    ('cpu_usage', 'rate(process_cpu_seconds_total{{{sel}}}[5m]) * 100'),
+    # 11. 进程内存使用（字节）
+    ('memory_bytes', 'process_resident_memory_bytes{{{sel}}}'),
+)
+
+# SQL Server即时指标（SQL Server exporter的metric名称可能不同，需要根据实际情况调整）
+SQLSERVER_INSTANT_METRICS = (
+    ('connections', 'mssql_connections{{{sel}}}'),
+    ('max_connections', 'mssql_server_properties_max_connections{{{sel}}}'),
+    # 批处理请求（类似于MySQL的QPS）、SQL编译数/秒
+    ('batch_requests', 'rate(mssql_batch_requests{{{sel}}}[1m])'),
+    ('sql_compilations', 'rate(mssql_sql_compilations{{{sel}}}[1m])'),
+    # Buffer Cache Hit Ratio、页面生命期望值(越高越好)
+    ('buffer_cache_hit_ratio', 'mssql_buffer_cache_hit_ratio{{{sel}}}'),
+    ('page_life_expectancy', 'mssql_page_life_expectancy{{{sel}}}'),
+    # 锁等待/秒、死锁数/秒
+    ('lock_waits_rate', 'rate(mssql_lock_waits{{{sel}}}[1m])'),
+    ('deadlocks_rate', 'rate(mssql_deadlocks{{{sel}}}[1m])'),
+    ('io_stall_seconds', 'mssql_io_stall_seconds{{{sel}}}'),
+    ('user_errors_rate', 'rate(mssql_user_errors{{{sel}}}[1m])'),
+    # Always On 同步状态、数据库状态
+    ('ao_sync_health', 'mssql_ao_synchronization_health{{{sel}}}'),
+    ('database_state', 'mssql_database_state{{{sel}}}'),
+    # Target/Total Server Memory (KB)
+    ('target_memory_kb', 'mssql_memory_target_kb{{{sel}}}'),
+    ('total_memory_kb', 'mssql_memory_total_kb{{{sel}}}'),
+    # 系统资源（如果有process_exporter）
+    ('cpu_usage', 'rate(process_cpu_seconds_total{{{sel}}}[5m]) * 100'),
+    ('memory_bytes', 'process_resident_memory_bytes{{{sel}}}'),
+)
+
 
 class PrometheusClient:
     """Prometheus API客户端"""
 
-    def __init__(self, url: str, timeout: int = 5):
+    def __init__(self, url: str, timeout: int = 5, max_workers: int = DEFAULT_MAX_WORKERS):
         """
         初始化Prometheus客户端
 
         Args:
             url: Prometheus服务器URL (如: http://192.168.98.4:9090)
             timeout: 请求超时时间（秒）
+            max_workers: 并发查询线程数
         """
         self.url = url.rstrip('/')
         self.api_url = f"{self.url}/api/v1"
@@ -32,6 +134,38 @@ class PrometheusClient:
             'http': None,
             'https': None
         }
+        # keep-alive连接池，大小与并发线程数一致
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prometheus')
+        self._health: Optional[Tuple[float, bool]] = None
+        self._health_lock = threading.Lock()
+        self.range_cache = RangeQueryCache()
+        self.targets = TargetIndex()
+        self._targets_lock = threading.Lock()
+        self._targets_attempted = 0.0
+
+    def run_parallel(self, tasks: Dict[Any, Callable[[], Any]]) -> Dict[Any, Any]:
+        """
+        并发执行一组互不依赖的查询
+
+        Args:
+            tasks: {键: 无参函数}
+
+        Returns:
+            {键: 函数返回值}
+        """
+        if len(tasks) <= 1:
+            return {key: func() for key, func in tasks.items()}
+        futures = {key: self._executor.submit(func) for key, func in tasks.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+    def close(self):
+        """关闭线程池和连接池"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
 
     def query(self, promql: str) -> Optional[Dict]:
         """
@@ -44,12 +178,20 @@ class PrometheusClient:
             查询结果，失败返回None
         """
         try:
-            response = requests.get(
-                f"{self.api_url}/query",
-                params={'query': promql},
-                timeout=self.timeout,
-                proxies=self.proxies
-            )
+            if len(promql) > POST_QUERY_THRESHOLD:
+                response = self.session.post(
+                    f"{self.api_url}/query",
+                    data={'query': promql},
+                    timeout=self.timeout,
+                    proxies=self.proxies
+                )
+            else:
+                response = self.session.get(
+                    f"{self.api_url}/query",
+                    params={'query': promql},
+                    timeout=self.timeout,
+                    proxies=self.proxies
+                )
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -70,7 +212,7 @@ class PrometheusClient:
             查询结果，失败返回None
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_url}/query_range",
                 params={
                     'query': promql,
@@ -87,6 +229,61 @@ class PrometheusClient:
             logger.error(f"Prometheus范围查询失败: {promql}, 错误: {e}")
             return None
 
+    def query_range_cached(self, promql: str, start: datetime, end: datetime, step: str = '1m') -> Optional[Dict]:
+        """
+        带缓存的范围查询：start/end 对齐到 step，只请求缓存中缺少的头尾部分
+
+        Args:
+            promql: PromQL查询语句
+            start / end: 起止时间
+            step: 步长（如: 1m, 5m）
+
+        Returns:
+            与 query_range 相同结构的结果，失败返回None
+        """
+        return self.range_cache.query_range(
+            self._fetch_range, promql, start.timestamp(), end.timestamp(), step
+        )
+
+    def query_range_split(self, promql: str, start, end, step: str = '15s',
+                          max_points: int = DEFAULT_SEGMENT_POINTS) -> Optional[Dict]:
+        """
+        长范围查询：按步长对齐切成每段不超过 max_points 个点的子区间，
+        通过连接池并发请求后合并去重；每段单独缓存
+
+        Args:
+            promql: PromQL查询语句
+            start / end: Unix时间戳、RFC3339字符串或datetime
+            step: 步长（如: 15s, 1m）
+            max_points: 每段最多的点数
+
+        Returns:
+            与 query_range 相同结构的结果，任一段失败返回None
+        """
+        try:
+            start_ts, end_ts = parse_time(start), parse_time(end)
+            step_seconds = parse_step(step)
+        except ValueError:
+            # 无法解析的参数(如 1m30s 这类复合步长)交给Prometheus自行处理
+            return self.query_range(promql, start, end, step)
+        if step_seconds <= 0 or end_ts < start_ts:
+            return self.query_range(promql, start, end, step)
+
+        segments = split_range(start_ts, end_ts, step_seconds, max_points)
+        results = self.run_parallel({
+            segment: (lambda segment=segment, low=low, high=high: self.range_cache.query_range(
+                self._fetch_range, promql, low, high, step_seconds, segment=segment))
+            for segment, low, high in segments
+        })
+
+        responses = [results.get(segment) for segment, _, _ in segments]
+        if not all(response and response.get('status') == 'success' for response in responses):
+            return None
+        return merge_matrix(responses)
+
+    def _fetch_range(self, promql: str, start: float, end: float, step_seconds: float) -> Optional[Dict]:
+        return self.query_range(promql, f"{start:.3f}", f"{end:.3f}", f"{step_seconds:g}s")
+
     def get_instance_metrics(self, instance_ip: str) -> Dict[str, Any]:
         """
         获取实例的关键指标
@@ -97,194 +294,159 @@ class PrometheusClient:
         Returns:
             包含各项指标的字典
         """
-        metrics = {
-            'instance_ip': instance_ip,
-            'timestamp': datetime.now().isoformat()
-        }
+        return self.get_fleet_metrics([instance_ip]).get(instance_ip) or self._empty_metrics(
+            instance_ip, MYSQL_INSTANT_METRICS, _derive_mysql_metrics)
 
-        # 1. 连接数指标
-        conn_query = f'mysql_global_status_threads_connected{{ip="{instance_ip}"}}'
-        metrics['connections'] = self._extract_value(self.query(conn_query))
+    def get_fleet_metrics(self, instance_ips: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取一组MySQL实例的关键指标
 
-        max_conn_query = f'mysql_global_variables_max_connections{{ip="{instance_ip}"}}'
-        metrics['max_connections'] = self._extract_value(self.query(max_conn_query))
+        每个指标按exporter job分组各查询一次(ip=~"a|b|c")，再按结果中的 ip 标签
+        拆分到各实例，查询次数与实例数无关。
 
-        # 计算连接使用率
-        if metrics['connections'] is not None and metrics['max_connections'] is not None:
-            metrics['connection_usage'] = round(
-                (metrics['connections'] / metrics['max_connections']) * 100, 2
-            )
-        else:
-            metrics['connection_usage'] = None
-
-        # 活跃连接
-        running_query = f'mysql_global_status_threads_running{{ip="{instance_ip}"}}'
-        metrics['threads_running'] = self._extract_value(self.query(running_query))
-
-        # 2. QPS/TPS指标
-        qps_query = f'rate(mysql_global_status_questions{{ip="{instance_ip}"}}[1m])'
-        metrics['qps'] = self._extract_value(self.query(qps_query))
-
-        # TPS
-        tps_query = f'''
-        rate(mysql_global_status_commands_total{{command="commit",ip="{instance_ip}"}}[1m])
-        + ignoring(command) rate(mysql_global_status_commands_total{{command="rollback",ip="{instance_ip}"}}[1m])
-        '''
-        metrics['tps'] = self._extract_value(self.query(tps_query))
-
-        # 3. Buffer Pool指标
-        # 命中率
-        bp_hit_query = f'''
-        (mysql_global_status_innodb_buffer_pool_read_requests{{ip="{instance_ip}"}}
-        - mysql_global_status_innodb_buffer_pool_reads{{ip="{instance_ip}"}})
-        / mysql_global_status_innodb_buffer_pool_read_requests{{ip="{instance_ip}"}} * 100
-        '''
-        metrics['buffer_pool_hit_rate'] = self._extract_value(self.query(bp_hit_query))
-
-        # 使用率
-        bp_usage_query = f'''
-        mysql_global_status_innodb_buffer_pool_bytes_data{{ip="{instance_ip}"}}
-        / mysql_global_variables_innodb_buffer_pool_size{{ip="{instance_ip}"}} * 100
-        '''
-        metrics['buffer_pool_usage'] = self._extract_value(self.query(bp_usage_query))
-
-        # 脏页比例
-        bp_dirty_query = f'''
-        mysql_global_status_innodb_buffer_pool_pages_dirty{{ip="{instance_ip}"}}
-        / mysql_global_status_innodb_buffer_pool_pages_total{{ip="{instance_ip}"}} * 100
-        '''
-        metrics['buffer_pool_dirty_pages'] = self._extract_value(self.query(bp_dirty_query))
-
-        # 4. 复制延迟
-        repl_lag_query = f'mysql_slave_status_seconds_behind_master{{ip="{instance_ip}"}}'
-        metrics['replication_lag'] = self._extract_value(self.query(repl_lag_query))
-
-        # 复制IO线程
-        repl_io_query = f'mysql_slave_status_slave_io_running{{ip="{instance_ip}"}}'
-        metrics['slave_io_running'] = self._extract_value(self.query(repl_io_query))
-
-        # 复制SQL线程
-        repl_sql_query = f'mysql_slave_status_slave_sql_running{{ip="{instance_ip}"}}'
-        metrics['slave_sql_running'] = self._extract_value(self.query(repl_sql_query))
-
-        # 5. 慢查询
-        slow_query = f'rate(mysql_global_status_slow_queries{{ip="{instance_ip}"}}[5m])'
-        metrics['slow_queries_rate'] = self._extract_value(self.query(slow_query))
-
-        # 6. InnoDB行锁
-        row_lock_waits_query = f'mysql_global_status_innodb_row_lock_waits{{ip="{instance_ip}"}}'
-        metrics['innodb_row_lock_waits'] = self._extract_value(self.query(row_lock_waits_query))
-
-        row_lock_time_query = f'mysql_global_status_innodb_row_lock_time_avg{{ip="{instance_ip}"}}'
-        metrics['innodb_row_lock_time_avg'] = self._extract_value(self.query(row_lock_time_query))
-
-        # 7. 表锁
-        table_locks_waited_query = f'mysql_global_status_table_locks_waited{{ip="{instance_ip}"}}'
-        metrics['table_locks_waited'] = self._extract_value(self.query(table_locks_waited_query))
-
-        # 8. 临时表
-        tmp_tables_query = f'rate(mysql_global_status_created_tmp_tables{{ip="{instance_ip}"}}[1m])'
-        metrics['tmp_tables_rate'] = self._extract_value(self.query(tmp_tables_query))
-
-        tmp_disk_tables_query = f'rate(mysql_global_status_created_tmp_disk_tables{{ip="{instance_ip}"}}[1m])'
-        metrics['tmp_disk_tables_rate'] = self._extract_value(self.query(tmp_disk_tables_query))
-
-        # 临时磁盘表比例
-        if metrics['tmp_tables_rate'] and metrics['tmp_disk_tables_rate']:
-            if metrics['tmp_tables_rate'] > 0:
-                metrics['tmp_disk_tables_ratio'] = round(
-                    (metrics['tmp_disk_tables_rate'] / metrics['tmp_tables_rate']) * 100, 2
-                )
-            else:
-                metrics['tmp_disk_tables_ratio'] = 0
-        else:
-            metrics['tmp_disk_tables_ratio'] = None
+        Args:
+            instance_ips: 实例IP列表
 
-        # 9. 磁盘IO
-        io_reads_query = f'rate(mysql_global_status_innodb_data_reads{{ip="{instance_ip}"}}[1m])'
-        metrics['innodb_data_reads_rate'] = self._extract_value(self.query(io_reads_query))
+        Returns:
+            {ip: 指标字典}，字典内容与 get_instance_metrics 相同
+        """
+        return self._collect_fleet(instance_ips, MYSQL_INSTANT_METRICS, _derive_mysql_metrics, kind='mysql')
+
+    def get_sqlserver_fleet_metrics(self, instance_ips: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取一组SQL Server实例的关键指标，用法同 get_fleet_metrics"""
+        return self._collect_fleet(instance_ips, SQLSERVER_INSTANT_METRICS, _derive_sqlserver_metrics,
+                                   db_type='SQL Server', kind='sqlserver')
 
-        io_writes_query = f'rate(mysql_global_status_innodb_data_writes{{ip="{instance_ip}"}}[1m])'
-        metrics['innodb_data_writes_rate'] = self._extract_value(self.query(io_writes_query))
+    def query_by_ip(self, promql: str) -> Dict[str, float]:
+        """
+        执行即时查询并按 ip 标签拆分结果
 
-        # 10. 进程CPU使用率（需要process_exporter或node_exporter）
-        cpu_query = f'rate(process_cpu_seconds_total{{ip="{instance_ip}"}}[5m]) * 100'
-        metrics['cpu_usage'] = self._extract_value(self.query(cpu_query))
+        同一IP有多条序列时与 _extract_value 一致，取第一条。
 
-        # 11. 进程内存使用（字节）
-        memory_query = f'process_resident_memory_bytes{{ip="{instance_ip}"}}'
-        memory_bytes = self._extract_value(self.query(memory_query))
-        if memory_bytes:
-            metrics['memory_usage_mb'] = round(memory_bytes / 1024 / 1024, 2)
-        else:
-            metrics['memory_usage_mb'] = None
+        Returns:
+            {ip: 数值}
+        """
+        values: Dict[str, float] = {}
+        response = self.query(promql)
+        try:
+            if response and response.get('status') == 'success':
+                for series in response['data']['result']:
+                    ip = series.get('metric', {}).get('ip')
+                    if ip is None or ip in values:
+                        continue
+                    values[ip] = float(series['value'][1])
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            logger.debug(f"拆分向量结果失败: {e}")
+        return values
+
+    def instance_selectors(self, ips: List[str], kind: str) -> List[str]:
+        """
+        一组实例的标签选择器
 
+        按目标索引中对应的exporter job 把IP分组: 找得到job的组加上 job 匹配，只命中
+        数据库exporter的序列；索引为空或找不到job的IP单独成组，仅按 ip 标签匹配。
+        各组IP互不重叠，查询结果可以直接合并。
+        """
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for ip in ips:
+            groups.setdefault(tuple(self.targets.jobs_for([ip], kind)), []).append(ip)
+        return [label_selector('job', list(jobs)) + ',' + ip_selector(group) if jobs else ip_selector(group)
+                for jobs, group in groups.items()]
+
+    def _collect_fleet(self, instance_ips: List[str], metric_queries, derive, db_type: Optional[str] = None,
+                       kind: str = 'mysql') -> Dict[str, Dict[str, Any]]:
+        ips = list(dict.fromkeys(ip for ip in instance_ips if ip))
+        if not ips:
+            return {}
+
+        self.ensure_targets()
+        selectors = self.instance_selectors(ips, kind)
+        plain = [ip_selector(ips)]
+        tasks = {}
+        for key, template in metric_queries:
+            # 进程指标来自另一个exporter job，不能加数据库exporter的job匹配
+            for index, selector in enumerate(plain if key in PROCESS_METRIC_KEYS else selectors):
+                tasks[(key, index)] = (lambda promql=template.format(sel=selector): self.query_by_ip(promql))
+        results = {key: {} for key, _ in metric_queries}
+        for (key, _), values in self.run_parallel(tasks).items():
+            results[key].update(values)
+        raw = {ip: {key: results[key].get(ip) for key, _ in metric_queries} for ip in ips}
+
+        timestamp = datetime.now().isoformat()
+        fleet = {}
+        for ip in ips:
+            metrics = {'instance_ip': ip, 'timestamp': timestamp}
+            if db_type:
+                metrics['db_type'] = db_type
+            metrics.update(raw[ip])
+            derive(metrics)
+            fleet[ip] = metrics
+        return fleet
+
+    def _empty_metrics(self, instance_ip: str, metric_queries, derive) -> Dict[str, Any]:
+        metrics = {'instance_ip': instance_ip, 'timestamp': datetime.now().isoformat()}
+        metrics.update({key: None for key, _ in metric_queries})
+        derive(metrics)
         return metrics
 
-    def get_instance_trends(self, instance_ip: str, hours: int = 24) -> Dict[str, List]:
+    def get_instance_trends(self, instance_ip: str, hours: int = 24,
+                            max_points: Optional[int] = None) -> Dict[str, List]:
         """
         获取实例的趋势数据（用于绘制图表）
 
         Args:
             instance_ip: 实例IP
             hours: 查询最近N小时的数据
+            max_points: 每条序列最多返回的点数，超出时用LTTB降采样(缓存中保留完整数据)
 
         Returns:
             包含趋势数据的字典
         """
         end = datetime.now()
         start = end - timedelta(hours=hours)
+        self.ensure_targets()
+        sel = self.instance_selectors([instance_ip], 'mysql')[0]
+
+        queries = {
+            # QPS趋势
+            'qps': (f'rate(mysql_global_status_questions{{{sel}}}[1m])', '1m'),
+            # 连接数趋势
+            'connections': (f'mysql_global_status_threads_connected{{{sel}}}', '1m'),
+            # Buffer Pool命中率趋势
+            'buffer_pool_hit_rate': (
+                f'(mysql_global_status_innodb_buffer_pool_read_requests{{{sel}}}'
+                f' - mysql_global_status_innodb_buffer_pool_reads{{{sel}}})'
+                f' / mysql_global_status_innodb_buffer_pool_read_requests{{{sel}}} * 100', '5m')
+        }
 
-        trends = {}
-
-        # QPS趋势
-        qps_query = f'rate(mysql_global_status_questions{{ip="{instance_ip}"}}[1m])'
-        qps_result = self.query_range(
-            qps_query,
-            start.isoformat(),
-            end.isoformat(),
-            step='1m'
-        )
-        trends['qps'] = self._extract_timeseries(qps_result)
-
-        # 连接数趋势
-        conn_query = f'mysql_global_status_threads_connected{{ip="{instance_ip}"}}'
-        conn_result = self.query_range(
-            conn_query,
-            start.isoformat(),
-            end.isoformat(),
-            step='1m'
-        )
-        trends['connections'] = self._extract_timeseries(conn_result)
-
-        # Buffer Pool命中率趋势
-        bp_query = f'''
-        (mysql_global_status_innodb_buffer_pool_read_requests{{ip="{instance_ip}"}}
-        - mysql_global_status_innodb_buffer_pool_reads{{ip="{instance_ip}"}})
-        / mysql_global_status_innodb_buffer_pool_read_requests{{ip="{instance_ip}"}} * 100
-        '''
-        bp_result = self.query_range(
-            bp_query,
-            start.isoformat(),
-            end.isoformat(),
-            step='5m'
-        )
-        trends['buffer_pool_hit_rate'] = self._extract_timeseries(bp_result)
+        results = self.run_parallel({
+            key: (lambda promql=promql, step=step: self.query_range_cached(promql, start, end, step=step))
+            for key, (promql, step) in queries.items()
+        })
+        trends = {key: downsample_points(self._extract_timeseries(result), max_points)
+                  for key, result in results.items()}
 
         return trends
 
-    def check_health(self) -> bool:
+    def check_health(self, max_age: float = HEALTH_CACHE_SECONDS) -> bool:
         """
-        检查Prometheus服务是否可用
+        检查Prometheus服务是否可用（结果缓存 max_age 秒）
 
         Returns:
             True if健康, False otherwise
         """
+        now = time.time()
+        with self._health_lock:
+            if self._health and now - self._health[0] < max_age:
+                return self._health[1]
         try:
-            response = requests.get(f"{self.url}/-/healthy", timeout=2, proxies=self.proxies)
-            return response.status_code == 200
-        except:
-            return False
+            response = self.session.get(f"{self.url}/-/healthy", timeout=2, proxies=self.proxies)
+            healthy = response.status_code == 200
+        except Exception:
+            healthy = False
+        with self._health_lock:
+            self._health = (time.time(), healthy)
+        return healthy
 
     def get_targets(self) -> Optional[List[Dict]]:
         """
@@ -294,7 +456,7 @@ class PrometheusClient:
             目标列表
         """
         try:
-            response = requests.get(f"{self.api_url}/targets", timeout=self.timeout, proxies=self.proxies)
+            response = self.session.get(f"{self.api_url}/targets", timeout=self.timeout, proxies=self.proxies)
             response.raise_for_status()
             result = response.json()
             if result['status'] == 'success':
@@ -304,6 +466,37 @@ class PrometheusClient:
             logger.error(f"获取Prometheus targets失败: {e}")
             return None
 
+    def refresh_targets(self) -> Optional[Dict[str, List[Dict]]]:
+        """
+        从 /api/v1/targets 刷新目标索引
+
+        Returns:
+            与上一次的差异(见 TargetIndex.refresh)，获取失败返回None
+        """
+        active_targets = self.get_targets()
+        if active_targets is None:
+            return None
+        first = self.targets.is_empty()
+        diff = self.targets.refresh(active_targets)
+        if first:
+            logger.info(f"Prometheus目标索引已建立: {len(active_targets)} 个目标")
+            return diff
+        if diff['added'] or diff['removed']:
+            logger.info(f"Prometheus目标变化: 新增 {len(diff['added'])}, 消失 {len(diff['removed'])}")
+        for target in diff['health_changed']:
+            logger.warning(f"Prometheus目标健康状态变化: {target['job']}/{target['instance']} "
+                           f"{target['previous_health']} -> {target['health']} {target['last_error']}")
+        return diff
+
+    def ensure_targets(self):
+        """索引还没建立时同步刷新一次(之后由后台任务定期刷新)，失败后 TARGETS_RETRY_SECONDS 内不再重试"""
+        if not self.targets.is_empty():
+            return
+        with self._targets_lock:
+            if self.targets.is_empty() and time.time() - self._targets_attempted >= TARGETS_RETRY_SECONDS:
+                self._targets_attempted = time.time()
+                self.refresh_targets()
+
     def _extract_value(self, response: Optional[Dict]) -> Optional[float]:
         """
         从Prometheus响应中提取单个值
@@ -359,104 +552,76 @@ class PrometheusClient:
         Returns:
             包含各项指标的字典
         """
-        metrics = {
-            'instance_ip': instance_ip,
-            'timestamp': datetime.now().isoformat(),
-            'db_type': 'SQL Server'
-        }
+        metrics = self.get_sqlserver_fleet_metrics([instance_ip]).get(instance_ip)
+        if metrics is None:
+            metrics = self._empty_metrics(instance_ip, SQLSERVER_INSTANT_METRICS, _derive_sqlserver_metrics)
+            metrics['db_type'] = 'SQL Server'
+        return metrics
 
-        # 1. 连接数指标 (SQL Server使用不同的metric名称)
-        # 注意：SQL Server exporter的metric名称可能不同，需要根据实际情况调整
-        conn_query = f'mssql_connections{{ip="{instance_ip}"}}'
-        metrics['connections'] = self._extract_value(self.query(conn_query))
 
-        max_conn_query = f'mssql_server_properties_max_connections{{ip="{instance_ip}"}}'
-        metrics['max_connections'] = self._extract_value(self.query(max_conn_query))
+_clients: Dict[Tuple[str, int], PrometheusClient] = {}
+_clients_lock = threading.Lock()
 
-        # 计算连接使用率
-        if metrics['connections'] is not None and metrics['max_connections'] is not None:
-            metrics['connection_usage'] = round(
-                (metrics['connections'] / metrics['max_connections']) * 100, 2
-            )
-        else:
-            metrics['connection_usage'] = None
-
-        # 2. 批处理请求（类似于MySQL的QPS）
-        batch_query = f'rate(mssql_batch_requests{{ip="{instance_ip}"}}[1m])'
-        metrics['batch_requests'] = self._extract_value(self.query(batch_query))
-
-        # 3. SQL编译数/秒
-        compilations_query = f'rate(mssql_sql_compilations{{ip="{instance_ip}"}}[1m])'
-        metrics['sql_compilations'] = self._extract_value(self.query(compilations_query))
-
-        # 4. Buffer Pool命中率 (Buffer Cache Hit Ratio)
-        buffer_hit_query = f'mssql_buffer_cache_hit_ratio{{ip="{instance_ip}"}}'
-        metrics['buffer_cache_hit_ratio'] = self._extract_value(self.query(buffer_hit_query))
-
-        # 5. 页面生命期望值 (Page Life Expectancy) - 越高越好
-        ple_query = f'mssql_page_life_expectancy{{ip="{instance_ip}"}}'
-        metrics['page_life_expectancy'] = self._extract_value(self.query(ple_query))
-
-        # 6. 锁等待 (Lock Waits/sec)
-        lock_waits_query = f'rate(mssql_lock_waits{{ip="{instance_ip}"}}[1m])'
-        metrics['lock_waits_rate'] = self._extract_value(self.query(lock_waits_query))
-
-        # 7. 死锁数/秒
-        deadlocks_query = f'rate(mssql_deadlocks{{ip="{instance_ip}"}}[1m])'
-        metrics['deadlocks_rate'] = self._extract_value(self.query(deadlocks_query))
-
-        # 8. IO延迟 (IO Stall - 毫秒)
-        io_stall_query = f'mssql_io_stall_seconds{{ip="{instance_ip}"}}'
-        metrics['io_stall_seconds'] = self._extract_value(self.query(io_stall_query))
-
-        # 9. 用户错误数/秒
-        errors_query = f'rate(mssql_user_errors{{ip="{instance_ip}"}}[1m])'
-        metrics['user_errors_rate'] = self._extract_value(self.query(errors_query))
-
-        # 10. Always On 可用性组信息（如果有）
-        # 同步状态
-        ao_sync_query = f'mssql_ao_synchronization_health{{ip="{instance_ip}"}}'
-        metrics['ao_sync_health'] = self._extract_value(self.query(ao_sync_query))
-
-        # 数据库状态
-        db_state_query = f'mssql_database_state{{ip="{instance_ip}"}}'
-        metrics['database_state'] = self._extract_value(self.query(db_state_query))
-
-        # 11. 内存指标
-        # Target Server Memory (KB)
-        target_memory_query = f'mssql_memory_target_kb{{ip="{instance_ip}"}}'
-        target_memory = self._extract_value(self.query(target_memory_query))
-        if target_memory:
-            metrics['target_memory_mb'] = round(target_memory / 1024, 2)
-        else:
-            metrics['target_memory_mb'] = None
-
-        # Total Server Memory (KB)
-        total_memory_query = f'mssql_memory_total_kb{{ip="{instance_ip}"}}'
-        total_memory = self._extract_value(self.query(total_memory_query))
-        if total_memory:
-            metrics['total_memory_mb'] = round(total_memory / 1024, 2)
-        else:
-            metrics['total_memory_mb'] = None
-
-        # 内存压力
-        if target_memory and total_memory:
-            metrics['memory_pressure'] = round((total_memory / target_memory) * 100, 2)
-        else:
-            metrics['memory_pressure'] = None
-
-        # 12. 系统资源（如果有process_exporter）
-        cpu_query = f'rate(process_cpu_seconds_total{{ip="{instance_ip}"}}[5m]) * 100'
-        metrics['cpu_usage'] = self._extract_value(self.query(cpu_query))
-
-        memory_query = f'process_resident_memory_bytes{{ip="{instance_ip}"}}'
-        memory_bytes = self._extract_value(self.query(memory_query))
-        if memory_bytes:
-            metrics['memory_usage_mb'] = round(memory_bytes / 1024 / 1024, 2)
-        else:
-            metrics['memory_usage_mb'] = None
 
-        return metrics
+def get_prometheus_client(url: str, timeout: int = 5) -> PrometheusClient:
+    """获取进程内共享的Prometheus客户端（按URL和超时区分，配置变更后自动换新）"""
+    key = (url.rstrip('/'), timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # 旧客户端可能仍在被进行中的请求使用，不主动关闭，由垃圾回收释放
+            _clients.clear()
+            client = _clients[key] = PrometheusClient(url, timeout)
+        return client
+
+
+def label_selector(label: str, values: List[str]) -> str:
+    """标签选择器: 单个值用等值匹配，多个值用正则(Prometheus正则整体匹配)"""
+    if len(values) == 1:
+        return f'{label}="{values[0]}"'
+    pattern = '|'.join(re.escape(value) for value in values)
+    # PromQL 字符串字面量中反斜杠需要转义
+    return f'{label}=~"' + pattern.replace('\\', '\\\\') + '"'
+
+
+def ip_selector(ips: List[str]) -> str:
+    """ip 标签选择器"""
+    return label_selector('ip', ips)
+
+
+def _ratio(numerator: Optional[float], denominator: Optional[float], scale: float = 100) -> Optional[float]:
+    if numerator is None or not denominator:
+        return None
+    return round(numerator / denominator * scale, 2)
+
+
+def _derive_mysql_metrics(metrics: Dict[str, Any]):
+    """由原始指标计算连接使用率、临时磁盘表比例和内存(MB)"""
+    metrics['connection_usage'] = _ratio(metrics.get('connections'), metrics.get('max_connections'))
+
+    tmp_tables = metrics.get('tmp_tables_rate')
+    tmp_disk_tables = metrics.get('tmp_disk_tables_rate')
+    if tmp_tables and tmp_disk_tables:
+        metrics['tmp_disk_tables_ratio'] = _ratio(tmp_disk_tables, tmp_tables) if tmp_tables > 0 else 0
+    else:
+        metrics['tmp_disk_tables_ratio'] = None
+
+    memory_bytes = metrics.pop('memory_bytes', None)
+    metrics['memory_usage_mb'] = round(memory_bytes / 1024 / 1024, 2) if memory_bytes else None
+
+
+def _derive_sqlserver_metrics(metrics: Dict[str, Any]):
+    """由原始指标计算连接使用率、内存(MB)和内存压力"""
+    metrics['connection_usage'] = _ratio(metrics.get('connections'), metrics.get('max_connections'))
+
+    target_memory = metrics.pop('target_memory_kb', None)
+    total_memory = metrics.pop('total_memory_kb', None)
+    metrics['target_memory_mb'] = round(target_memory / 1024, 2) if target_memory else None
+    metrics['total_memory_mb'] = round(total_memory / 1024, 2) if total_memory else None
+    metrics['memory_pressure'] = _ratio(total_memory, target_memory) if target_memory and total_memory else None
+
+    memory_bytes = metrics.pop('memory_bytes', None)
+    metrics['memory_usage_mb'] = round(memory_bytes / 1024 / 1024, 2) if memory_bytes else None
 
 
 # 测试函数
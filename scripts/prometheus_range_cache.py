@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus范围查询缓存
+
+趋势面板每次刷新都重新拉取24小时的1分钟数据，而两次刷新之间只多了几个点。
+缓存以 (PromQL, step) 为键:
+
+- 对齐: start/end 向下对齐到 step 的整数倍，Prometheus 在 start + k*step 处求值，
+  对齐后同一时间点在不同请求中的取值一致，可以直接拼接
+- 增量: 已缓存 [c_start, c_end] 时，只向Prometheus请求缺少的头部和新的尾部，
+  超出请求窗口的旧点被裁掉
+- 尾部重取: 最近 STALE_SECONDS 内的点可能还没有抓齐(rate窗口不完整、抓取延迟)，
+  每次都重新获取
+- 淘汰: 按估算内存占用做LRU淘汰
+- 分段: 长范围按 step*max_points 的整数倍切成子区间，各段以段起点为键单独缓存，
+  已经过去的段之后不会再请求
+"""
+
+import re
+import time
+from datetime import datetime
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# 最近多少秒内的点视为可能不完整，刷新时重新获取
+STALE_SECONDS = 120
+# 每个数据点的估算内存(时间戳float + 值字符串 + list开销)
+_POINT_BYTES = 120
+
+# Prometheus 单条序列最多返回 11000 个点，分段时每段远低于该上限以免超时
+DEFAULT_SEGMENT_POINTS = 5000
+
+_STEP_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+SeriesKey = Tuple[Tuple[str, str], ...]
+
+
+def parse_step(step) -> float:
+    """把 '15s' / '1m' / '5m' / 60 之类的步长转成秒"""
+    if isinstance(step, (int, float)):
+        return float(step)
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)(ms|s|m|h|d|w)?', str(step).strip())
+    if not match:
+        raise ValueError(f"无法解析的step: {step}")
+    return float(match.group(1)) * _STEP_UNITS[match.group(2) or 's']
+
+
+def align(timestamp: float, step: float) -> float:
+    """向下对齐到 step 的整数倍"""
+    return (timestamp // step) * step
+
+
+def parse_time(value) -> float:
+    """把Unix时间戳(数字或字符串)或RFC3339时间转成Unix时间戳"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise ValueError(f"无法解析的时间: {value}")
+
+
+def split_range(start: float, end: float, step: float,
+                max_points: int = DEFAULT_SEGMENT_POINTS) -> List[Tuple[float, float, float]]:
+    """
+    把 [start, end] 切成步长对齐的子区间
+
+    段边界取 step*max_points 的整数倍(与请求的start无关)，同一段在不同请求中
+    范围一致，才能按段缓存。
+
+    Returns:
+        [(段起点, 子区间start, 子区间end), ...]，相邻子区间不重叠
+    """
+    start, end = align(start, step), align(end, step)
+    span = step * max_points
+    segments = []
+    segment = align(start, span)
+    while segment <= end:
+        low = max(start, segment)
+        high = min(end, segment + span - step)
+        if low <= high:
+            segments.append((segment, low, high))
+        segment += span
+    return segments
+
+
+def merge_matrix(responses: List[Dict]) -> Dict:
+    """合并多个 query_range 响应，同一序列按时间戳去重排序"""
+    series: Dict[SeriesKey, Dict[float, str]] = {}
+    labels: Dict[SeriesKey, Dict[str, str]] = {}
+    for response in responses:
+        for item in response['data']['result']:
+            metric = item.get('metric', {})
+            key = tuple(sorted(metric.items()))
+            labels[key] = metric
+            points = series.setdefault(key, {})
+            for ts, value in item.get('values', []):
+                points[float(ts)] = value
+    result = [{'metric': labels[key], 'values': [[ts, points[ts]] for ts in sorted(points)]}
+              for key, points in series.items()]
+    return {'status': 'success', 'data': {'resultType': 'matrix', 'result': result}}
+
+
+class _Entry:
+    """一个 (PromQL, step) 的已缓存数据"""
+
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.fetched_at = 0.0
+        # 序列标签 -> {时间戳: 值}
+        self.series: Dict[SeriesKey, Dict[float, str]] = {}
+        self.labels: Dict[SeriesKey, Dict[str, str]] = {}
+
+    def merge(self, result: List[Dict]):
+        for series in result:
+            metric = series.get('metric', {})
+            key = tuple(sorted(metric.items()))
+            self.labels[key] = metric
+            points = self.series.setdefault(key, {})
+            for ts, value in series.get('values', []):
+                points[float(ts)] = value
+
+    def drop_range(self, low: float, high: float):
+        """删除 [low, high] 内的点"""
+        for points in self.series.values():
+            for ts in [t for t in points if low <= t <= high]:
+                del points[ts]
+
+    def trim(self, start: float, end: float):
+        for key in list(self.series):
+            points = self.series[key]
+            for ts in [t for t in points if t < start or t > end]:
+                del points[ts]
+            if not points:
+                del self.series[key]
+                del self.labels[key]
+        self.start, self.end = start, end
+
+    def size(self) -> int:
+        return sum(len(points) * _POINT_BYTES + 200 for points in self.series.values())
+
+    def to_response(self) -> Dict:
+        result = []
+        for key, points in self.series.items():
+            result.append({
+                'metric': self.labels[key],
+                'values': [[ts, points[ts]] for ts in sorted(points)]
+            })
+        return {'status': 'success', 'data': {'resultType': 'matrix', 'result': result}}
+
+
+class RangeQueryCache:
+    """步长对齐的增量范围查询缓存（线程安全）"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, stale_seconds: float = STALE_SECONDS):
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._entries: 'OrderedDict[Tuple[str, float, Optional[float]], _Entry]' = OrderedDict()
+        self._sizes: Dict[Tuple[str, float, Optional[float]], int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.fetched_points = 0
+        self.served_points = 0
+
+    def query_range(self, fetch: Callable[[str, float, float, float], Optional[Dict]],
+                    promql: str, start: float, end: float, step,
+                    segment: Optional[float] = None) -> Optional[Dict]:
+        """
+        范围查询，只向Prometheus请求缓存中缺少的部分
+
+        Args:
+            fetch: 实际请求函数 fetch(promql, start, end, step_seconds) -> Prometheus响应
+            promql: 查询语句
+            start / end: Unix时间戳(秒)
+            step: 步长('1m' 或秒数)
+            segment: 分段查询时的段起点，同一语句的不同段分别缓存
+
+        Returns:
+            与Prometheus query_range 相同结构的响应，请求失败返回None
+        """
+        step_seconds = parse_step(step)
+        start, end = align(start, step_seconds), align(end, step_seconds)
+        key = (promql, step_seconds, segment)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        # 与缓存不相交时整段重取
+        if entry is None or start > entry.end + step_seconds or end < entry.start - step_seconds:
+            response = fetch(promql, start, end, step_seconds)
+            if not _is_success(response):
+                return response
+            entry = _Entry(start, end)
+            entry.merge(response['data']['result'])
+            entry.fetched_at = time.time()
+            self._store(key, entry)
+            points = sum(len(p) for p in entry.series.values())
+            with self._lock:
+                self.fetched_points += points
+                self.served_points += points
+            return entry.to_response()
+
+        ranges = []
+        if start < entry.start:
+            ranges.append((start, entry.start - step_seconds))
+        # 最近的点可能不完整，从 fetched_at - stale_seconds 之后重新获取
+        tail_start = max(start, min(entry.end + step_seconds,
+                                    align(entry.fetched_at - self.stale_seconds, step_seconds)))
+        if end >= tail_start:
+            ranges.append((tail_start, end))
+
+        fetched = []
+        for low, high in ranges:
+            response = fetch(promql, low, high, step_seconds)
+            if not _is_success(response):
+                return response
+            fetched.append((low, high, response['data']['result']))
+
+        with self._lock:
+            for low, high, result in fetched:
+                entry.drop_range(low, high)
+                entry.merge(result)
+                self.fetched_points += sum(len(s.get('values', [])) for s in result)
+            if fetched:
+                entry.fetched_at = time.time()
+            entry.trim(start, end)
+            response = entry.to_response()
+            self.served_points += sum(len(s['values']) for s in response['data']['result'])
+        self._store(key, entry)
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._total_bytes,
+                    'fetched_points': self.fetched_points, 'served_points': self.served_points}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def _store(self, key, entry: _Entry):
+        size = entry.size()
+        with self._lock:
+            self._total_bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, _ = self._entries.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_key, 0)
+
+
+def _is_success(response: Optional[Dict]) -> bool:
+    return bool(response) and response.get('status') == 'success'
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus 抓取目标索引
+
+/api/v1/targets 返回全部 activeTargets(生产环境500多个、400多KB)，其中数据库exporter
+多数经由同一台代理机抓取，scrapeUrl 里看不出数据库地址，只能靠 ip 标签对应。
+索引把目标按 IP / job / instance 标签建好查找表，后台定期刷新并与上一次比较，
+记录新增、消失和健康状态变化的目标。
+
+目标的IP取值顺序: ip 标签 -> instance 标签中的 host -> __address__ 中的 host
+(后两者只接受IPv4地址，避免把主机名当成IP)。
+"""
+
+import re
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 数据库类型 -> 对应exporter的job名关键字(小写子串匹配)
+DB_JOB_KEYWORDS = {
+    'mysql': ('mysql',),
+    'sqlserver': ('mssql', 'sqlserver'),
+}
+
+_IPV4_RE = re.compile(r'^(\d{1,3}(?:\.\d{1,3}){3})(?::\d+)?$')
+
+TargetKey = Tuple[Tuple[str, str], ...]
+
+
+def _host_ip(address: Optional[str]) -> Optional[str]:
+    match = _IPV4_RE.match(address or '')
+    return match.group(1) if match else None
+
+
+def summarize_target(target: Dict) -> Dict:
+    """把 activeTargets 中的一项精简为索引保存的字段"""
+    labels = target.get('labels', {})
+    discovered = target.get('discoveredLabels', {})
+    ip = labels.get('ip') or _host_ip(labels.get('instance')) or _host_ip(discovered.get('__address__'))
+    return {
+        'job': labels.get('job'),
+        'instance': labels.get('instance'),
+        'ip': ip,
+        'labels': labels,
+        'health': target.get('health'),
+        'last_error': target.get('lastError') or '',
+        'last_scrape': target.get('lastScrape'),
+        'scrape_duration': target.get('lastScrapeDuration'),
+        'scrape_url': target.get('scrapeUrl'),
+    }
+
+
+def job_matches(job: Optional[str], db_type: str) -> bool:
+    """job 是否为该数据库类型的exporter"""
+    keywords = DB_JOB_KEYWORDS.get(normalize_db_type(db_type), ())
+    job = (job or '').lower()
+    return any(keyword in job for keyword in keywords)
+
+
+def normalize_db_type(db_type: Optional[str]) -> str:
+    """'MySQL' / 'SQLServer' / 'SQL Server' -> 'mysql' / 'sqlserver'"""
+    return (db_type or '').lower().replace(' ', '')
+
+
+class TargetIndex:
+    """抓取目标索引（线程安全，刷新时整体替换查找表）"""
+
+    def __init__(self):
+        self._targets: Dict[TargetKey, Dict] = {}
+        self._by_ip: Dict[str, List[TargetKey]] = {}
+        self._by_job: Dict[str, List[TargetKey]] = {}
+        self._by_instance: Dict[str, List[TargetKey]] = {}
+        self._lock = threading.Lock()
+        self.refreshed_at = 0.0
+
+    def refresh(self, active_targets: List[Dict]) -> Dict[str, List[Dict]]:
+        """
+        用最新的 activeTargets 重建索引
+
+        Returns:
+            与上一次的差异: {'added': [...], 'removed': [...], 'health_changed': [...]}
+        """
+        targets: Dict[TargetKey, Dict] = {}
+        by_ip: Dict[str, List[TargetKey]] = {}
+        by_job: Dict[str, List[TargetKey]] = {}
+        by_instance: Dict[str, List[TargetKey]] = {}
+        for raw in active_targets:
+            target = summarize_target(raw)
+            # Prometheus 以标签集合区分目标
+            key = tuple(sorted(target['labels'].items()))
+            targets[key] = target
+            if target['ip']:
+                by_ip.setdefault(target['ip'], []).append(key)
+            if target['job']:
+                by_job.setdefault(target['job'], []).append(key)
+            if target['instance']:
+                by_instance.setdefault(target['instance'], []).append(key)
+
+        with self._lock:
+            previous = self._targets
+            self._targets, self._by_ip, self._by_job, self._by_instance = targets, by_ip, by_job, by_instance
+            self.refreshed_at = time.time()
+
+        diff = {
+            'added': [targets[key] for key in targets if key not in previous],
+            'removed': [previous[key] for key in previous if key not in targets],
+            'health_changed': [
+                {**targets[key], 'previous_health': previous[key]['health']}
+                for key in targets
+                if key in previous and previous[key]['health'] != targets[key]['health']
+            ],
+        }
+        return diff
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._targets
+
+    def lookup(self, ip: Optional[str] = None, job: Optional[str] = None,
+               instance: Optional[str] = None, health: Optional[str] = None) -> List[Dict]:
+        """按 IP / job / instance 标签 / 健康状态查找目标，条件之间为 AND"""
+        with self._lock:
+            candidates: Optional[set] = None
+            for value, table in ((ip, self._by_ip), (job, self._by_job), (instance, self._by_instance)):
+                if value is None:
+                    continue
+                keys = set(table.get(value, ()))
+                candidates = keys if candidates is None else candidates & keys
+            keys = self._targets.keys() if candidates is None else candidates
+            targets = [self._targets[key] for key in keys]
+        if health:
+            targets = [t for t in targets if t['health'] == health]
+        return sorted(targets, key=lambda t: (t['job'] or '', t['instance'] or ''))
+
+    def targets_for(self, ip: str, db_type: str) -> List[Dict]:
+        """某个数据库实例对应的exporter目标(同IP且job属于该数据库类型)"""
+        return [t for t in self.lookup(ip=ip) if job_matches(t['job'], db_type)]
+
+    def jobs_for(self, ips: Iterable[str], db_type: str) -> List[str]:
+        """一组实例的exporter所属job，索引中找不到时返回空列表"""
+        jobs = set()
+        for ip in ips:
+            jobs.update(t['job'] for t in self.targets_for(ip, db_type))
+        return sorted(jobs)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            targets = list(self._targets.values())
+            refreshed_at = self.refreshed_at
+        health: Dict[str, int] = {}
+        for target in targets:
+            health[target['health']] = health.get(target['health'], 0) + 1
+        return {
+            'total': len(targets),
+            'jobs': len({t['job'] for t in targets}),
+            'health': health,
+            'refreshed_at': refreshed_at or None,
+        }
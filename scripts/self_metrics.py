@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+db-monitor 自身运行指标 (Prometheus 文本格式)
+
+不依赖 prometheus_client 包：scripts/prometheus_client.py 与它同名，
+在 scripts 目录下运行的脚本会把它遮蔽掉。
+
+并发设计:
+- 每个指标、每组标签各自持有一把锁，记录时只在这把锁内做几次整数/浮点加法，
+  不同端点、不同采集任务之间互不竞争
+- 抓取时逐个指标在锁内复制快照，格式化在锁外进行
+- 连接池等状态类指标用回调在抓取时读取，业务路径上没有额外开销
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# 秒级耗时的默认分桶: HTTP请求、单实例采集、整轮采集任务都能覆盖
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # 新标签组合只在第一次出现时加锁创建
+        self._children: Dict[LabelValues, object] = {}
+        self._create_lock = threading.Lock()
+
+    def _child(self, labels: Sequence) -> object:
+        key = tuple(str(v) for v in labels)
+        child = self._children.get(key)
+        if child is None:
+            with self._create_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child.snapshot()))
+        return lines
+
+    def _render_child(self, key: LabelValues, snapshot) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(snapshot)}']
+
+
+class _Value:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    metric_type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, *labels, amount: float = 1):
+        child = self._child(labels)
+        with child.lock:
+            child.value += amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    metric_type = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, *labels, value: float):
+        child = self._child(labels)
+        with child.lock:
+            child.value = float(value)
+
+
+class _HistogramValue:
+    __slots__ = ('counts', 'sum', 'lock')
+
+    def __init__(self, bucket_count: int):
+        self.counts = [0] * bucket_count
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(_Metric):
+    """分桶直方图，每个桶只记录落在该桶的次数，输出时再累加"""
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def _new_child(self):
+        return _HistogramValue(len(self.buckets))
+
+    def observe(self, *labels, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        child = self._child(labels)
+        with child.lock:
+            child.counts[index] += 1
+            child.sum += value
+
+    def time(self, *labels) -> '_Timer':
+        """with histogram.time('label'): ... 记录代码块耗时"""
+        return _Timer(self, labels)
+
+    def _render_child(self, key: LabelValues, snapshot) -> List[str]:
+        counts, total = snapshot
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Sequence):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.started)
+        return False
+
+
+class GaugeCallback(_Metric):
+    """抓取时调用回调取值的gauge，回调返回 {标签值元组: 数值}"""
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            values = self.callback() or {}
+        except Exception:
+            values = {}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for key, value in values.items():
+            if value is not None:
+                lines.extend(self._render_child(key, float(value)))
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 后台采集任务
+JOB_DURATION = REGISTRY.register(Histogram(
+    'dbmonitor_job_run_duration_seconds', '后台任务单次运行耗时', ('job',)))
+JOB_LAG = REGISTRY.register(Gauge(
+    'dbmonitor_job_lag_seconds', '后台任务最近一次实际开始时间与计划时间的差', ('job',)))
+JOB_LAST_SUCCESS = REGISTRY.register(Gauge(
+    'dbmonitor_job_last_success_timestamp_seconds', '后台任务最近一次成功结束的时间', ('job',)))
+JOB_EVENTS = REGISTRY.register(Counter(
+    'dbmonitor_job_events_total', '后台任务调度事件(executed/error/missed/max_instances)', ('job', 'event')))
+
+# 单实例采集
+INSTANCE_COLLECT_DURATION = REGISTRY.register(Histogram(
+    'dbmonitor_instance_collect_duration_seconds', '单个实例一次采集的耗时', ('job', 'instance')))
+INSTANCE_COLLECT_ERRORS = REGISTRY.register(Counter(
+    'dbmonitor_instance_collect_errors_total', '单个实例采集失败次数', ('job', 'instance')))
+
+# 写入监控库的行数，用 rate() 得到每秒写入量
+INGESTED_ROWS = REGISTRY.register(Counter(
+    'dbmonitor_ingested_rows_total', '采集任务写入监控库的行数', ('job',)))
+
+# 监控库连接池
+DB_POOL_ACQUIRE = REGISTRY.register(Histogram(
+    'dbmonitor_db_pool_acquire_seconds', '从连接池获取连接的等待时间',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)))
+DB_POOL_ERRORS = REGISTRY.register(Counter(
+    'dbmonitor_db_pool_errors_total', '获取监控库连接失败次数'))
+
+# HTTP
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'dbmonitor_http_request_duration_seconds', 'HTTP请求处理耗时', ('endpoint', 'method', 'status')))
+
+
+def pooled_db_usage(pool) -> Dict[LabelValues, float]:
+    """
+    读取 DBUtils PooledDB 的连接使用情况(只读属性，不加池锁)
+
+    _connections 为已借出的连接数，_idle_cache 为空闲连接列表。
+    """
+    if pool is None:
+        return {}
+    in_use = getattr(pool, '_connections', None)
+    idle_cache = getattr(pool, '_idle_cache', None)
+    max_connections = getattr(pool, '_maxconnections', None)
+    return {
+        ('in_use',): in_use,
+        ('idle',): len(idle_cache) if idle_cache is not None else None,
+        ('max',): max_connections or None,
+    }
+
+
+def register_db_pool(pool_getter: Callable[[], object]):
+    """注册连接池状态指标，pool_getter 返回当前的 PooledDB(未初始化时返回None)"""
+    REGISTRY.register(GaugeCallback(
+        'dbmonitor_db_pool_connections', '监控库连接池连接数', ('state',),
+        lambda: pooled_db_usage(pool_getter())))
+
+
+def instance_label(instance: Dict) -> str:
+    """实例标签: db_project(ip:port)"""
+    address = f"{instance.get('db_ip')}:{instance.get('db_port')}"
+    project = instance.get('db_project') or instance.get('instance_name')
+    return f"{project}({address})" if project else address
+
+
+def attach_scheduler(scheduler):
+    """
+    监听 APScheduler 事件，记录任务延迟、耗时和错过/跳过的次数
+
+    延迟 = 提交执行的时间 - 计划时间；耗时 = 执行结束 - 提交执行。
+    """
+    from apscheduler.events import (EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR,
+                                    EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES)
+
+    submitted: Dict[str, float] = {}
+
+    def on_submitted(event):
+        now = time.time()
+        submitted[event.job_id] = now
+        if event.scheduled_run_times:
+            JOB_LAG.set(event.job_id, value=max(0.0, now - event.scheduled_run_times[-1].timestamp()))
+
+    def on_finished(event):
+        now = time.time()
+        started = submitted.pop(event.job_id, None)
+        if started is not None:
+            JOB_DURATION.observe(event.job_id, value=now - started)
+        if event.code == EVENT_JOB_EXECUTED:
+            JOB_EVENTS.inc(event.job_id, 'executed')
+            JOB_LAST_SUCCESS.set(event.job_id, value=now)
+        else:
+            JOB_EVENTS.inc(event.job_id, 'error')
+
+    def on_skipped(event):
+        JOB_EVENTS.inc(event.job_id, 'missed' if event.code == EVENT_JOB_MISSED else 'max_instances')
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    scheduler.add_listener(on_skipped, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -9,6 +9,13 @@ import json
 import re
 from typing import Dict, List, Any, Optional
 
+try:
+    from scripts.sql_fingerprint import SQLFingerprint
+    from scripts.plan_regression import mysql_plan_hash
+except ImportError:
+    from sql_fingerprint import SQLFingerprint
+    from plan_regression import mysql_plan_hash
+
 
 class SQLExplainAnalyzer:
     """SQL执行计划分析器"""
@@ -19,14 +26,24 @@ class SQLExplainAnalyzer:
     SEVERITY_MEDIUM = 'MEDIUM'        # 中等（索引不够优化）
     SEVERITY_LOW = 'LOW'              # 低优先级（建议优化）
 
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, instance_id: Optional[int] = None,
+                 schema: Optional[str] = None, plan_cache=None):
         """
         初始化分析器
 
         Args:
             db_connection: 数据库连接对象
+            instance_id: 实例ID，与 plan_cache 同时提供时启用执行计划缓存
+            schema: 连接的默认库名(缓存键的一部分)
+            plan_cache: plan_cache.PlanCache 实例
         """
         self.conn = db_connection
+        self.instance_id = instance_id
+        self.schema = schema or ''
+        self.plan_cache = plan_cache
+        # 最近一次MySQL分析的缓存情况
+        self.plan_cached = False
+        self.table_versions = None
 
     def analyze_sql(self, sql_text: str, db_type: str = 'mysql') -> Dict[str, Any]:
         """
@@ -52,8 +69,11 @@ class SQLExplainAnalyzer:
     def _analyze_mysql(self, sql_text: str) -> Dict[str, Any]:
         """分析MySQL SQL"""
         try:
-            # 执行EXPLAIN获取执行计划
-            plan_json = self._get_mysql_explain(sql_text)
+            self.plan_cached = False
+            self.table_versions = None
+
+            # 执行EXPLAIN获取执行计划（启用缓存时优先取缓存）
+            plan_json = self._get_cached_mysql_explain(sql_text)
 
             if not plan_json:
                 return {
@@ -85,7 +105,10 @@ class SQLExplainAnalyzer:
                 'index_suggestions': index_suggestions,
                 'has_full_scan': any(i['type'] == 'FULL_SCAN' for i in issues),
                 'has_temp_table': any(i['type'] == 'TEMP_TABLE' for i in issues),
-                'has_filesort': any(i['type'] == 'FILESORT' for i in issues)
+                'has_filesort': any(i['type'] == 'FILESORT' for i in issues),
+                'plan_cached': self.plan_cached,
+                'table_versions': self.table_versions,
+                'plan_hash': mysql_plan_hash(plan_json)
             }
 
         except Exception as e:
@@ -94,6 +117,29 @@ class SQLExplainAnalyzer:
                 'error': str(e)
             }
 
+    def _get_cached_mysql_explain(self, sql_text: str) -> Optional[Dict]:
+        """按 (实例, 库, 指纹) 读取执行计划缓存，未命中时执行EXPLAIN并写入缓存"""
+        if self.plan_cache is None or self.instance_id is None:
+            return self._get_mysql_explain(sql_text)
+
+        key = (self.instance_id, self.schema, SQLFingerprint.generate(sql_text), 'EXPLAIN')
+        try:
+            with self.conn.cursor() as cursor:
+                plan_json = self.plan_cache.get(key, cursor, sql_text)
+            if plan_json is not None:
+                self.plan_cached = True
+                return plan_json
+
+            plan_json = self._get_mysql_explain(sql_text)
+            if plan_json:
+                with self.conn.cursor() as cursor:
+                    self.table_versions = self.plan_cache.put(key, cursor, sql_text, plan_json)
+            return plan_json
+
+        except Exception as e:
+            print(f"执行计划缓存不可用: {e}")
+            return self._get_mysql_explain(sql_text)
+
     def _get_mysql_explain(self, sql_text: str) -> Optional[Dict]:
         """获取MySQL EXPLAIN JSON格式结果"""
         try:
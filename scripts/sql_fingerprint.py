@@ -7,12 +7,74 @@ SQL指纹生成工具
 
 import re
 import hashlib
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
+
+
+# 词法分析正则: 按顺序匹配，注释和空白会被丢弃
+# SQL Server临时表(#tmp / ##tmp)优先于MySQL的 # 注释识别为标识符
+_TOKEN_PATTERN = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<temp_table>\#\#?[A-Za-z_][\w$]*)
+    | (?P<comment>/\*.*?\*/|--[^\n]*|\#[^\n]*)
+    | (?P<string>'(?:[^'\\]|\\.|'')*')
+    | (?P<quoted>`(?:[^`]|``)*`|"(?:[^"]|"")*"|\[[^\]]*\])
+    | (?P<number>0x[0-9a-fA-F]+|\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    | (?P<placeholder>\?|%s|:\w+|@\w+)
+    | (?P<word>[A-Za-z_\u0080-\uffff][\w$\u0080-\uffff]*)
+    | (?P<op><=>|<=|>=|<>|!=|:=|\|\||&&|[-+*/%=<>!~^&|])
+    | (?P<punct>[(),.;])
+""", re.VERBOSE | re.DOTALL)
+
+# 出现在表位置但不是表名的关键字
+_NON_TABLE_WORDS = {
+    'select', 'dual', 'outfile', 'dumpfile', 'where', 'set', 'values', 'value',
+    'partition', 'as', 'on', 'using', 'lateral', 'unnest', 'openjson', 'openquery'
+}
+
+# 遇到这些关键字时，当前层的逗号不再表示表列表
+_TABLE_LIST_TERMINATORS = {
+    'where', 'group', 'order', 'having', 'limit', 'set', 'union',
+    'intersect', 'except', 'values', 'select', 'window', 'for', 'into', 'returning',
+    'output', 'option', 'straight_join'
+}
 
 
 class SQLFingerprint:
     """SQL指纹生成器"""
 
+    @staticmethod
+    def tokenize(sql: str) -> List[Tuple[str, str]]:
+        """
+        将SQL切分为词法单元（忽略空白和注释）
+
+        词法类型:
+        - word: 关键字/标识符(保留原始大小写)
+        - quoted: 带引号的标识符(`x` / "x" / [x])，值为去掉引号后的名称
+        - string / number / placeholder: 常量和参数占位符
+        - op / punct: 运算符和标点
+
+        Args:
+            sql: 原始SQL语句
+
+        Returns:
+            [(类型, 值), ...]
+        """
+        if not sql:
+            return []
+
+        tokens = []
+        for match in _TOKEN_PATTERN.finditer(sql):
+            kind = match.lastgroup
+            if kind in ('ws', 'comment'):
+                continue
+            value = match.group()
+            if kind == 'quoted':
+                value = value[1:-1]
+            elif kind == 'temp_table':
+                kind = 'word'
+            tokens.append((kind, value))
+        return tokens
+
     @staticmethod
     def generate(sql: str) -> str:
         """
@@ -141,38 +203,142 @@ class SQLFingerprint:
             return 'OTHER'
 
     @staticmethod
-    def _extract_tables(sql: str) -> list:
+    def extract_table_refs(sql: str) -> List[Tuple[str, ...]]:
         """
-        提取SQL中涉及的表名（简单实现）
+        基于词法分析提取SQL引用的表
 
-        注意：这是简化版本，复杂SQL可能提取不完整
-        """
-        tables = []
-
-        # FROM子句中的表
-        from_match = re.findall(r'from\s+([`"]?\w+[`"]?)', sql)
-        tables.extend(from_match)
+        支持: 库名/架构限定名(db.t / dbo.t / db.dbo.t)、逗号连接、JOIN、
+        子查询、UPDATE多表、INSERT/REPLACE INTO、DDL中的TABLE；
+        CTE名称和表值函数不计入。
 
-        # JOIN子句中的表
-        join_match = re.findall(r'join\s+([`"]?\w+[`"]?)', sql)
-        tables.extend(join_match)
+        Args:
+            sql: 原始SQL语句
 
-        # UPDATE语句中的表
-        update_match = re.findall(r'update\s+([`"]?\w+[`"]?)', sql)
-        tables.extend(update_match)
+        Returns:
+            按出现顺序去重的表名分段元组，如 [('db', 't1'), ('t2',)]
+        """
+        tokens = SQLFingerprint.tokenize(sql)
+        n = len(tokens)
 
-        # INSERT INTO语句中的表
-        insert_match = re.findall(r'insert\s+into\s+([`"]?\w+[`"]?)', sql)
-        tables.extend(insert_match)
+        def kw(i: int) -> str:
+            if i < n and tokens[i][0] == 'word':
+                return tokens[i][1].lower()
+            return ''
 
-        # DELETE FROM语句中的表
-        delete_match = re.findall(r'delete\s+from\s+([`"]?\w+[`"]?)', sql)
-        tables.extend(delete_match)
+        def is_punct(i: int, value: str) -> bool:
+            return i < n and tokens[i][0] == 'punct' and tokens[i][1] == value
+
+        def skip_parens(i: int) -> int:
+            """i指向'('，返回匹配的')'之后的位置"""
+            depth = 0
+            while i < n:
+                if is_punct(i, '('):
+                    depth += 1
+                elif is_punct(i, ')'):
+                    depth -= 1
+                    if depth == 0:
+                        return i + 1
+                i += 1
+            return n
+
+        # 先收集CTE名称: WITH [RECURSIVE] name [(cols)] AS (...) [, name AS (...)]
+        cte_names = set()
+        for i in range(n):
+            if kw(i) != 'with' or is_punct(i + 1, '('):
+                continue
+            j = i + 1
+            if kw(j) == 'recursive':
+                j += 1
+            while j < n and tokens[j][0] in ('word', 'quoted'):
+                name = tokens[j][1].lower()
+                j += 1
+                if is_punct(j, '('):
+                    j = skip_parens(j)
+                if kw(j) != 'as':
+                    break
+                j += 1
+                if kw(j) in ('materialized', 'not'):
+                    j += 1 if kw(j) == 'materialized' else 2
+                if not is_punct(j, '('):
+                    break
+                cte_names.add(name)
+                j = skip_parens(j)
+                if not is_punct(j, ','):
+                    break
+                j += 1
+
+        refs = []
+        seen = set()
+
+        def read_ref(i: int, allow_function: bool) -> int:
+            """从i开始读取一个表引用，返回下一个待处理位置"""
+            while kw(i) in ('if', 'not', 'exists', 'only', 'lateral', 'ignore', 'low_priority', 'delayed', 'high_priority'):
+                i += 1
+            if i >= n or tokens[i][0] not in ('word', 'quoted'):
+                return i
+
+            parts = [tokens[i][1]]
+            j = i + 1
+            while is_punct(j, '.') and j + 1 < n and tokens[j + 1][0] in ('word', 'quoted'):
+                parts.append(tokens[j + 1][1])
+                j += 2
+
+            # FROM后紧跟'('的是表值函数(json_table / dbo.fn(...))，INSERT INTO t (...) 则是列清单
+            if allow_function and is_punct(j, '('):
+                return j
+            if len(parts) == 1 and (tokens[i][0] == 'word' and parts[0].lower() in _NON_TABLE_WORDS
+                                    or parts[0].lower() in cte_names):
+                return j
+
+            ref = tuple(parts)
+            key = tuple(p.lower() for p in ref)
+            if key not in seen:
+                seen.add(key)
+                refs.append(ref)
+            return j
+
+        # 括号栈: 每层记录是否为子查询，函数参数中的FROM(EXTRACT/TRIM/SUBSTRING)不算表
+        paren_stack = []
+        list_depths = set()
+        i = 0
+        while i < n:
+            kind, value = tokens[i]
+            depth = len(paren_stack)
+            in_query = not paren_stack or paren_stack[-1]
+
+            if kind == 'punct':
+                if value == '(':
+                    paren_stack.append(kw(i + 1) in ('select', 'with', 'values', 'table'))
+                elif value == ')':
+                    list_depths.discard(depth)
+                    if paren_stack:
+                        paren_stack.pop()
+                elif value == ',' and depth in list_depths:
+                    i = read_ref(i + 1, allow_function=True)
+                    continue
+                i += 1
+                continue
+
+            word = value.lower() if kind == 'word' else ''
+            if word in ('from', 'join', 'update', 'into', 'table', 'tables') and in_query:
+                if word in ('from', 'update', 'tables'):
+                    list_depths.add(depth)
+                i = read_ref(i + 1, allow_function=word in ('from', 'join'))
+                continue
+            if word in _TABLE_LIST_TERMINATORS:
+                list_depths.discard(depth)
+            i += 1
+
+        return refs
 
-        # 去重并移除反引号/引号
-        tables = list(set([t.strip('`"') for t in tables]))
+    @staticmethod
+    def _extract_tables(sql: str) -> list:
+        """
+        提取SQL中涉及的表名
 
-        return tables
+        限定名保留为 schema.table 形式
+        """
+        return ['.'.join(ref) for ref in SQLFingerprint.extract_table_refs(sql)]
 
 
 # 测试代码
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL模板近似聚类 (MinHash + LSH)
+
+ORM生成的SQL往往只在查询列、OR条件个数上有差异，却得到不同的指纹，
+导致Top-N被拆散。这里对 sql_fingerprint_stats.sql_template 做近似去重:
+
+1. 用指纹工具的词法分析把模板切成token，常量统一替换为 ?
+2. 取连续token的shingle集合，计算MinHash签名
+3. 按band做LSH分桶，同桶内与桶首比较签名相似度，超过阈值则合并
+4. 每个簇选执行次数最多的指纹作为cluster_id
+
+复杂度接近线性(每个模板只与所在桶的桶首比较)，10万+模板可在分钟级完成。
+安装了NumPy时签名计算走向量化路径，否则使用纯Python实现。
+
+使用:
+    python sql_template_cluster.py          # 对监控库中的全部模板重新聚类
+"""
+
+import os
+import sys
+import zlib
+import random
+import logging
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sql_fingerprint import SQLFingerprint
+
+logger = logging.getLogger(__name__)
+
+# 大于2^32的最小素数，保证 a*x+b 在uint64内不溢出
+_MERSENNE_PRIME = 4294967311
+_MAX_HASH = (1 << 32) - 1
+
+# 常量类token统一为占位符
+_LITERAL_KINDS = ('string', 'number', 'placeholder')
+
+
+class SQLTemplateClusterer:
+    """基于MinHash/LSH的SQL模板聚类器"""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 3,
+                 threshold: float = 0.5, seed: int = 20240101):
+        """
+        初始化聚类器
+
+        Args:
+            num_perm: MinHash排列数(签名长度)
+            bands: LSH band数，num_perm必须能被整除
+            shingle_size: 每个shingle包含的token数
+            threshold: 合并所需的最小估计Jaccard相似度
+            seed: 随机种子，固定后签名在不同进程间可复现
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm必须能被bands整除")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+
+        rng = random.Random(seed)
+        self._a = [rng.randint(1, _MAX_HASH) for _ in range(num_perm)]
+        self._b = [rng.randint(0, _MAX_HASH) for _ in range(num_perm)]
+        if NUMPY_AVAILABLE:
+            self._np_a = np.array(self._a, dtype=np.uint64).reshape(-1, 1)
+            self._np_b = np.array(self._b, dtype=np.uint64).reshape(-1, 1)
+
+    def shingles(self, template: str) -> List[int]:
+        """把模板切分为token shingle，返回去重后的32位哈希"""
+        tokens = []
+        for kind, value in SQLFingerprint.tokenize(template):
+            if kind in _LITERAL_KINDS:
+                tokens.append('?')
+            else:
+                tokens.append(value.lower())
+
+        if not tokens:
+            return []
+        if len(tokens) < self.shingle_size:
+            return [zlib.crc32(' '.join(tokens).encode('utf-8'))]
+
+        return list({
+            zlib.crc32(' '.join(tokens[i:i + self.shingle_size]).encode('utf-8'))
+            for i in range(len(tokens) - self.shingle_size + 1)
+        })
+
+    def signature(self, shingle_hashes: Sequence[int]) -> tuple:
+        """计算MinHash签名"""
+        if not shingle_hashes:
+            return tuple([_MAX_HASH] * self.num_perm)
+
+        if NUMPY_AVAILABLE:
+            x = np.array(shingle_hashes, dtype=np.uint64).reshape(1, -1)
+            hashed = (self._np_a * x + self._np_b) % _MERSENNE_PRIME
+            return tuple(int(v) for v in hashed.min(axis=1))
+
+        return tuple(
+            min((a * x + b) % _MERSENNE_PRIME for x in shingle_hashes)
+            for a, b in zip(self._a, self._b)
+        )
+
+    def similarity(self, sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+        """用签名估计Jaccard相似度"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / self.num_perm
+
+    def cluster(self, templates: Dict[str, str], weights: Optional[Dict[str, float]] = None) -> Dict[str, str]:
+        """
+        对模板聚类
+
+        Args:
+            templates: {fingerprint: sql_template}
+            weights: {fingerprint: 权重}，用于挑选簇代表(默认按指纹字典序)
+
+        Returns:
+            {fingerprint: cluster_id}，cluster_id为簇内权重最大的指纹
+        """
+        weights = weights or {}
+        keys = list(templates.keys())
+        parent = list(range(len(keys)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        signatures = []
+        statement_types = []
+        for key in keys:
+            template = templates[key] or ''
+            signatures.append(self.signature(self.shingles(template)))
+            statement_types.append(SQLFingerprint._detect_sql_type(template.lower().lstrip(' (')))
+
+        # LSH分桶: 只有语句类型相同且某个band完全一致的模板才会成为候选
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets: Dict[tuple, int] = {}
+            for i, sig in enumerate(signatures):
+                bucket_key = (statement_types[i], sig[start:start + self.rows])
+                head = buckets.setdefault(bucket_key, i)
+                if head == i:
+                    continue
+                root_head, root_i = find(head), find(i)
+                if root_head == root_i:
+                    continue
+                if self.similarity(signatures[head], sig) >= self.threshold:
+                    parent[root_i] = root_head
+
+        # 选出每个簇的代表指纹
+        representative: Dict[int, str] = {}
+        for i, key in enumerate(keys):
+            root = find(i)
+            current = representative.get(root)
+            if current is None or (weights.get(key, 0), current) > (weights.get(current, 0), key):
+                representative[root] = key
+
+        return {key: representative[find(i)] for i, key in enumerate(keys)}
+
+
+def cluster_fingerprint_stats(conn, clusterer: Optional[SQLTemplateClusterer] = None,
+                              batch_size: int = 1000) -> Dict[str, int]:
+    """
+    对监控库中的 sql_fingerprint_stats 重新聚类并回写 cluster_id
+
+    只回写cluster_id发生变化的行
+
+    Args:
+        conn: 监控数据库连接(DictCursor)
+        clusterer: 聚类器，默认使用默认参数
+        batch_size: 每批UPDATE的行数
+
+    Returns:
+        {'templates': 模板数, 'clusters': 簇数, 'updated': 回写行数}
+    """
+    clusterer = clusterer or SQLTemplateClusterer()
+
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT fingerprint, sql_template, occurrence_count, cluster_id
+            FROM sql_fingerprint_stats
+        """)
+        rows = cursor.fetchall()
+
+    templates = {row['fingerprint']: row['sql_template'] or '' for row in rows}
+    weights = {row['fingerprint']: row['occurrence_count'] or 0 for row in rows}
+    existing = {row['fingerprint']: row['cluster_id'] for row in rows}
+
+    assignments = clusterer.cluster(templates, weights)
+    changed = [(cluster_id, fp) for fp, cluster_id in assignments.items() if existing.get(fp) != cluster_id]
+
+    with conn.cursor() as cursor:
+        for i in range(0, len(changed), batch_size):
+            cursor.executemany("""
+                UPDATE sql_fingerprint_stats SET cluster_id = %s WHERE fingerprint = %s
+            """, changed[i:i + batch_size])
+            conn.commit()
+
+    stats = {
+        'templates': len(templates),
+        'clusters': len(set(assignments.values())),
+        'updated': len(changed)
+    }
+    logger.info(f"SQL模板聚类完成: {stats['templates']} 个模板 -> {stats['clusters']} 个簇，更新 {stats['updated']} 行")
+    return stats
+
+
+if __name__ == '__main__':
+    import json
+    import pymysql
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    config_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+    with open(config_file, 'r', encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+
+    conn = pymysql.connect(
+        host=db_config['host'],
+        port=int(db_config.get('port', 3306)),
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database'],
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+    try:
+        print(cluster_fingerprint_stats(conn))
+    finally:
+        conn.close()
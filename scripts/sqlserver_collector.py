@@ -18,6 +18,13 @@ except ImportError:
     PYODBC_AVAILABLE = False
     logging.warning("pyodbc未安装，SQL Server监控功能不可用。请运行: pip install pyodbc")
 
+try:
+    from scripts.xml_stream import extract_query_plan, extract_query_plans, extract_deadlock_graph
+    from scripts.deadlock_signature import sqlserver_deadlock_signature
+except ImportError:
+    from xml_stream import extract_query_plan, extract_query_plans, extract_deadlock_graph
+    from deadlock_signature import sqlserver_deadlock_signature
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,7 +39,7 @@ class SQLServerCollector:
         self.instance_id = instance_config['id']
         self.instance_name = instance_config.get('db_project', 'Unknown')
 
-    def connect(self) -> Optional[pyodbc.Connection]:
+    def connect(self) -> Optional['pyodbc.Connection']:
         """连接SQL Server"""
         try:
             # 构建连接字符串
@@ -99,14 +106,14 @@ class SQLServerCollector:
             cursor.execute(query, threshold_seconds * 1000)  # 转换为毫秒
             rows = cursor.fetchall()
 
+            # 批量流式解析执行计划
+            plan_infos = extract_query_plans([row.query_plan for row in rows])
+
             slow_sqls = []
-            for row in rows:
+            for row, plan_info in zip(rows, plan_infos):
                 sql_text = row.sql_text or ''
                 elapsed_seconds = row.elapsed_seconds or 0
 
-                # 解析执行计划
-                plan_info = self.parse_query_plan(row.query_plan)
-
                 slow_sql = {
                     'db_instance_id': self.instance_id,
                     'session_id': str(row.session_id),
@@ -131,6 +138,7 @@ class SQLServerCollector:
                     'execution_plan': json.dumps(plan_info.get('plan', {})) if plan_info.get('plan') else None,
                     'index_used': plan_info.get('indexes_used', ''),
                     'full_table_scan': 1 if plan_info.get('has_scan') else 0,
+                    'plan_hash': plan_info.get('plan_hash'),
                     'detect_time': datetime.now()
                 }
 
@@ -146,53 +154,8 @@ class SQLServerCollector:
             conn.close()
 
     def parse_query_plan(self, query_plan_xml: Optional[str]) -> Dict:
-        """解析SQL Server执行计划XML"""
-        if not query_plan_xml:
-            return {}
-
-        try:
-            root = ET.fromstring(query_plan_xml)
-            ns = {'sp': 'http://schemas.microsoft.com/sqlserver/2004/07/showplan'}
-
-            # 提取成本
-            cost = 0
-            cost_elem = root.find('.//sp:StmtSimple', ns)
-            if cost_elem is not None:
-                cost = float(cost_elem.get('StatementSubTreeCost', 0))
-
-            # 提取预估行数
-            estimated_rows = 0
-            rows_elem = root.find('.//sp:StmtSimple', ns)
-            if rows_elem is not None:
-                estimated_rows = int(float(rows_elem.get('StatementEstRows', 0)))
-
-            # 查找索引使用和扫描
-            indexes = []
-            has_scan = False
-
-            for index_scan in root.findall('.//sp:IndexScan', ns):
-                obj = index_scan.find('sp:Object', ns)
-                if obj is not None:
-                    index_name = obj.get('Index', '')
-                    if index_name:
-                        indexes.append(index_name)
-                    if 'Scan' in index_scan.get('Type', ''):
-                        has_scan = True
-
-            for table_scan in root.findall('.//sp:TableScan', ns):
-                has_scan = True
-
-            return {
-                'cost': cost,
-                'estimated_rows': estimated_rows,
-                'indexes_used': ','.join(indexes) if indexes else 'NONE',
-                'has_scan': has_scan,
-                'plan': {'cost': cost, 'rows': estimated_rows}
-            }
-
-        except Exception as e:
-            logger.debug(f"解析执行计划失败: {e}")
-            return {}
+        """解析SQL Server执行计划XML（流式解析，不构建完整DOM）"""
+        return extract_query_plan(query_plan_xml)
 
     def check_deadlocks(self) -> List[Dict]:
         """检测死锁 - 使用Extended Events"""
@@ -273,6 +236,8 @@ class SQLServerCollector:
                     lock_mode = resource.get('mode', '')
                     break
 
+            signature, components = sqlserver_deadlock_signature(extract_deadlock_graph(xml_str))
+
             return {
                 'deadlock_time': deadlock_time or datetime.now(),
                 'victim_session_id': victim.get('id', ''),
@@ -285,6 +250,8 @@ class SQLServerCollector:
                 'lock_mode': lock_mode,
                 'resolved_action': 'ROLLBACK',
                 'deadlock_graph': xml_str[:2000],
+                'deadlock_signature': signature,
+                'signature_components': components,
                 'detect_time': datetime.now()
             }
 
@@ -3,15 +3,34 @@
 """
 SQL Server死锁检测器
 使用Extended Events检测和采集死锁信息
+
+增量采集:
+- 每个实例维护最后一个已采集事件的时间水位(进程内缓存，首次从deadlock_log恢复)
+- 在SQL Server端用XQuery按 @timestamp 过滤ring_buffer，只传回水位之后的事件
+- 依靠 deadlock_log 的唯一键 (db_instance_id, deadlock_time, victim_spid) INSERT IGNORE 去重
+- 新增的死锁按签名累加到 deadlock_signature_stats
 """
 
-import pyodbc
 import pymysql
 import json
 import logging
-from datetime import datetime
-from typing import List, Dict
-import xml.etree.ElementTree as ET
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+
+try:
+    import pyodbc
+    PYODBC_AVAILABLE = True
+except ImportError:
+    PYODBC_AVAILABLE = False
+    logging.warning("pyodbc未安装，SQL Server死锁检测不可用。请运行: pip install pyodbc")
+
+try:
+    from scripts.xml_stream import extract_deadlock_graph, extract_deadlock_graphs
+    from scripts.deadlock_signature import sqlserver_deadlock_signature, save_deadlock_signatures
+except ImportError:
+    from xml_stream import extract_deadlock_graph, extract_deadlock_graphs
+    from deadlock_signature import sqlserver_deadlock_signature, save_deadlock_signatures
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +38,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 实例ID -> 已采集的最后一个死锁事件时间(UTC)
+_deadlock_watermarks: Dict[int, datetime] = {}
+_watermark_lock = threading.Lock()
+# 无水位时的下界(首次采集读取ring_buffer中的全部事件)
+_EPOCH = datetime(1900, 1, 1)
+
 
 class SQLServerDeadlockCollector:
     """SQL Server死锁采集器"""
@@ -33,7 +58,7 @@ class SQLServerDeadlockCollector:
         self.password = password
         self.monitor_db_config = monitor_db_config
 
-    def connect_sqlserver(self) -> pyodbc.Connection:
+    def connect_sqlserver(self) -> 'pyodbc.Connection':
         """连接SQL Server"""
         conn_str = (
             f"DRIVER={{ODBC Driver 18 for SQL Server}};"
@@ -57,7 +82,7 @@ class SQLServerDeadlockCollector:
             cursorclass=pymysql.cursors.DictCursor
         )
 
-    def ensure_deadlock_session(self, conn: pyodbc.Connection) -> bool:
+    def ensure_deadlock_session(self, conn: 'pyodbc.Connection') -> bool:
         """
         确保Extended Events会话存在
         如果不存在则创建
@@ -125,9 +150,55 @@ class SQLServerDeadlockCollector:
         finally:
             cursor.close()
 
+    def get_watermark(self) -> Optional[datetime]:
+        """
+        获取本实例的死锁事件水位
+
+        进程内没有缓存时从 deadlock_log 恢复。deadlock_time 只精确到秒(且会四舍五入)，
+        因此回退1秒，重复的事件由唯一键去重
+        """
+        with _watermark_lock:
+            if self.instance_id in _deadlock_watermarks:
+                return _deadlock_watermarks[self.instance_id]
+
+        watermark = None
+        try:
+            monitor_conn = self.connect_monitor_db()
+            try:
+                with monitor_conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT MAX(deadlock_time) AS last_time
+                        FROM deadlock_log
+                        WHERE db_instance_id = %s AND victim_spid IS NOT NULL
+                    """, (self.instance_id,))
+                    row = cursor.fetchone()
+                    if row and row['last_time']:
+                        watermark = row['last_time'] - timedelta(seconds=1)
+            finally:
+                monitor_conn.close()
+        except Exception as e:
+            logger.warning(f"{self.instance_name} - 读取死锁水位失败，将全量读取ring_buffer: {e}")
+            return None
+
+        with _watermark_lock:
+            _deadlock_watermarks.setdefault(self.instance_id, watermark)
+            return _deadlock_watermarks[self.instance_id]
+
+    def advance_watermark(self, deadlocks: List[Dict]):
+        """把水位推进到本批最新的事件时间"""
+        if not deadlocks:
+            return
+        latest = max(d['deadlock_time'] for d in deadlocks)
+        with _watermark_lock:
+            current = _deadlock_watermarks.get(self.instance_id)
+            if current is None or latest > current:
+                _deadlock_watermarks[self.instance_id] = latest
+
     def collect_deadlocks(self) -> List[Dict]:
         """
-        从Extended Events采集死锁数据
+        从Extended Events采集水位之后的新死锁事件
+
+        过滤和死锁图抽取都在SQL Server端完成，只传回新事件的 <deadlock> 节点
         """
         deadlocks = []
 
@@ -140,222 +211,130 @@ class SQLServerDeadlockCollector:
                 conn.close()
                 return deadlocks
 
+            watermark = self.get_watermark()
             cursor = conn.cursor()
 
-            # 从ring_buffer读取死锁数据
+            # 从ring_buffer读取水位之后的死锁事件 (@timestamp为UTC)
             query = """
+            SET NOCOUNT ON;
+            DECLARE @watermark DATETIME2(3) = ?;
+
             SELECT
-                CAST(xet.target_data AS XML) as target_data
-            FROM sys.dm_xe_session_targets xet
-            JOIN sys.dm_xe_sessions xes ON xes.address = xet.event_session_address
-            WHERE xes.name = 'DeadlockMonitor'
-              AND xet.target_name = 'ring_buffer'
+                evt.value('(@timestamp)[1]', 'datetime2(3)') AS event_time,
+                CAST(evt.query('(data[@name="xml_report"]/value/deadlock)[1]') AS NVARCHAR(MAX)) AS deadlock_xml
+            FROM (
+                SELECT CAST(xet.target_data AS XML) AS target_data
+                FROM sys.dm_xe_session_targets xet
+                JOIN sys.dm_xe_sessions xes ON xes.address = xet.event_session_address
+                WHERE xes.name = 'DeadlockMonitor'
+                  AND xet.target_name = 'ring_buffer'
+            ) AS t
+            CROSS APPLY t.target_data.nodes('RingBufferTarget/event[@name="xml_deadlock_report"]') AS x(evt)
+            WHERE evt.value('(@timestamp)[1]', 'datetime2(3)') >= @watermark
+            ORDER BY event_time
             """
 
-            cursor.execute(query)
-            row = cursor.fetchone()
-
-            if not row or not row.target_data:
-                logger.info(f"{self.instance_name} - 没有检测到死锁事件")
-                cursor.close()
-                conn.close()
-                return deadlocks
-
-            # 解析XML数据
-            target_data_xml = row.target_data
+            cursor.execute(query, watermark or _EPOCH)
+            rows = cursor.fetchall()
+            cursor.close()
+            conn.close()
 
+            rows = [row for row in rows if row.deadlock_xml]
             try:
-                root = ET.fromstring(target_data_xml)
+                graphs = extract_deadlock_graphs([row.deadlock_xml for row in rows])
+            except Exception as e:
+                logger.error(f"{self.instance_name} - 解析死锁事件失败: {e}")
+                graphs = []
 
-                # 查找所有死锁事件
-                for event in root.findall(".//event[@name='xml_deadlock_report']"):
-                    try:
-                        deadlock_info = self.parse_deadlock_event(event)
-                        if deadlock_info:
-                            deadlocks.append(deadlock_info)
-                    except Exception as e:
-                        logger.error(f"{self.instance_name} - 解析死锁事件失败: {e}")
-                        continue
+            for row, deadlock_info in zip(rows, graphs):
+                deadlock_info['deadlock_time'] = row.event_time
+                deadlock_info['deadlock_xml'] = row.deadlock_xml
+                deadlocks.append(deadlock_info)
 
-            except ET.ParseError as e:
-                logger.error(f"{self.instance_name} - XML解析失败: {e}")
-
-            cursor.close()
-            conn.close()
-
-            logger.info(f"{self.instance_name} - 采集到 {len(deadlocks)} 个死锁事件")
+            logger.info(f"{self.instance_name} - 水位 {watermark} 之后采集到 {len(deadlocks)} 个死锁事件")
 
         except Exception as e:
             logger.error(f"{self.instance_name} - 采集死锁失败: {e}")
 
         return deadlocks
 
-    def parse_deadlock_event(self, event: ET.Element) -> Dict:
-        """解析单个死锁事件"""
-        try:
-            # 获取时间戳
-            timestamp_elem = event.find(".//data[@name='timestamp']")
-            if timestamp_elem is not None:
-                timestamp = timestamp_elem.find('value').text
-                deadlock_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            else:
-                deadlock_time = datetime.now()
-
-            # 获取死锁XML
-            deadlock_xml_elem = event.find(".//data[@name='xml_report']")
-            if deadlock_xml_elem is None:
-                return None
-
-            deadlock_xml = deadlock_xml_elem.find('value').text
-
-            # 解析死锁图
-            deadlock_info = self.parse_deadlock_graph(deadlock_xml)
-            deadlock_info['deadlock_time'] = deadlock_time
-            deadlock_info['deadlock_xml'] = deadlock_xml
-
-            return deadlock_info
-
-        except Exception as e:
-            logger.error(f"解析死锁事件失败: {e}")
-            return None
-
     def parse_deadlock_graph(self, deadlock_xml: str) -> Dict:
-        """解析死锁图XML，提取关键信息"""
-        try:
-            root = ET.fromstring(deadlock_xml)
+        """解析死锁图XML，提取关键信息（流式解析，不构建完整DOM）"""
+        return extract_deadlock_graph(deadlock_xml)
 
-            info = {
-                'victim_spid': None,
-                'process_count': 0,
-                'resource_list': [],
-                'process_list': []
-            }
+    def save_to_monitor_db(self, deadlocks: List[Dict]) -> int:
+        """
+        保存死锁记录到监控数据库，并累加死锁签名统计
 
-            # 获取受害者进程
-            victim_elem = root.find(".//victimProcess")
-            if victim_elem is not None:
-                info['victim_spid'] = victim_elem.get('id', 'unknown')
-
-            # 解析进程列表
-            for process in root.findall(".//process-list/process"):
-                process_info = {
-                    'spid': process.get('id'),
-                    'hostname': process.get('hostname'),
-                    'loginname': process.get('loginname'),
-                    'isolationlevel': process.get('isolationlevel'),
-                    'status': process.get('status'),
-                    'sql_text': ''
-                }
-
-                # 获取SQL文本
-                input_buf = process.find('.//inputbuf')
-                if input_buf is not None and input_buf.text:
-                    process_info['sql_text'] = input_buf.text.strip()
-
-                info['process_list'].append(process_info)
-                info['process_count'] += 1
-
-            # 解析资源列表
-            for resource in root.findall(".//resource-list/*"):
-                resource_info = {
-                    'resource_type': resource.tag,
-                    'database_name': resource.get('dbname', 'unknown'),
-                    'object_name': resource.get('objectname', ''),
-                    'index_name': resource.get('indexname', '')
-                }
-                info['resource_list'].append(resource_info)
-
-            return info
-
-        except ET.ParseError as e:
-            logger.error(f"死锁图XML解析失败: {e}")
-            return {
-                'victim_spid': None,
-                'process_count': 0,
-                'resource_list': [],
-                'process_list': []
-            }
+        由唯一键 (db_instance_id, deadlock_time, victim_spid) 去重，已存在的记录被忽略；
+        只有真正新增的死锁计入 deadlock_signature_stats
 
-    def save_to_monitor_db(self, deadlocks: List[Dict]) -> int:
-        """保存死锁记录到监控数据库"""
+        Returns:
+            新增记录数；保存失败返回 -1
+        """
         if not deadlocks:
             return 0
 
-        saved_count = 0
+        rows = []
+        for deadlock in deadlocks:
+            # 获取受害者SQL
+            victim_sql = ''
+            if deadlock.get('victim_spid'):
+                for proc in deadlock.get('process_list', []):
+                    if proc.get('spid') == deadlock['victim_spid']:
+                        victim_sql = proc.get('sql_text', '')[:2000]
+                        break
+
+            signature, components = sqlserver_deadlock_signature(deadlock)
+            deadlock['db_instance_id'] = self.instance_id
+            deadlock['victim_sql'] = victim_sql
+            deadlock['deadlock_signature'] = signature
+            deadlock['signature_components'] = components
+
+            # 构建死锁图JSON
+            deadlock_graph = {
+                'victim_spid': deadlock.get('victim_spid'),
+                'process_count': deadlock.get('process_count', 0),
+                'processes': deadlock.get('process_list', []),
+                'resources': deadlock.get('resource_list', [])
+            }
+
+            rows.append((
+                self.instance_id,
+                deadlock['deadlock_time'],
+                deadlock.get('victim_spid') or 'unknown',
+                deadlock.get('process_count', 0),
+                victim_sql,
+                signature,
+                deadlock.get('deadlock_xml', ''),
+                json.dumps(deadlock_graph, ensure_ascii=False)
+            ))
 
         try:
             monitor_conn = self.connect_monitor_db()
-            cursor = monitor_conn.cursor()
-
-            for deadlock in deadlocks:
-                try:
-                    # 检查是否已存在（根据时间和victim_spid去重）
-                    check_query = """
-                    SELECT COUNT(*) as cnt FROM deadlock_log
-                    WHERE db_instance_id = %s
-                      AND deadlock_time = %s
-                      AND victim_spid = %s
-                    """
-                    cursor.execute(check_query, (
-                        self.instance_id,
-                        deadlock['deadlock_time'],
-                        deadlock.get('victim_spid')
-                    ))
-
-                    if cursor.fetchone()['cnt'] > 0:
-                        logger.debug(f"{self.instance_name} - 死锁记录已存在，跳过")
-                        continue
-
-                    # 插入死锁记录
-                    insert_query = """
-                    INSERT INTO deadlock_log
-                    (db_instance_id, deadlock_time, victim_spid, process_count,
-                     victim_sql, deadlock_xml, deadlock_graph, detect_time)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-                    """
-
-                    # 获取受害者SQL
-                    victim_sql = ''
-                    if deadlock.get('victim_spid'):
-                        for proc in deadlock.get('process_list', []):
-                            if proc.get('spid') == deadlock['victim_spid']:
-                                victim_sql = proc.get('sql_text', '')[:2000]
-                                break
-
-                    # 构建死锁图JSON
-                    deadlock_graph = {
-                        'victim_spid': deadlock.get('victim_spid'),
-                        'process_count': deadlock.get('process_count', 0),
-                        'processes': deadlock.get('process_list', []),
-                        'resources': deadlock.get('resource_list', [])
-                    }
-
-                    cursor.execute(insert_query, (
-                        self.instance_id,
-                        deadlock['deadlock_time'],
-                        deadlock.get('victim_spid'),
-                        deadlock.get('process_count', 0),
-                        victim_sql,
-                        deadlock.get('deadlock_xml', '')[:10000],  # 限制大小
-                        json.dumps(deadlock_graph, ensure_ascii=False)
-                    ))
-
-                    saved_count += 1
-
-                except Exception as e:
-                    logger.error(f"{self.instance_name} - 保存死锁记录失败: {e}")
-                    continue
-
-            monitor_conn.commit()
-            cursor.close()
-            monitor_conn.close()
-
-            logger.info(f"{self.instance_name} - 保存了 {saved_count} 条新死锁记录")
+            try:
+                with monitor_conn.cursor() as cursor:
+                    # 逐条插入以区分新增与重复(每轮死锁数很少)，签名统计只累加新增的
+                    inserted = []
+                    for deadlock, row in zip(deadlocks, rows):
+                        if cursor.execute("""
+                            INSERT IGNORE INTO deadlock_log
+                            (db_instance_id, deadlock_time, victim_spid, process_count,
+                             victim_sql, deadlock_signature, deadlock_xml, deadlock_graph, detect_time)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                        """, row):
+                            inserted.append(deadlock)
+                    save_deadlock_signatures(cursor, inserted)
+                monitor_conn.commit()
+            finally:
+                monitor_conn.close()
+
+            logger.info(f"{self.instance_name} - 保存了 {len(inserted)} 条新死锁记录")
+            return len(inserted)
 
         except Exception as e:
             logger.error(f"{self.instance_name} - 保存死锁到监控数据库失败: {e}")
-
-        return saved_count
+            return -1
 
     def run(self):
         """执行死锁采集"""
@@ -365,10 +344,12 @@ class SQLServerDeadlockCollector:
             # 采集死锁
             deadlocks = self.collect_deadlocks()
 
-            # 保存到监控数据库
+            # 保存到监控数据库，成功后推进水位
             if deadlocks:
                 saved_count = self.save_to_monitor_db(deadlocks)
-                logger.info(f"{self.instance_name} - 死锁检测完成，新增 {saved_count} 条记录")
+                if saved_count >= 0:
+                    self.advance_watermark(deadlocks)
+                    logger.info(f"{self.instance_name} - 死锁检测完成，新增 {saved_count} 条记录")
             else:
                 logger.info(f"{self.instance_name} - 未检测到死锁")
 
@@ -378,6 +359,10 @@ class SQLServerDeadlockCollector:
 
 def collect_all_sqlserver_deadlocks(monitor_db_config: dict):
     """采集所有SQL Server实例的死锁"""
+    if not PYODBC_AVAILABLE:
+        logger.warning("pyodbc未安装，跳过SQL Server死锁检测")
+        return
+
     try:
         # 连接监控数据库
         conn = pymysql.connect(
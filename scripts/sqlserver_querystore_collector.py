@@ -25,6 +25,8 @@ import json
 import time
 import logging
 import argparse
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
@@ -38,6 +40,21 @@ except ImportError:
 
 import pymysql
 
+try:
+    from scripts.heavy_hitters import get_tracker
+    from scripts.plan_regression import record_plan_samples, send_regression_alerts
+    from scripts.sql_fingerprint import SQLFingerprint
+    from scripts.table_hotness import save_table_hotness
+    from scripts.workload_delta import annotate_cumulative_deltas, annotate_running_deltas
+    from scripts.xml_stream import extract_query_plans
+except ImportError:
+    from heavy_hitters import get_tracker
+    from plan_regression import record_plan_samples, send_regression_alerts
+    from sql_fingerprint import SQLFingerprint
+    from table_hotness import save_table_hotness
+    from workload_delta import annotate_cumulative_deltas, annotate_running_deltas
+    from xml_stream import extract_query_plans
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -81,6 +98,13 @@ def load_monitor_db_config() -> Dict:
 
 MONITOR_DB_CONFIG = load_monitor_db_config()
 
+# 执行计划基线: 回看多少小时的运行统计(首次看到某条查询时据此补齐各计划的历史)
+PLAN_SAMPLE_LOOKBACK_HOURS = 24
+# Query Store 的 plan_id 对应的计划不会变化，计划哈希按 (实例, 库, plan_id) 缓存
+PLAN_HASH_CACHE_LIMIT = 20000
+_plan_hashes: OrderedDict = OrderedDict()
+_plan_hashes_lock = threading.Lock()
+
 
 class SQLServerQueryStoreCollector:
     """
@@ -98,6 +122,13 @@ class SQLServerQueryStoreCollector:
         self.instance_name = instance_config.get('db_project', 'Unknown')
         self.threshold_seconds = threshold_seconds
         self.threshold_microseconds = threshold_seconds * 1000000  # Query Store用微秒
+        # 本次采集中发生的错误(各步骤自行捕获异常，调用方据此判断采集是否失败)
+        self.errors: List[str] = []
+
+    def record_error(self, message: str):
+        """记录采集错误: 写日志并保留在 self.errors 中"""
+        logger.error(message)
+        self.errors.append(message)
 
     def connect_target(self) -> Optional[pyodbc.Connection]:
         """连接目标SQL Server实例"""
@@ -116,7 +147,7 @@ class SQLServerQueryStoreCollector:
             return conn
 
         except Exception as e:
-            logger.error(f"连接目标SQL Server失败 {self.instance_name}: {e}")
+            self.record_error(f"连接目标SQL Server失败 {self.instance_name}: {e}")
             return None
 
     def connect_monitor(self) -> Optional[pymysql.Connection]:
@@ -124,7 +155,7 @@ class SQLServerQueryStoreCollector:
         try:
             return pymysql.connect(**MONITOR_DB_CONFIG)
         except Exception as e:
-            logger.error(f"连接监控数据库失败: {e}")
+            self.record_error(f"连接监控数据库失败: {e}")
             return None
 
     def get_user_databases(self, conn: pyodbc.Connection) -> List[str]:
@@ -145,7 +176,7 @@ class SQLServerQueryStoreCollector:
             return databases
 
         except Exception as e:
-            logger.error(f"获取数据库列表失败: {e}")
+            self.record_error(f"获取数据库列表失败: {e}")
             return []
 
     def check_querystore_enabled(self, conn: pyodbc.Connection, database: str) -> bool:
@@ -210,7 +241,7 @@ class SQLServerQueryStoreCollector:
             return True
 
         except Exception as e:
-            logger.error(f"开启Query Store失败 {database}: {e}")
+            self.record_error(f"开启Query Store失败 {database}: {e}")
             return False
 
     def collect_from_querystore(self, conn: pyodbc.Connection, database: str) -> List[Dict]:
@@ -240,6 +271,8 @@ class SQLServerQueryStoreCollector:
 
             SELECT TOP 100
                 qsq.query_id,
+                qsp.plan_id,
+                qsrs.runtime_stats_id,
                 qsqt.query_sql_text,
                 qsq.query_hash,
                 qsrs.count_executions,
@@ -252,7 +285,8 @@ class SQLServerQueryStoreCollector:
                 qsrs.avg_logical_io_writes,
                 qsrs.avg_physical_io_reads,
                 qsrs.avg_rowcount,
-                qsrs.last_execution_time,
+                CAST(qsrs.first_execution_time AS DATETIME2) AS first_execution_time,
+                CAST(qsrs.last_execution_time AS DATETIME2) AS last_execution_time,
                 qsp.query_plan
             FROM sys.query_store_query qsq
             JOIN sys.query_store_query_text qsqt ON qsq.query_text_id = qsqt.query_text_id
@@ -281,8 +315,11 @@ class SQLServerQueryStoreCollector:
 
             logger.info(f"{self.instance_name} - {database}: 从Query Store采集到 {len(rows)} 条慢SQL记录")
 
+            # 批量流式解析执行计划，只保留需要入库的字段，不再携带原始XML
+            plan_infos = extract_query_plans([row.query_plan for row in rows])
+
             slow_sqls = []
-            for row in rows:
+            for row, plan_info in zip(rows, plan_infos):
                 # 生成SQL指纹 (使用query_hash)
                 sql_fingerprint = f"{database}_{row.query_hash}"[:64]
 
@@ -290,6 +327,8 @@ class SQLServerQueryStoreCollector:
                     'db_instance_id': self.instance_id,
                     'database_name': database,
                     'query_id': str(row.query_id),
+                    'plan_id': row.plan_id,
+                    'runtime_stats_id': row.runtime_stats_id,
                     'sql_fingerprint': sql_fingerprint,
                     'sql_text': row.query_sql_text[:4000] if row.query_sql_text else None,
                     'sql_fulltext': row.query_sql_text,
@@ -303,8 +342,13 @@ class SQLServerQueryStoreCollector:
                     'avg_logical_writes': int(row.avg_logical_io_writes or 0),
                     'avg_physical_reads': int(row.avg_physical_io_reads or 0),
                     'avg_rowcount': int(row.avg_rowcount or 0),
+                    'first_execution_time': row.first_execution_time,
                     'last_execution_time': row.last_execution_time,
-                    'query_plan': row.query_plan,
+                    'query_cost': plan_info.get('cost', 0),
+                    'execution_plan': json.dumps(plan_info['plan'], ensure_ascii=False) if plan_info.get('plan') else None,
+                    'index_used': plan_info.get('indexes_used', ''),
+                    'full_table_scan': 1 if plan_info.get('has_scan') else 0,
+                    'plan_hash': plan_info.get('plan_hash'),
                     'detect_time': datetime.now(),
                     'collection_method': 'query_store'
                 }
@@ -312,12 +356,168 @@ class SQLServerQueryStoreCollector:
                 slow_sqls.append(slow_sql)
 
             cursor.close()
+
+            # 运行统计按 (计划, 时间间隔, 执行类型) 累计，换算成本周期增量
+            annotate_cumulative_deltas(
+                slow_sqls,
+                counter_key=lambda r: (r['db_instance_id'], database, r['runtime_stats_id']),
+                totals=lambda r: (r['execution_count'], r['avg_elapsed_seconds'] * r['execution_count'], 0),
+                started_field='first_execution_time', seen_field='last_execution_time',
+                watermark_key=('query_store', self.instance_id, database)
+            )
             return slow_sqls
 
         except Exception as e:
-            logger.error(f"{database}: 从Query Store采集失败: {e}")
+            self.record_error(f"{database}: 从Query Store采集失败: {e}")
+            return []
+
+    def collect_plan_samples(self, conn: pyodbc.Connection, database: str, slow_sqls: List[Dict]) -> List[Dict]:
+        """
+        采集执行计划基线样本
+
+        慢SQL只包含平均耗时超过阈值的运行统计，旧计划很快时进不了基线。查询一旦出现在
+        慢SQL中，就读取它全部计划最近 PLAN_SAMPLE_LOOKBACK_HOURS 小时的运行统计(不按耗时
+        过滤)，按 runtime_stats_id 换算成增量；首次看到的运行统计全部计入，
+        新旧计划因此都有历史执行可比较。
+
+        Returns:
+            本周期有执行的样本记录(含 plan_hash 和 delta_* 字段)
+        """
+        fingerprints = {r['query_id']: r['sql_fingerprint'] for r in slow_sqls}
+        sql_texts = {r['query_id']: r.get('sql_text') for r in slow_sqls}
+        if not fingerprints:
             return []
 
+        try:
+            cursor = conn.cursor()
+            placeholders = ', '.join(['?'] * len(fingerprints))
+            cursor.execute(f"""
+            USE [{database}];
+
+            SELECT
+                qsp.query_id,
+                qsp.plan_id,
+                qsrs.runtime_stats_id,
+                qsrs.count_executions,
+                qsrs.avg_duration / 1000000.0 AS avg_duration_seconds,
+                CAST(qsrs.first_execution_time AS DATETIME2) AS first_execution_time,
+                CAST(qsrs.last_execution_time AS DATETIME2) AS last_execution_time
+            FROM sys.query_store_plan qsp
+            JOIN sys.query_store_runtime_stats qsrs ON qsp.plan_id = qsrs.plan_id
+            WHERE qsp.query_id IN ({placeholders})
+              AND qsrs.last_execution_time >= DATEADD(HOUR, -{PLAN_SAMPLE_LOOKBACK_HOURS}, SYSDATETIMEOFFSET())
+            """, [int(query_id) for query_id in fingerprints])
+            rows = cursor.fetchall()
+
+            plan_hashes = self.resolve_plan_hashes(cursor, database, {row.plan_id for row in rows}, slow_sqls)
+            cursor.close()
+        except Exception as e:
+            logger.warning(f"{database}: 读取执行计划基线样本失败: {e}")
+            return []
+
+        detect_time = datetime.now()
+        samples = [{
+            'db_instance_id': self.instance_id,
+            'database_name': database,
+            'sql_fingerprint': fingerprints[str(row.query_id)],
+            'plan_hash': plan_hashes.get(row.plan_id),
+            'sql_text': sql_texts[str(row.query_id)],
+            'runtime_stats_id': row.runtime_stats_id,
+            'execution_count': int(row.count_executions or 0),
+            'avg_elapsed_seconds': float(row.avg_duration_seconds or 0),
+            'first_execution_time': row.first_execution_time,
+            'last_execution_time': row.last_execution_time,
+            'detect_time': detect_time
+        } for row in rows]
+        annotate_cumulative_deltas(
+            samples,
+            counter_key=lambda r: ('plan_sample', r['db_instance_id'], database, r['runtime_stats_id']),
+            totals=lambda r: (r['execution_count'], r['avg_elapsed_seconds'] * r['execution_count'], 0),
+            baseline_on_first=False
+        )
+        return [s for s in samples if s['plan_hash'] and s['delta_executions']]
+
+    def resolve_plan_hashes(self, cursor, database: str, plan_ids: set, slow_sqls: List[Dict]) -> Dict[int, str]:
+        """plan_id -> 计划哈希，缓存和本轮慢SQL中没有的计划才读取Showplan XML"""
+        hashes = {}
+        for record in slow_sqls:
+            if record.get('plan_id') in plan_ids and record.get('plan_hash'):
+                hashes[record['plan_id']] = record['plan_hash']
+        with _plan_hashes_lock:
+            for plan_id in plan_ids - hashes.keys():
+                cached = _plan_hashes.get((self.instance_id, database, plan_id))
+                if cached:
+                    hashes[plan_id] = cached
+
+        missing = sorted(plan_ids - hashes.keys())
+        if missing:
+            cursor.execute(f"""
+            SELECT plan_id, query_plan FROM sys.query_store_plan
+            WHERE plan_id IN ({', '.join(['?'] * len(missing))})
+            """, missing)
+            plan_rows = cursor.fetchall()
+            plan_infos = extract_query_plans([row.query_plan for row in plan_rows])
+            for row, plan_info in zip(plan_rows, plan_infos):
+                if plan_info.get('plan_hash'):
+                    hashes[row.plan_id] = plan_info['plan_hash']
+
+        with _plan_hashes_lock:
+            for plan_id, plan_hash in hashes.items():
+                key = (self.instance_id, database, plan_id)
+                _plan_hashes[key] = plan_hash
+                _plan_hashes.move_to_end(key)
+            while len(_plan_hashes) > PLAN_HASH_CACHE_LIMIT:
+                _plan_hashes.popitem(last=False)
+        return hashes
+
+    def feed_heavy_hitters(self, conn: pyodbc.Connection, database: str) -> int:
+        """
+        把当前Query Store统计区间的累计值喂给实时Top SQL跟踪器
+
+        runtime_stats按统计区间累计，区间切换后计数从0开始，因此以
+        (query_hash, 区间ID) 作为累计值的标识；跟踪器启动前就已开始的区间
+        首次只记录基线，避免把整段历史算进当前窗口
+        """
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+            USE [{database}];
+
+            SELECT TOP 2000
+                qsq.query_hash,
+                rsi.runtime_stats_interval_id,
+                DATEDIFF(SECOND, rsi.start_time, SYSDATETIMEOFFSET()) AS interval_age_seconds,
+                SUM(qsrs.count_executions) AS execution_count,
+                SUM(qsrs.avg_duration * qsrs.count_executions) / 1000000.0 AS total_duration_seconds,
+                MAX(LEFT(qsqt.query_sql_text, 500)) AS sample_sql
+            FROM sys.query_store_runtime_stats qsrs
+            JOIN sys.query_store_runtime_stats_interval rsi ON qsrs.runtime_stats_interval_id = rsi.runtime_stats_interval_id
+            JOIN sys.query_store_plan qsp ON qsrs.plan_id = qsp.plan_id
+            JOIN sys.query_store_query qsq ON qsp.query_id = qsq.query_id
+            JOIN sys.query_store_query_text qsqt ON qsq.query_text_id = qsqt.query_text_id
+            WHERE rsi.end_time >= DATEADD(MINUTE, -5, SYSDATETIMEOFFSET())
+            GROUP BY qsq.query_hash, rsi.runtime_stats_interval_id, rsi.start_time
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+
+            tracker = get_tracker()
+            uptime = time.time() - tracker.started_at
+            for row in rows:
+                fingerprint = f"{database}_{row.query_hash}"[:64]
+                tracker.observe_cumulative(
+                    self.instance_id, fingerprint,
+                    int(row.execution_count or 0), float(row.total_duration_seconds or 0),
+                    sample=row.sample_sql,
+                    counter_key=f"{fingerprint}_{row.runtime_stats_interval_id}",
+                    baseline_on_first=(row.interval_age_seconds or 0) > uptime
+                )
+            return len(rows)
+
+        except Exception as e:
+            logger.warning(f"{database}: 更新实时Top SQL失败: {e}")
+            return 0
+
     def collect_from_dmv(self, conn: pyodbc.Connection) -> List[Dict]:
         """
         从DMV采集正在执行的慢SQL (辅助)
@@ -401,15 +601,20 @@ class SQLServerQueryStoreCollector:
 
                 slow_sqls.append(slow_sql)
 
+                get_tracker().observe_running(
+                    self.instance_id, row.session_id, SQLFingerprint.generate(row.sql_text),
+                    slow_sql['elapsed_seconds'], sample=slow_sql['sql_text']
+                )
+
             cursor.close()
-            return slow_sqls
+            return annotate_running_deltas(slow_sqls)
 
         except Exception as e:
-            logger.error(f"{self.instance_name}: 从DMV采集失败: {e}")
+            self.record_error(f"{self.instance_name}: 从DMV采集失败: {e}")
             return []
 
-    def save_to_monitor_db(self, slow_sqls: List[Dict]) -> int:
-        """保存慢SQL到监控数据库"""
+    def save_to_monitor_db(self, slow_sqls: List[Dict], plan_samples: Optional[List[Dict]] = None) -> int:
+        """保存慢SQL(及执行计划基线样本)到监控数据库"""
         if not slow_sqls:
             return 0
 
@@ -418,6 +623,7 @@ class SQLServerQueryStoreCollector:
             return 0
 
         saved_count = 0
+        saved_records = []
 
         try:
             with monitor_conn.cursor() as cursor:
@@ -427,8 +633,9 @@ class SQLServerQueryStoreCollector:
                         INSERT INTO long_running_sql_log
                         (db_instance_id, session_id, sql_fingerprint, sql_text, sql_fulltext,
                          username, machine, program, elapsed_seconds, elapsed_minutes,
-                         cpu_time, logical_reads, status, detect_time)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                         cpu_time, logical_reads, status, query_cost, execution_plan,
+                         index_used, full_table_scan, plan_hash, detect_time)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                         """
 
                         cursor.execute(insert_sql, (
@@ -445,19 +652,36 @@ class SQLServerQueryStoreCollector:
                             sql_record.get('avg_cpu_seconds', sql_record.get('cpu_time', 0)),
                             sql_record.get('avg_logical_reads', sql_record.get('logical_reads', 0)),
                             sql_record.get('status', 'COMPLETED'),
+                            sql_record.get('query_cost'),
+                            sql_record.get('execution_plan'),
+                            sql_record.get('index_used'),
+                            sql_record.get('full_table_scan', 0),
+                            sql_record.get('plan_hash'),
                             sql_record.get('detect_time')
                         ))
 
                         saved_count += 1
+                        saved_records.append(sql_record)
 
                     except Exception as e:
                         logger.debug(f"保存单条记录失败: {e}")
 
+                # 表级热度与慢SQL日志同一事务提交
+                save_table_hotness(cursor, saved_records)
+                # 执行计划基线增量更新，检测计划变化导致的性能回归
+                regressions = record_plan_samples(cursor, plan_samples or [])
+
             monitor_conn.commit()
             logger.info(f"{self.instance_name}: 成功保存 {saved_count} 条慢SQL记录")
 
+            if regressions:
+                with monitor_conn.cursor() as cursor:
+                    send_regression_alerts(cursor, regressions,
+                                           instance_names={self.instance_id: self.instance_name})
+                monitor_conn.commit()
+
         except Exception as e:
-            logger.error(f"保存到监控数据库失败: {e}")
+            self.record_error(f"保存到监控数据库失败: {e}")
             monitor_conn.rollback()
         finally:
             monitor_conn.close()
@@ -465,13 +689,20 @@ class SQLServerQueryStoreCollector:
         return saved_count
 
     def collect(self, auto_enable_querystore: bool = False) -> int:
-        """执行完整采集流程"""
+        """
+        执行完整采集流程
+
+        Returns:
+            保存的慢SQL条数；连接失败或某个步骤出错时错误信息记录在 self.errors
+        """
+        self.errors = []
         target_conn = self.connect_target()
         if not target_conn:
             return 0
 
         try:
             all_slow_sqls = []
+            plan_samples = []
 
             # 获取用户数据库列表
             databases = self.get_user_databases(target_conn)
@@ -489,13 +720,15 @@ class SQLServerQueryStoreCollector:
                 if querystore_enabled:
                     querystore_sqls = self.collect_from_querystore(target_conn, database)
                     all_slow_sqls.extend(querystore_sqls)
+                    plan_samples.extend(self.collect_plan_samples(target_conn, database, querystore_sqls))
+                    self.feed_heavy_hitters(target_conn, database)
 
             # 辅助从DMV采集当前正在运行的 (补充数据源)
             dmv_sqls = self.collect_from_dmv(target_conn)
             all_slow_sqls.extend(dmv_sqls)
 
             # 保存到监控数据库
-            saved_count = self.save_to_monitor_db(all_slow_sqls)
+            saved_count = self.save_to_monitor_db(all_slow_sqls, plan_samples)
 
             return saved_count
 
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表级热度聚合
+
+采集器保存慢SQL时，顺带按 (实例, 库/架构, 表, 小时) 累加慢SQL次数、耗时和扫描行数，
+写入 table_hotness_hourly。"哪些表导致了最多的慢SQL耗时" 因此变成按索引查询，
+不再需要扫描 long_running_sql_log 里的原始SQL。
+
+累加的是每条记录本周期的增量(workload_delta)：同一条运行中的SQL、
+同一个累计计数器被多轮采集到时不会重复计数。
+
+表名由 SQLFingerprint.extract_table_refs 基于词法分析提取；未限定库名的表
+归到该条SQL的 database_name 下。
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+try:
+    from scripts.sql_fingerprint import SQLFingerprint
+    from scripts.workload_delta import record_delta
+except ImportError:
+    from sql_fingerprint import SQLFingerprint
+    from workload_delta import record_delta
+
+logger = logging.getLogger(__name__)
+
+
+def aggregate_table_hotness(sql_records: List[Dict]) -> Dict[Tuple, List[float]]:
+    """
+    把慢SQL记录按表和小时聚合
+
+    Args:
+        sql_records: 采集器保存到 long_running_sql_log 的记录，
+                     已由 workload_delta.annotate_* 计算本周期增量
+
+    Returns:
+        {(db_instance_id, schema_name, table_name, stat_hour): [次数, 总耗时, 总扫描行数]}
+    """
+    hotness: Dict[Tuple, List[float]] = {}
+
+    for record in sql_records:
+        sql_text = record.get('sql_fulltext') or record.get('sql_text')
+        if not sql_text:
+            continue
+
+        executions, elapsed, rows_examined = record_delta(record)
+        if not executions and not elapsed and not rows_examined:
+            continue
+
+        detect_time = record.get('detect_time') or datetime.now()
+        stat_hour = detect_time.replace(minute=0, second=0, microsecond=0)
+        default_schema = record.get('database_name') or ''
+
+        for ref in SQLFingerprint.extract_table_refs(sql_text):
+            schema_name = ref[-2] if len(ref) > 1 else default_schema
+            key = (record.get('db_instance_id'), schema_name[:128], ref[-1][:128], stat_hour)
+            stats = hotness.setdefault(key, [0, 0.0, 0])
+            stats[0] += int(executions)
+            stats[1] += float(elapsed)
+            stats[2] += int(rows_examined)
+
+    return hotness
+
+
+def save_table_hotness(cursor, sql_records: List[Dict]) -> int:
+    """
+    累加表级热度（在调用方的事务中执行，由调用方提交）
+
+    Args:
+        cursor: 监控库游标
+        sql_records: 本次保存的慢SQL记录
+
+    Returns:
+        更新的 (表, 小时) 行数
+    """
+    hotness = aggregate_table_hotness(sql_records)
+    if not hotness:
+        return 0
+
+    try:
+        cursor.executemany("""
+            INSERT INTO table_hotness_hourly
+            (db_instance_id, schema_name, table_name, stat_hour,
+             slow_count, total_elapsed_seconds, total_rows_examined)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                slow_count = slow_count + VALUES(slow_count),
+                total_elapsed_seconds = total_elapsed_seconds + VALUES(total_elapsed_seconds),
+                total_rows_examined = total_rows_examined + VALUES(total_rows_examined)
+        """, [key + tuple(stats) for key, stats in hotness.items()])
+        return len(hotness)
+    except Exception as e:
+        logger.warning(f"更新表级热度失败: {e}")
+        return 0
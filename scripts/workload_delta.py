@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+慢SQL记录的本周期增量
+
+采集器每一轮都会把同一批记录重新保存一次:
+- processlist / DMV 中仍在运行的会话每个采集周期都会出现，耗时是已运行时长
+- performance_schema digest 和 Query Store 运行统计是累计值，只要最近还在执行就会反复采到
+
+表级热度、执行计划基线等累加型统计如果直接累加这些记录，会随采集次数而不是真实负载增长。
+这里为每条记录计算本周期的真实增量，写入 delta_executions / delta_elapsed_seconds /
+delta_rows_examined 三个字段，供累加型统计使用:
+
+- 运行中的SQL: 同一 (实例, 会话, 指纹, 开始执行时间) 只计一次执行，耗时按两次快照的差值累加
+- 累计计数器: 与上一次快照做差；首次看到时只记录基线(无法区分历史累计)，
+  除非该计数器在上一轮采集之后才出现(起始时间晚于上一轮的水位)；计数回退时以当前值作为增量
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 每类状态最多保留的键数(LRU)，足够覆盖全部实例一个周期内的活跃SQL
+DEFAULT_STATE_LIMIT = 200000
+# processlist的耗时是整秒，"采集时间 - 已运行时长" 在同一次执行的多次快照间会有抖动
+EXEC_START_TOLERANCE_SECONDS = 2
+
+Totals = Tuple[float, float, float]
+
+
+class WorkloadDeltaTracker:
+    """慢SQL增量跟踪器（线程安全，状态为有界LRU）"""
+
+    def __init__(self, state_limit: int = DEFAULT_STATE_LIMIT):
+        self.state_limit = state_limit
+        # 计数器键 -> (累计次数, 累计耗时, 累计扫描行数)
+        self._cumulative: OrderedDict = OrderedDict()
+        # 水位键 -> 上一轮采集到的最大活跃时间(目标库时钟)
+        self._watermarks: Dict[tuple, datetime] = {}
+        # (实例, 会话, 指纹) -> (开始执行时间戳, 已运行秒数, 扫描行数)
+        self._running: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, state: OrderedDict, key, value):
+        state[key] = value
+        state.move_to_end(key)
+        while len(state) > self.state_limit:
+            state.popitem(last=False)
+
+    def running(self, key: tuple, elapsed_seconds: float, rows_examined: float = 0,
+                detect_time: Optional[datetime] = None) -> Totals:
+        """
+        运行中SQL的一次快照，返回 (新增执行次数, 新增耗时, 新增扫描行数)
+
+        Args:
+            key: (实例ID, 会话ID, SQL指纹)
+            elapsed_seconds: 快照时已运行秒数
+            rows_examined: 快照时的扫描行数(或估算值)
+            detect_time: 快照时间
+        """
+        elapsed = float(elapsed_seconds or 0)
+        rows = float(rows_examined or 0)
+        taken_at = (detect_time or datetime.now()).timestamp()
+        exec_start = taken_at - elapsed
+        with self._lock:
+            previous = self._running.get(key)
+            if previous is None or exec_start > previous[0] + EXEC_START_TOLERANCE_SECONDS:
+                # 新的一次执行(同一会话上同一条SQL再次执行时开始时间会后移)
+                self._remember(self._running, key, (exec_start, elapsed, rows))
+                return 1, elapsed, rows
+            self._remember(self._running, key, (previous[0], max(elapsed, previous[1]), max(rows, previous[2])))
+            return 0, max(0.0, elapsed - previous[1]), max(0.0, rows - previous[2])
+
+    def cumulative(self, key: tuple, totals: Totals, started_at: Optional[datetime] = None,
+                   watermark: Optional[datetime] = None, baseline_on_first: bool = True) -> Totals:
+        """
+        累计计数器的一次快照，返回本周期增量
+
+        Args:
+            key: 计数器键
+            totals: (累计次数, 累计耗时, 累计扫描行数)
+            started_at: 计数器开始累计的时间(目标库时钟)
+            watermark: 上一轮采集的水位，started_at 晚于水位说明计数器在上一轮之后才出现
+            baseline_on_first: 首次看到时只记录基线；为False时首次看到的累计值全部计入
+                               (需要历史数据的统计，如执行计划基线)
+        """
+        totals = tuple(float(v or 0) for v in totals)
+        with self._lock:
+            previous = self._cumulative.get(key)
+            self._remember(self._cumulative, key, totals)
+        if previous is None:
+            if not baseline_on_first:
+                return totals
+            if started_at is not None and watermark is not None and started_at > watermark:
+                return totals
+            return 0, 0.0, 0.0
+        if any(current < before for current, before in zip(totals, previous)):
+            # 计数器被重置(TRUNCATE / 实例重启 / 计划被清除)
+            return totals
+        return tuple(current - before for current, before in zip(totals, previous))
+
+    def watermark(self, key: tuple) -> Optional[datetime]:
+        with self._lock:
+            return self._watermarks.get(key)
+
+    def advance_watermark(self, key: tuple, seen: Optional[datetime]):
+        if seen is None:
+            return
+        with self._lock:
+            previous = self._watermarks.get(key)
+            if previous is None or seen > previous:
+                self._watermarks[key] = seen
+
+
+_tracker = WorkloadDeltaTracker()
+
+
+def get_delta_tracker() -> WorkloadDeltaTracker:
+    return _tracker
+
+
+def _set_delta(record: Dict, delta: Totals):
+    record['delta_executions'] = int(delta[0])
+    record['delta_elapsed_seconds'] = float(delta[1])
+    record['delta_rows_examined'] = int(delta[2])
+
+
+def annotate_running_deltas(records: List[Dict], tracker: Optional[WorkloadDeltaTracker] = None) -> List[Dict]:
+    """
+    为processlist/DMV快照记录计算增量(原地写入 delta_* 字段)
+
+    记录需含 db_instance_id / session_id / elapsed_seconds；指纹缺省时用SQL文本代替
+    """
+    tracker = tracker or _tracker
+    for record in records:
+        fingerprint = record.get('sql_fingerprint') or (record.get('sql_text') or '')[:200]
+        key = (record.get('db_instance_id'), str(record.get('session_id') or ''), fingerprint)
+        _set_delta(record, tracker.running(key, record.get('elapsed_seconds'),
+                                           record.get('rows_examined'), record.get('detect_time')))
+    return records
+
+
+def annotate_cumulative_deltas(records: List[Dict], counter_key: Callable[[Dict], tuple],
+                               totals: Callable[[Dict], Totals],
+                               started_field: Optional[str] = None, seen_field: Optional[str] = None,
+                               watermark_key: Optional[tuple] = None, baseline_on_first: bool = True,
+                               tracker: Optional[WorkloadDeltaTracker] = None) -> List[Dict]:
+    """
+    为累计计数器记录计算增量(原地写入 delta_* 字段)
+
+    Args:
+        records: 同一数据源一轮采集到的记录
+        counter_key: 记录 -> 计数器键(需包含实例ID)
+        totals: 记录 -> (累计次数, 累计耗时, 累计扫描行数)
+        started_field: 计数器开始累计时间的字段(如 first_seen)
+        seen_field: 最近活跃时间的字段(如 last_seen)，用于推进水位
+        watermark_key: 水位键，通常为 (数据源, 实例ID[, 库名])
+        baseline_on_first: 见 WorkloadDeltaTracker.cumulative
+    """
+    tracker = tracker or _tracker
+    watermark = tracker.watermark(watermark_key) if watermark_key and started_field else None
+    latest = None
+    for record in records:
+        started_at = record.get(started_field) if started_field else None
+        _set_delta(record, tracker.cumulative(counter_key(record), totals(record), started_at, watermark,
+                                                   baseline_on_first))
+        seen = record.get(seen_field) if seen_field else None
+        if isinstance(seen, datetime) and (latest is None or seen > latest):
+            latest = seen
+    if watermark_key:
+        tracker.advance_watermark(watermark_key, latest)
+    return records
+
+
+def record_delta(record: Dict, elapsed_keys: Sequence[str] = ('avg_elapsed_seconds', 'elapsed_seconds')) -> Totals:
+    """
+    读取记录的本周期增量 (次数, 耗时, 扫描行数)
+
+    未经 annotate_* 处理的记录按记录本身计: execution_count(缺省1)次、每次平均耗时
+    """
+    if 'delta_executions' in record:
+        return (record.get('delta_executions') or 0, record.get('delta_elapsed_seconds') or 0.0,
+                record.get('delta_rows_examined') or 0)
+    executions = int(record.get('execution_count') or 1)
+    elapsed = next((record[k] for k in elapsed_keys if record.get(k) is not None), 0)
+    return executions, float(elapsed or 0) * executions, int(record.get('rows_examined') or 0)
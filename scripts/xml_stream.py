@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式XML字段抽取
+
+死锁图(xml_deadlock_report)和执行计划(Showplan XML)可能达到数MB，用 ET.fromstring
+构建完整DOM既慢又占内存。这里用 XMLPullParser(iterparse的增量版本)分块喂入文本，
+只抽取监控库实际保存的字段，元素处理完立即 clear 并从父节点摘除，内存占用与文档大小无关。
+
+批量抽取时文档总量超过阈值会提交到进程池(spawn方式，避免与采集线程的fork冲突)，
+进程池不可用时自动退回串行。
+"""
+
+import os
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 每次喂给解析器的字符数
+CHUNK_SIZE = 64 * 1024
+
+# 批量文档总字符数超过该值时使用进程池
+PROCESS_POOL_MIN_CHARS = 8 * 1024 * 1024
+
+# 进程池最大进程数
+PROCESS_POOL_MAX_WORKERS = 4
+
+# 每个执行计划最多保留的警告/缺失索引条数
+MAX_PLAN_WARNINGS = 50
+MAX_MISSING_INDEXES = 20
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _local_name(tag: str) -> str:
+    """去掉命名空间前缀"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _iter_events(document: Union[str, bytes]):
+    """
+    分块解析文档，产出 (事件, 元素, 父元素)
+
+    end事件处理完后由本函数清空元素并从父节点摘除
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    stack = []
+
+    for offset in range(0, len(document), CHUNK_SIZE):
+        parser.feed(document[offset:offset + CHUNK_SIZE])
+        for event, elem in parser.read_events():
+            if event == 'start':
+                yield event, elem, stack[-1] if stack else None
+                stack.append(elem)
+            else:
+                stack.pop()
+                parent = stack[-1] if stack else None
+                yield event, elem, parent
+                elem.clear()
+                if parent is not None:
+                    parent.remove(elem)
+    parser.close()
+
+
+def _empty_deadlock_info() -> Dict:
+    return {
+        'victim_spid': None,
+        'process_count': 0,
+        'resource_list': [],
+        'process_list': []
+    }
+
+
+def extract_deadlock_graph(deadlock_xml: Union[str, bytes]) -> Dict:
+    """
+    从死锁图XML中抽取受害者、进程和资源
+
+    Returns:
+        {'victim_spid', 'process_count', 'process_list', 'resource_list'}
+    """
+    info = _empty_deadlock_info()
+    if not deadlock_xml:
+        return info
+
+    current_process = None
+    try:
+        for event, elem, parent in _iter_events(deadlock_xml):
+            tag = elem.tag
+            parent_tag = parent.tag if parent is not None else None
+
+            if event == 'start':
+                if tag == 'victimProcess' and info['victim_spid'] is None:
+                    info['victim_spid'] = elem.get('id', 'unknown')
+                elif tag == 'process' and parent_tag == 'process-list':
+                    current_process = {
+                        'spid': elem.get('id'),
+                        'hostname': elem.get('hostname'),
+                        'loginname': elem.get('loginname'),
+                        'isolationlevel': elem.get('isolationlevel'),
+                        'status': elem.get('status'),
+                        'lock_mode': elem.get('lockMode'),
+                        'sql_text': ''
+                    }
+                    info['process_list'].append(current_process)
+                    info['process_count'] += 1
+                elif parent_tag == 'resource-list':
+                    info['resource_list'].append({
+                        'resource_type': tag,
+                        'database_name': elem.get('dbname', 'unknown'),
+                        'object_name': elem.get('objectname', ''),
+                        'index_name': elem.get('indexname', ''),
+                        'mode': elem.get('mode', '')
+                    })
+            else:
+                if tag == 'inputbuf' and current_process is not None and elem.text and not current_process['sql_text']:
+                    current_process['sql_text'] = elem.text.strip()
+                elif tag == 'process' and parent_tag == 'process-list':
+                    current_process = None
+
+        return info
+
+    except ET.ParseError as e:
+        logger.error(f"死锁图XML解析失败: {e}")
+        return _empty_deadlock_info()
+
+
+def extract_query_plan(query_plan_xml: Union[str, bytes]) -> Dict:
+    """
+    从Showplan XML中抽取成本、索引使用、扫描、缺失索引、警告和计划哈希
+
+    计划哈希只由算子树决定: 每个RelOp的 (深度, PhysicalOp) 以及扫描/查找的
+    表和索引，按文档顺序拼接后做MD5；成本、行数估计等数值不参与。
+
+    Returns:
+        {'cost', 'estimated_rows', 'indexes_used', 'has_scan', 'missing_indexes', 'warnings',
+         'plan_hash', 'plan'}
+        解析失败返回空字典
+    """
+    if not query_plan_xml:
+        return {}
+
+    cost = None
+    estimated_rows = None
+    indexes = []
+    has_scan = False
+    missing_indexes = []
+    warnings = []
+
+    in_index_scan = False
+    in_warnings = 0
+    missing_group_impact = None
+    current_missing = None
+    column_usage = None
+    relop_depth = 0
+    operator_tokens = []
+
+    try:
+        for event, elem, parent in _iter_events(query_plan_xml):
+            tag = _local_name(elem.tag)
+
+            if event == 'end':
+                if tag == 'RelOp':
+                    relop_depth -= 1
+                elif tag == 'IndexScan':
+                    in_index_scan = False
+                elif tag == 'Warnings':
+                    in_warnings -= 1
+                elif tag == 'MissingIndex':
+                    current_missing = None
+                elif tag == 'ColumnGroup':
+                    column_usage = None
+                continue
+
+            if tag == 'StmtSimple' and cost is None and elem.get('StatementSubTreeCost') is not None:
+                cost = float(elem.get('StatementSubTreeCost', 0))
+                estimated_rows = int(float(elem.get('StatementEstRows', 0)))
+            elif tag == 'RelOp':
+                physical_op = elem.get('PhysicalOp', '')
+                if 'Scan' in physical_op:
+                    has_scan = True
+                operator_tokens.append(f"{relop_depth}:{physical_op}")
+                relop_depth += 1
+            elif tag == 'TableScan':
+                has_scan = True
+            elif tag == 'IndexScan':
+                in_index_scan = True
+            elif tag == 'Object' and parent is not None and _local_name(parent.tag) in ('IndexScan', 'TableScan'):
+                operator_tokens.append(f"@{elem.get('Schema', '')}.{elem.get('Table', '')}.{elem.get('Index', '')}")
+                index_name = elem.get('Index', '')
+                if in_index_scan and index_name and index_name not in indexes:
+                    indexes.append(index_name)
+            elif tag == 'Warnings':
+                in_warnings += 1
+            elif in_warnings and parent is not None and _local_name(parent.tag) == 'Warnings':
+                warning = {'type': tag}
+                warning.update(elem.attrib)
+                if warning not in warnings and len(warnings) < MAX_PLAN_WARNINGS:
+                    warnings.append(warning)
+            elif tag == 'MissingIndexGroup':
+                missing_group_impact = float(elem.get('Impact', 0))
+            elif tag == 'MissingIndex' and len(missing_indexes) < MAX_MISSING_INDEXES:
+                current_missing = {
+                    'impact': missing_group_impact,
+                    'database': elem.get('Database', '').strip('[]'),
+                    'schema': elem.get('Schema', '').strip('[]'),
+                    'table': elem.get('Table', '').strip('[]'),
+                    'equality': [],
+                    'inequality': [],
+                    'include': []
+                }
+                missing_indexes.append(current_missing)
+            elif tag == 'ColumnGroup' and current_missing is not None:
+                column_usage = elem.get('Usage', '').lower()
+            elif tag == 'Column' and current_missing is not None and column_usage in current_missing:
+                current_missing[column_usage].append(elem.get('Name', '').strip('[]'))
+
+    except ET.ParseError as e:
+        logger.debug(f"解析执行计划失败: {e}")
+        return {}
+
+    cost = cost or 0
+    estimated_rows = estimated_rows or 0
+    return {
+        'cost': cost,
+        'estimated_rows': estimated_rows,
+        'indexes_used': ','.join(indexes) if indexes else 'NONE',
+        'has_scan': has_scan,
+        'missing_indexes': missing_indexes,
+        'warnings': warnings,
+        'plan_hash': hashlib.md5('\n'.join(operator_tokens).encode('utf-8')).hexdigest() if operator_tokens else None,
+        'plan': {
+            'cost': cost,
+            'rows': estimated_rows,
+            'missing_indexes': missing_indexes,
+            'warnings': warnings
+        }
+    }
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """懒加载进程池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = min(PROCESS_POOL_MAX_WORKERS, os.cpu_count() or 1)
+                if workers < 2:
+                    return None
+                _pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+                atexit.register(_pool.shutdown, wait=False)
+    return _pool
+
+
+def _extract_many(func: Callable, documents: List, min_chars: int) -> List:
+    """批量抽取，文档总量足够大时走进程池"""
+    total_chars = sum(len(doc) for doc in documents if doc)
+    if len(documents) > 1 and total_chars >= min_chars:
+        try:
+            pool = _get_pool()
+            if pool is not None:
+                chunksize = max(1, len(documents) // (PROCESS_POOL_MAX_WORKERS * 4))
+                return list(pool.map(func, documents, chunksize=chunksize))
+        except Exception as e:
+            logger.warning(f"进程池解析XML失败，改为串行: {e}")
+    return [func(doc) for doc in documents]
+
+
+def extract_deadlock_graphs(documents: List[Union[str, bytes]],
+                            min_chars: int = PROCESS_POOL_MIN_CHARS) -> List[Dict]:
+    """批量抽取死锁图"""
+    return _extract_many(extract_deadlock_graph, documents, min_chars)
+
+
+def extract_query_plans(documents: List[Union[str, bytes, None]],
+                        min_chars: int = PROCESS_POOL_MIN_CHARS) -> List[Dict]:
+    """批量抽取执行计划"""
+    return _extract_many(extract_query_plan, documents, min_chars)
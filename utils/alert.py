@@ -2,39 +2,107 @@
 # -*- coding: utf-8 -*-
 """
 告警模块 - 支持企业微信、钉钉、邮件等多种告警方式
+
+异步投递: AlertManager(config, async_dispatch=True) 时告警进入进程内的投递队列后立即返回，
+每个通道一个有界队列和一个工作线程，失败按指数退避重试，慢的Webhook或SMTP不会拖慢采集。
+
+限流与汇总: 企业微信/钉钉机器人每分钟约20条，超出会被限流。每个Webhook通道有令牌桶，
+发送前先取令牌；配置 digest 后慢SQL告警按时间窗口汇总成一条消息(按实例+SQL指纹分组)，
+告警风暴期间发出的消息数保持恒定。
 """
 
 import os
 import json
+import time
+import queue
+import atexit
+import smtplib
 import logging
+import threading
 import requests
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 每个通道的投递队列长度，满了之后新告警被丢弃(并记录日志)
+DEFAULT_QUEUE_SIZE = 1000
+# 投递失败后的重试次数和退避(秒): 2, 4, 8 ... 最多 MAX_BACKOFF_SECONDS
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 60
+# Webhook机器人默认限速(条/分钟)
+DEFAULT_WEBHOOK_RATE_PER_MINUTE = 20
+# 同步发送时等待令牌的最长时间(秒)，异步投递线程无限等待
+SYNC_TOKEN_TIMEOUT = 30
+# 慢SQL汇总的默认窗口(秒)和消息中列出的分组数
+DEFAULT_DIGEST_WINDOW_SECONDS = 60
+DEFAULT_DIGEST_TOP_N = 10
+
+
+class TokenBucket:
+    """令牌桶限流: 每分钟补充 rate_per_minute 个令牌，最多积攒 burst 个"""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        # 默认只允许积攒1/4分钟的量，避免空闲后一次性打满平台的分钟配额
+        self.capacity = float(burst if burst is not None else max(1, int(rate_per_minute // 4)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """取一个令牌，没有时等待；timeout 秒内取不到返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
 
 class AlertChannel:
     """告警渠道基类"""
 
+    # 发送限流，None 表示不限
+    rate_limiter: Optional[TokenBucket] = None
+
     def send(self, title: str, content: str, level: str = 'INFO') -> bool:
         """发送告警"""
         raise NotImplementedError
 
+    def deliver(self, title: str, content: str, level: str = 'INFO', token_timeout: Optional[float] = None) -> bool:
+        """先取限流令牌再发送，token_timeout 内取不到令牌视为发送失败"""
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(token_timeout):
+            logger.warning(f"{type(self).__name__} 发送限流，放弃告警: {title}")
+            return False
+        return self.send(title, content, level)
+
 
 class WeComAlert(AlertChannel):
     """企业微信机器人告警"""
 
-    def __init__(self, webhook_url: str):
+    def __init__(self, webhook_url: str, rate_limit_per_minute: float = DEFAULT_WEBHOOK_RATE_PER_MINUTE):
         """
         初始化企业微信告警
 
         Args:
             webhook_url: 企业微信机器人Webhook地址
                         格式: https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=xxxxxxxx
+            rate_limit_per_minute: 每分钟最多发送条数(机器人限制约20条/分钟)
         """
         self.webhook_url = webhook_url
         self.enabled = bool(webhook_url)
+        # keep-alive 连接复用
+        self.session = requests.Session()
+        self.rate_limiter = TokenBucket(rate_limit_per_minute) if rate_limit_per_minute else None
 
     def send(self, title: str, content: str, level: str = 'INFO') -> bool:
         """
@@ -74,7 +142,7 @@ class WeComAlert(AlertChannel):
                 }
             }
 
-            response = requests.post(
+            response = self.session.post(
                 self.webhook_url,
                 json=payload,
                 timeout=5
@@ -99,9 +167,23 @@ class WeComAlert(AlertChannel):
         Args:
             deadlock_info: 死锁信息
         """
-        title = "🔴 数据库死锁告警"
+        return self.send(*format_deadlock_alert(deadlock_info))
 
-        content = f"""
+    def send_slow_sql_alert(self, slow_sql_info: Dict) -> bool:
+        """
+        发送慢SQL告警
+
+        Args:
+            slow_sql_info: 慢SQL信息
+        """
+        return self.send(*format_slow_sql_alert(slow_sql_info))
+
+
+def format_deadlock_alert(deadlock_info: Dict) -> Tuple[str, str, str]:
+    """死锁告警的Markdown消息，返回 (标题, 内容, 级别)"""
+    title = "🔴 数据库死锁告警"
+
+    content = f"""
 **数据库实例:** {deadlock_info.get('instance_name', 'Unknown')}
 **实例地址:** {deadlock_info.get('db_ip')}:{deadlock_info.get('db_port')}
 **数据库类型:** {deadlock_info.get('db_type', 'MySQL')}
@@ -128,20 +210,16 @@ class WeComAlert(AlertChannel):
 3. 调整应用程序访问顺序
 """
 
-        return self.send(title, content, level='CRITICAL')
+    return title, content, 'CRITICAL'
 
-    def send_slow_sql_alert(self, slow_sql_info: Dict) -> bool:
-        """
-        发送慢SQL告警
 
-        Args:
-            slow_sql_info: 慢SQL信息
-        """
-        title = "⚠️ 慢SQL告警"
+def format_slow_sql_alert(slow_sql_info: Dict) -> Tuple[str, str, str]:
+    """慢SQL告警的Markdown消息，返回 (标题, 内容, 级别)"""
+    title = "⚠️ 慢SQL告警"
 
-        elapsed_minutes = slow_sql_info.get('elapsed_minutes', 0)
+    elapsed_minutes = slow_sql_info.get('elapsed_minutes', 0)
 
-        content = f"""
+    content = f"""
 **数据库实例:** {slow_sql_info.get('instance_name', 'Unknown')}
 **实例地址:** {slow_sql_info.get('db_ip')}:{slow_sql_info.get('db_port')}
 **执行时长:** {elapsed_minutes:.2f} 分钟
@@ -159,31 +237,35 @@ class WeComAlert(AlertChannel):
 **返回行数:** {slow_sql_info.get('rows_sent', 'N/A')}
 """
 
-        # 根据执行时长判断级别
-        if elapsed_minutes > 10:
-            level = 'CRITICAL'
-        elif elapsed_minutes > 5:
-            level = 'ERROR'
-        else:
-            level = 'WARNING'
+    # 根据执行时长判断级别
+    if elapsed_minutes > 10:
+        level = 'CRITICAL'
+    elif elapsed_minutes > 5:
+        level = 'ERROR'
+    else:
+        level = 'WARNING'
 
-        return self.send(title, content, level=level)
+    return title, content, level
 
 
 class DingTalkAlert(AlertChannel):
     """钉钉机器人告警"""
 
-    def __init__(self, webhook_url: str, secret: Optional[str] = None):
+    def __init__(self, webhook_url: str, secret: Optional[str] = None,
+                 rate_limit_per_minute: float = DEFAULT_WEBHOOK_RATE_PER_MINUTE):
         """
         初始化钉钉告警
 
         Args:
             webhook_url: 钉钉机器人Webhook地址
             secret: 加签密钥（可选）
+            rate_limit_per_minute: 每分钟最多发送条数(机器人限制20条/分钟)
         """
         self.webhook_url = webhook_url
         self.secret = secret
         self.enabled = bool(webhook_url)
+        self.session = requests.Session()
+        self.rate_limiter = TokenBucket(rate_limit_per_minute) if rate_limit_per_minute else None
 
     def _sign(self, timestamp: int) -> str:
         """生成签名"""
@@ -225,7 +307,7 @@ class DingTalkAlert(AlertChannel):
                 }
             }
 
-            response = requests.post(url, json=payload, timeout=5)
+            response = self.session.post(url, json=payload, timeout=5)
             result = response.json()
 
             if result.get('errcode') == 0:
@@ -260,6 +342,39 @@ class EmailAlert(AlertChannel):
         """
         self.smtp_config = smtp_config
         self.enabled = bool(smtp_config and smtp_config.get('host'))
+        # 复用已登录的SMTP连接，服务端断开后下次发送时重连
+        self._server: Optional[smtplib.SMTP] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.smtp_config['port'] == 465:
+            server = smtplib.SMTP_SSL(self.smtp_config['host'], self.smtp_config['port'], timeout=10)
+        else:
+            server = smtplib.SMTP(self.smtp_config['host'], self.smtp_config['port'], timeout=10)
+            server.starttls()
+        server.login(self.smtp_config['user'], self.smtp_config['password'])
+        return server
+
+    def _connection(self) -> smtplib.SMTP:
+        """返回可用的SMTP连接(NOOP探活，失效则重新登录)"""
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        self._server = self._connect()
+        return self._server
+
+    def close(self):
+        """关闭SMTP连接"""
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
 
     def send(self, title: str, content: str, level: str = 'INFO') -> bool:
         """发送邮件告警"""
@@ -267,7 +382,6 @@ class EmailAlert(AlertChannel):
             return False
 
         try:
-            import smtplib
             from email.mime.text import MIMEText
             from email.mime.multipart import MIMEMultipart
 
@@ -290,28 +404,230 @@ class EmailAlert(AlertChannel):
 
             msg.attach(MIMEText(html_content, 'html'))
 
-            if self.smtp_config['port'] == 465:
-                server = smtplib.SMTP_SSL(self.smtp_config['host'], self.smtp_config['port'])
-            else:
-                server = smtplib.SMTP(self.smtp_config['host'], self.smtp_config['port'])
-                server.starttls()
-
-            server.login(self.smtp_config['user'], self.smtp_config['password'])
-            server.send_message(msg)
-            server.quit()
+            with self._lock:
+                try:
+                    self._connection().send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # 连接在NOOP之后被服务端关闭，重连后再发一次
+                    self.close()
+                    self._connection().send_message(msg)
 
             logger.info(f"邮件告警发送成功: {title}")
             return True
 
         except Exception as e:
+            with self._lock:
+                self.close()
             logger.error(f"邮件告警发送异常: {e}")
             return False
 
 
+class _ChannelWorker(threading.Thread):
+    """单个告警通道的投递线程: 有界队列 + 失败指数退避重试"""
+
+    def __init__(self, channel: AlertChannel, queue_size: int, max_retries: int, backoff: float):
+        super().__init__(name=f"alert-{type(channel).__name__}", daemon=True)
+        self.channel = channel
+        self.queue: 'queue.Queue[Tuple[str, str, str]]' = queue.Queue(maxsize=queue_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def submit(self, title: str, content: str, level: str) -> bool:
+        try:
+            self.queue.put_nowait((title, content, level))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"{type(self.channel).__name__} 告警队列已满，丢弃告警: {title}")
+            return False
+
+    def run(self):
+        while True:
+            title, content, level = self.queue.get()
+            try:
+                self._deliver(title, content, level)
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, title: str, content: str, level: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.channel.deliver(title, content, level):
+                    self.sent += 1
+                    return
+            except Exception as e:
+                logger.error(f"告警通道发送失败: {e}")
+            if attempt < self.max_retries:
+                time.sleep(min(self.backoff * (2 ** attempt), MAX_BACKOFF_SECONDS))
+        self.failed += 1
+        logger.error(f"{type(self.channel).__name__} 告警重试 {self.max_retries} 次后仍失败，放弃: {title}")
+
+
+class AlertDispatcher:
+    """
+    异步告警投递
+
+    每个通道一个工作线程，互不阻塞: 企业微信Webhook超时不影响邮件，
+    提交方只做一次入队。
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF_SECONDS):
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._workers: Dict[int, _ChannelWorker] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, channel: AlertChannel, title: str, content: str, level: str = 'INFO') -> bool:
+        """提交一条告警，返回是否进入队列"""
+        worker = self._workers.get(id(channel))
+        if worker is None:
+            with self._lock:
+                worker = self._workers.get(id(channel))
+                if worker is None:
+                    worker = _ChannelWorker(channel, self.queue_size, self.max_retries, self.backoff)
+                    worker.start()
+                    self._workers[id(channel)] = worker
+        return worker.submit(title, content, level)
+
+    def flush(self, timeout: float = 30) -> bool:
+        """等待队列中的告警投递完(进程退出前调用)，超时返回False"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if all(worker.queue.unfinished_tasks == 0 for worker in list(self._workers.values())):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def stats(self) -> List[Dict]:
+        return [{
+            'channel': type(worker.channel).__name__,
+            'queued': worker.queue.qsize(),
+            'sent': worker.sent,
+            'failed': worker.failed,
+            'dropped': worker.dropped
+        } for worker in list(self._workers.values())]
+
+
+_dispatcher: Optional[AlertDispatcher] = None
+_dispatcher_lock = threading.Lock()
+# 相同配置的通道在进程内共用(连接复用，且同一通道只有一个投递线程)
+_channel_cache: Dict[Tuple, AlertChannel] = {}
+
+
+def get_alert_dispatcher() -> AlertDispatcher:
+    """进程内共享的异步投递器，退出时最多等待30秒把队列发完"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher()
+                atexit.register(_dispatcher.flush)
+    return _dispatcher
+
+
+def _shared_channel(key: Tuple, factory) -> AlertChannel:
+    with _dispatcher_lock:
+        channel = _channel_cache.get(key)
+        if channel is None:
+            channel = factory()
+            _channel_cache[key] = channel
+        return channel
+
+
+class SlowSQLDigest:
+    """
+    慢SQL告警窗口汇总
+
+    窗口内的告警按 (实例, SQL指纹) 分组计数，窗口结束时回调 emit 发出一条汇总；
+    窗口内只有一条告警时原样发出，不做汇总。窗口由第一条告警开启(threading.Timer)，
+    没有告警时不占用线程。
+    """
+
+    def __init__(self, emit_single, emit_digest, window_seconds: float = DEFAULT_DIGEST_WINDOW_SECONDS,
+                 top_n: int = DEFAULT_DIGEST_TOP_N):
+        self.emit_single = emit_single
+        self.emit_digest = emit_digest
+        self.window_seconds = window_seconds
+        self.top_n = top_n
+        self._groups: Dict[Tuple[str, str], Dict] = {}
+        self._total = 0
+        self._first: Optional[Dict] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def add(self, slow_sql_info: Dict):
+        key = (str(slow_sql_info.get('instance_name') or slow_sql_info.get('db_ip')),
+               str(slow_sql_info.get('sql_fingerprint') or (slow_sql_info.get('sql_text') or '')[:100]))
+        elapsed = slow_sql_info.get('elapsed_minutes') or 0
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {'instance': key[0], 'fingerprint': key[1], 'count': 0,
+                                             'max_elapsed': 0, 'sql_text': slow_sql_info.get('sql_text') or ''}
+            group['count'] += 1
+            group['max_elapsed'] = max(group['max_elapsed'], elapsed)
+            self._total += 1
+            if self._first is None:
+                self._first = slow_sql_info
+            if self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """结束当前窗口并发出汇总(进程退出前也应调用)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            groups, total, first = list(self._groups.values()), self._total, self._first
+            self._groups, self._total, self._first = {}, 0, None
+        if not total:
+            return
+        try:
+            if total == 1:
+                self.emit_single(first)
+            else:
+                self.emit_digest(*self.render(groups, total))
+        except Exception as e:
+            logger.error(f"慢SQL汇总告警发送失败: {e}")
+
+    def render(self, groups: List[Dict], total: int) -> Tuple[str, str, str]:
+        """汇总消息，返回 (标题, 内容, 级别)"""
+        per_instance: Dict[str, int] = {}
+        for group in groups:
+            per_instance[group['instance']] = per_instance.get(group['instance'], 0) + group['count']
+        top = sorted(groups, key=lambda g: (g['count'], g['max_elapsed']), reverse=True)[:self.top_n]
+        max_elapsed = max(g['max_elapsed'] for g in groups)
+
+        lines = [
+            f"**汇总窗口:** 最近 {self.window_seconds:g} 秒",
+            f"**告警总数:** {total} 条，涉及 {len(per_instance)} 个实例 / {len(groups)} 个SQL",
+            f"**最长执行:** {max_elapsed:.2f} 分钟",
+            "",
+            "**按实例:** " + "，".join(f"{name} {count}条" for name, count in
+                                      sorted(per_instance.items(), key=lambda item: -item[1])),
+            "",
+            f"**Top {len(top)}:**",
+        ]
+        for i, group in enumerate(top, 1):
+            sql_preview = ' '.join(group['sql_text'].split())[:120]
+            lines.append(f"{i}. {group['instance']} | {group['count']}次 | 最长 {group['max_elapsed']:.2f} 分钟")
+            lines.append(f"   `{sql_preview}`")
+
+        level = 'CRITICAL' if max_elapsed > 10 else ('ERROR' if max_elapsed > 5 else 'WARNING')
+        return f"⚠️ 慢SQL告警汇总 ({total}条)", "\n".join(lines), level
+
+
 class AlertManager:
     """告警管理器 - 支持多通道"""
 
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, async_dispatch: bool = False):
         """
         初始化告警管理器
 
@@ -320,25 +636,69 @@ class AlertManager:
                 {
                     'wecom': {'webhook': 'https://...'},
                     'dingtalk': {'webhook': 'https://...', 'secret': '...'},
-                    'email': {...}
+                    'email': {...},
+                    'digest': {'enabled': true, 'window_seconds': 60, 'top_n': 10}
                 }
+                wecom/dingtalk 可选 rate_limit_per_minute(默认20，0为不限)
+            async_dispatch: True 时各 send_* 方法只把告警放入投递队列后立即返回，
+                            返回值表示是否已入队(供采集器使用)
         """
         self.channels: List[AlertChannel] = []
+        self.dispatcher = get_alert_dispatcher() if async_dispatch else None
 
         # 企业微信
         if config.get('wecom', {}).get('webhook'):
-            self.channels.append(WeComAlert(config['wecom']['webhook']))
+            webhook = config['wecom']['webhook']
+            rate = config['wecom'].get('rate_limit_per_minute', DEFAULT_WEBHOOK_RATE_PER_MINUTE)
+            self.channels.append(_shared_channel(('wecom', webhook, rate), lambda: WeComAlert(webhook, rate)))
 
         # 钉钉
         if config.get('dingtalk', {}).get('webhook'):
-            self.channels.append(DingTalkAlert(
-                config['dingtalk']['webhook'],
-                config['dingtalk'].get('secret')
-            ))
+            webhook, secret = config['dingtalk']['webhook'], config['dingtalk'].get('secret')
+            rate = config['dingtalk'].get('rate_limit_per_minute', DEFAULT_WEBHOOK_RATE_PER_MINUTE)
+            self.channels.append(_shared_channel(('dingtalk', webhook, secret, rate),
+                                                 lambda: DingTalkAlert(webhook, secret, rate)))
 
         # 邮件
         if config.get('email', {}).get('host'):
-            self.channels.append(EmailAlert(config['email']))
+            email_config = config['email']
+            key = ('email', json.dumps(email_config, sort_keys=True, default=str))
+            self.channels.append(_shared_channel(key, lambda: EmailAlert(email_config)))
+
+        # 慢SQL窗口汇总
+        digest_config = config.get('digest', {})
+        self.digest: Optional[SlowSQLDigest] = None
+        if digest_config.get('enabled', False):
+            self.digest = SlowSQLDigest(
+                self._send_slow_sql_now,
+                lambda title, content, level: self.send_alert(title, content, level),
+                window_seconds=digest_config.get('window_seconds', DEFAULT_DIGEST_WINDOW_SECONDS),
+                top_n=digest_config.get('top_n', DEFAULT_DIGEST_TOP_N)
+            )
+            # 未结束的窗口只挂在daemon Timer上，退出时先发出汇总
+            # (atexit后注册先执行，汇总会在投递器flush之前入队)
+            atexit.register(self.digest.flush)
+
+    def _deliver(self, messages: List[Tuple[AlertChannel, str, str, str]], kind: str = '告警') -> bool:
+        """同步发送或提交到投递队列，任一通道成功(入队)即返回True"""
+        success = False
+        for channel, title, content, level in messages:
+            try:
+                if self.dispatcher is not None:
+                    accepted = self.dispatcher.submit(channel, title, content, level)
+                else:
+                    accepted = channel.deliver(title, content, level, token_timeout=SYNC_TOKEN_TIMEOUT)
+                if accepted:
+                    success = True
+            except Exception as e:
+                logger.error(f"{kind}发送失败: {e}")
+        return success
+
+    def flush(self, timeout: float = 30) -> bool:
+        """发出未结束窗口的汇总；异步模式下再等待队列投递完"""
+        if self.digest is not None:
+            self.digest.flush()
+        return self.dispatcher.flush(timeout) if self.dispatcher is not None else True
 
     def send_alert(self, title: str, content: str, level: str = 'INFO') -> bool:
         """发送告警到所有配置的通道"""
@@ -346,34 +706,21 @@ class AlertManager:
             logger.warning("没有配置告警通道")
             return False
 
-        success = False
-        for channel in self.channels:
-            try:
-                if channel.send(title, content, level):
-                    success = True
-            except Exception as e:
-                logger.error(f"告警通道发送失败: {e}")
-
-        return success
+        return self._deliver([(channel, title, content, level) for channel in self.channels], '告警通道')
 
     def send_deadlock_alert(self, deadlock_info: Dict) -> bool:
         """发送死锁告警"""
-        success = False
+        messages = []
         for channel in self.channels:
-            try:
-                if isinstance(channel, (WeComAlert, DingTalkAlert)):
-                    if channel.send_deadlock_alert(deadlock_info):
-                        success = True
-                else:
-                    # 其他通道使用通用格式
-                    title = f"数据库死锁告警 - {deadlock_info.get('instance_name')}"
-                    content = json.dumps(deadlock_info, indent=2, ensure_ascii=False)
-                    if channel.send(title, content, 'CRITICAL'):
-                        success = True
-            except Exception as e:
-                logger.error(f"死锁告警发送失败: {e}")
+            if isinstance(channel, (WeComAlert, DingTalkAlert)):
+                messages.append((channel, *format_deadlock_alert(deadlock_info)))
+            else:
+                # 其他通道使用通用格式
+                title = f"数据库死锁告警 - {deadlock_info.get('instance_name')}"
+                content = json.dumps(deadlock_info, indent=2, ensure_ascii=False, default=str)
+                messages.append((channel, title, content, 'CRITICAL'))
 
-        return success
+        return self._deliver(messages, '死锁告警')
 
     def send_slow_sql_alert(self, slow_sql_info: Dict, threshold_minutes: float = 10) -> bool:
         """
@@ -389,22 +736,52 @@ class AlertManager:
         if elapsed_minutes < threshold_minutes:
             return False
 
-        success = False
+        if self.digest is not None:
+            # 进入当前汇总窗口，窗口结束时统一发送
+            self.digest.add(slow_sql_info)
+            return True
+        return self._send_slow_sql_now(slow_sql_info)
+
+    def _send_slow_sql_now(self, slow_sql_info: Dict) -> bool:
+        elapsed_minutes = slow_sql_info.get('elapsed_minutes', 0)
+        messages = []
         for channel in self.channels:
-            try:
-                if isinstance(channel, (WeComAlert, DingTalkAlert)):
-                    if channel.send_slow_sql_alert(slow_sql_info):
-                        success = True
-                else:
-                    title = f"慢SQL告警 - {slow_sql_info.get('instance_name')}"
-                    content = json.dumps(slow_sql_info, indent=2, ensure_ascii=False)
-                    level = 'CRITICAL' if elapsed_minutes > 30 else 'WARNING'
-                    if channel.send(title, content, level):
-                        success = True
-            except Exception as e:
-                logger.error(f"慢SQL告警发送失败: {e}")
+            if isinstance(channel, (WeComAlert, DingTalkAlert)):
+                messages.append((channel, *format_slow_sql_alert(slow_sql_info)))
+            else:
+                title = f"慢SQL告警 - {slow_sql_info.get('instance_name')}"
+                content = json.dumps(slow_sql_info, indent=2, ensure_ascii=False, default=str)
+                level = 'CRITICAL' if elapsed_minutes > 30 else 'WARNING'
+                messages.append((channel, title, content, level))
 
-        return success
+        return self._deliver(messages, '慢SQL告警')
+
+    def send_plan_regression_alert(self, regression_info: Dict) -> bool:
+        """
+        发送执行计划回归告警
+
+        Args:
+            regression_info: 回归信息(plan_regression.record_plan_samples 的返回项)
+        """
+        title = f"⚠️ 执行计划回归 - {regression_info.get('instance_name')}"
+        content = f"""
+**数据库实例:** {regression_info.get('instance_name', 'Unknown')}
+**SQL指纹:** {regression_info.get('sql_fingerprint')}
+**计划变化:** {regression_info.get('old_plan_hash')} → {regression_info.get('new_plan_hash')}
+**平均耗时:** {regression_info.get('old_avg_elapsed', 0):.3f}秒 → {regression_info.get('new_avg_elapsed', 0):.3f}秒 ({regression_info.get('slowdown_ratio')}倍)
+**样本执行次数:** 旧计划 {regression_info.get('old_executions')} / 新计划 {regression_info.get('new_executions')}
+
+**SQL语句:**
+```sql
+{(regression_info.get('sample_sql') or 'N/A')[:500]}
+```
+
+**处理建议:**
+1. 检查统计信息是否过期，必要时更新统计信息
+2. 对比新旧执行计划的访问方式和索引选择
+3. 必要时固定执行计划(SQL Server Query Store强制计划 / MySQL优化器提示)
+"""
+        return self.send_alert(title, content, level='WARNING')
 
 
 def load_alert_config(config_file: str = 'alert_config.json') -> Dict: